@@ -0,0 +1,119 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+
+from metrics import ADMISSION_QUEUE_DEPTH, ADMISSION_REJECTED, ADMISSION_WAIT_SECONDS
+
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "1") == "1"  # 0 admits every request, as before
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "256"))  # requests waiting per stage before 429s
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "10"))  # seconds a request may wait before a 503
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", os.getenv("LLM_POOL_SIZE", "20")))  # LLM calls in flight
+# Lower lanes are served first: interactive (UI) traffic goes ahead of batch jobs
+PRIORITIES = {"interactive": 0, "batch": 1}
+SERVICE_TIME_DECAY = 0.9  # weight of the past in the moving average of slot hold times
+
+
+class Overloaded(Exception):
+    """A stage turned a request away; answer ``status_code`` with a ``Retry-After`` header."""
+
+    def __init__(self, stage: str, status_code: int, retry_after: int):
+        reason = "queue full" if status_code == 429 else "waited too long"
+        super().__init__(f"Server busy ({stage} {reason}); retry after {retry_after}s.")
+        self.stage = stage
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class StageLimiter:
+    """At most ``concurrency`` requests in a stage; up to ``max_queue`` more wait, best priority first.
+
+    A request that finds the queue full is rejected at once (429). A request that waits longer
+    than ``max_wait`` is rejected too (503), so requests are turned away before they could time
+    out instead of all timing out together. Both carry a retry delay estimated from the queue
+    length and recent slot hold times. Belongs to one event loop, which makes locking unneeded.
+    """
+
+    def __init__(self, stage: str, concurrency: int, max_queue: int = ADMISSION_QUEUE_SIZE,
+                 max_wait: float = ADMISSION_MAX_WAIT):
+        self.stage = stage
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.queued = 0
+        self.rejected = 0
+        self._waiters = []  # heap of (priority, arrival, future)
+        self._arrivals = itertools.count()
+        self._service_time = 0.0
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue has probably drained."""
+        return max(1, math.ceil((self.queued + 1) * self._service_time / max(1, self.concurrency)))
+
+    def _reject(self, status_code: int, reason: str) -> Overloaded:
+        self.rejected += 1
+        ADMISSION_REJECTED.inc(stage=self.stage, reason=reason)
+        return Overloaded(self.stage, status_code, self.retry_after())
+
+    async def acquire(self, priority: str = "interactive"):
+        if self.active < self.concurrency and not self.queued:
+            self.active += 1
+            ADMISSION_WAIT_SECONDS.observe(0.0, stage=self.stage, priority=priority)
+            return
+        if self.queued >= self.max_queue:
+            raise self._reject(429, "queue_full")
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (PRIORITIES.get(priority, len(PRIORITIES)), next(self._arrivals), future))
+        self.queued += 1
+        ADMISSION_QUEUE_DEPTH.set(self.queued, stage=self.stage)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(future, self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                self.release()  # handed a slot just as the caller gave up: pass it on
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._reject(503, "max_wait")
+            raise
+        finally:
+            self.queued -= 1
+            ADMISSION_QUEUE_DEPTH.set(self.queued, stage=self.stage)
+            ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - start, stage=self.stage, priority=priority)
+
+    def release(self):
+        # The slot goes straight to the best waiter still waiting; otherwise it is freed
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "interactive"):
+        await self.acquire(priority)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            held = time.perf_counter() - start
+            self._service_time = SERVICE_TIME_DECAY * self._service_time + (1 - SERVICE_TIME_DECAY) * held
+            self.release()
+
+    def stats(self) -> dict:
+        return {"active": self.active, "queued": self.queued, "concurrency": self.concurrency,
+                "rejected": self.rejected, "avg_service_ms": round(self._service_time * 1000, 3)}
+
+
+@asynccontextmanager
+async def admitted(limiter: StageLimiter, priority: str = "interactive"):
+    """A slot in ``limiter``'s stage, or nothing to wait for when admission control is off."""
+    if not ADMISSION_CONTROL:
+        yield
+        return
+    async with limiter.slot(priority):
+        yield
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))  # max entries
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))  # seconds
+ANSWER_CACHE_MAX_BYTES = int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Cosine similarity above which a different wording of the question counts as a hit; 0 disables it
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0"))
+ANSWER_STORE_PATH = os.getenv("ANSWER_STORE_PATH", "data/answer_cache.sqlite")
+
+
+def normalize_question(question: str) -> str:
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip("?!. ")
+
+
+class _Entry:
+    __slots__ = ("answer", "expires_at", "size", "embedding", "group")
+
+    def __init__(self, answer, expires_at, size, embedding, group):
+        self.answer = answer
+        self.expires_at = expires_at
+        self.size = size
+        self.embedding = embedding
+        self.group = group
+
+
+class AnswerCache:
+    """LRU + TTL cache of LLM answers keyed by question, top_n and retrieved chunk IDs.
+
+    Entries that share the same ``(top_n, chunk_ids)`` were answered from the same
+    context, so when ``similarity_threshold`` is set a differently worded question
+    whose query embedding is close enough to a cached one reuses its answer.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL,
+                 max_bytes: int = ANSWER_CACHE_MAX_BYTES, similarity_threshold: float = ANSWER_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()
+        self._groups = {}  # (top_n, chunk_ids) -> set of keys, for semantic lookups
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, question: str, top_n: int, chunk_ids: Sequence[str],
+            query_embedding: Optional[List[float]] = None) -> Optional[str]:
+        group = (top_n, tuple(chunk_ids))
+        key = (normalize_question(question),) + group
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.answer
+            if entry is not None:
+                self._remove(key)
+            if query_embedding is not None and self.similarity_threshold > 0:
+                match = self._nearest(group, _unit(query_embedding), now)
+                if match is not None:
+                    self._entries.move_to_end(match)
+                    self.hits += 1
+                    self.semantic_hits += 1
+                    return self._entries[match].answer
+            self.misses += 1
+            return None
+
+    def put(self, question: str, top_n: int, chunk_ids: Sequence[str], answer: str,
+            query_embedding: Optional[List[float]] = None):
+        group = (top_n, tuple(chunk_ids))
+        key = (normalize_question(question),) + group
+        embedding = _unit(query_embedding) if query_embedding is not None else None
+        size = sys.getsizeof(answer) + sys.getsizeof(key[0]) + sum(len(c) for c in group[1])
+        if embedding is not None:
+            size += embedding.nbytes
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(answer, time.monotonic() + self.ttl, size, embedding, group)
+            self._groups.setdefault(group, set()).add(key)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._groups.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _nearest(self, group, embedding, now):
+        best_key, best_score = None, self.similarity_threshold
+        for key in list(self._groups.get(group, ())):
+            entry = self._entries[key]
+            if entry.expires_at <= now:
+                self._remove(key)
+                continue
+            if entry.embedding is None:
+                continue
+            score = float(np.dot(entry.embedding, embedding))
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        keys = self._groups.get(entry.group)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._groups[entry.group]
+
+
+class AnswerStore:
+    """Answers in SQLite under the same key as ``AnswerCache``, for short-lived CLI processes.
+
+    Entries expire after ``ttl`` seconds of wall-clock time. The file is opened on first use.
+    """
+
+    def __init__(self, path: str = ANSWER_STORE_PATH, ttl: float = ANSWER_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS answers "
+                               "(key BLOB PRIMARY KEY, answer TEXT NOT NULL, expires_at REAL NOT NULL)")
+        return self._conn
+
+    @staticmethod
+    def _key(question: str, top_n: int, chunk_ids: Sequence[str]) -> bytes:
+        return hashlib.sha256(json.dumps([normalize_question(question), top_n, list(chunk_ids)]).encode("utf-8")).digest()
+
+    def get(self, question: str, top_n: int, chunk_ids: Sequence[str]) -> Optional[str]:
+        row = self._connect().execute("SELECT answer, expires_at FROM answers WHERE key = ?",
+                                      (self._key(question, top_n, chunk_ids),)).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return row[0]
+
+    def put(self, question: str, top_n: int, chunk_ids: Sequence[str], answer: str):
+        conn = self._connect()
+        conn.execute("INSERT OR REPLACE INTO answers (key, answer, expires_at) VALUES (?, ?, ?)",
+                     (self._key(question, top_n, chunk_ids), answer, time.time() + self.ttl))
+        conn.commit()
+
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
@@ -1,11 +1,71 @@
 import os
-from fastapi import FastAPI, Query, HTTPException
+import asyncio
+import contextvars
+import functools
+import json
+import threading
+import time
+from typing import Any, Dict, List, Literal, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, Query, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from run import build_or_load_index, retrieve_chunks, build_context, ask_llm, TOP_N
+from run import build_or_load_index, retrieve_chunks, build_context, ask_llm_async, stream_llm_async, get_llm, embed_query, embed_queries, retrieve_chunks_batch, chunk_id, classify_intent, load_shards, retrieve_chunks_sharded, load_faq_index, chunk_sources, TOP_N
+from answer_cache import AnswerCache
+from coalescing import QUERY_COALESCING, SingleFlight, query_key
+from admission import LLM_CONCURRENCY, Overloaded, StageLimiter, admitted
+from intent import CANNED_RESPONSES, IntentStats, fast_answer
+from corpus import DEFAULT_COLLECTION
+from metrics import (PROFILING, REGISTRY, REQUEST_ERRORS, REQUEST_SECONDS, Profiler, collect_timings,
+                     timings_ms)
 from fastapi.middleware.cors import CORSMiddleware
 
 app = FastAPI()
 
+
+class RequestMetricsMiddleware:
+    """Times each request until its response starts and counts error responses, per route.
+
+    A plain ASGI middleware, so it adds microseconds rather than the cost of wrapping every
+    request and response the way ``@app.middleware("http")`` does.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = None
+
+        def endpoint():
+            # The router records the matched route in the scope; unmatched paths share one label
+            route = scope.get("route")
+            return getattr(route, "path", "unmatched")
+
+        async def send_and_record(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_record)
+        finally:
+            if status is None or status >= 400:
+                REQUEST_ERRORS.inc(endpoint=endpoint(), status=status or 500)
+
+
+app.add_middleware(RequestMetricsMiddleware)
+
+
+@app.exception_handler(Overloaded)
+async def overloaded(request: Request, exc: Overloaded):
+    return JSONResponse(status_code=exc.status_code, content={"detail": str(exc)},
+                        headers={"Retry-After": str(exc.retry_after)})
+
 # Allow CORS for local dev
 app.add_middleware(
     CORSMiddleware,
@@ -15,32 +75,329 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Query embedding and FAISS search are CPU-bound; run them on a bounded pool off the event loop
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", str(os.cpu_count() or 4)))
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "1000"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))  # in-flight LLM calls per batch request
+
 vectorstore = None
+shards = {}  # collection name -> vectorstore; the default collection is ``vectorstore``
+answer_cache = AnswerCache()
+faq_index = None  # precomputed answers to generated FAQ questions (``python run.py warm-faq``)
+intent_stats = IntentStats()
+query_flights = SingleFlight()  # identical /query requests in flight share one pipeline run
+retrieval_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+# Requests wait for these (in a bounded priority queue) instead of piling up in the pool and the LLM client
+retrieval_limiter = StageLimiter("retrieval", RETRIEVAL_WORKERS)
+llm_limiter = StageLimiter("llm", LLM_CONCURRENCY)
+warmup_thread = None
+
+def warm_up():
+    """Load the embedding model, intent centroids, reranker (if on) and the pooled LLM client; requests that arrive first wait for them."""
+    try:
+        vectorstore.embedding_function.warm_up()
+        vectorstore.intent_classifier.warm_up()
+    except Exception as e:
+        print(f"Embedding model not warmed up: {e}")
+    try:
+        if vectorstore.reranker is not None:
+            vectorstore.reranker.warm_up()
+    except Exception as e:
+        print(f"Reranker not warmed up: {e}")
+    try:
+        get_llm()
+    except Exception as e:
+        print(f"LLM client not initialised: {e}")
+
+def preload(load_models: bool = True):
+    """Load the index, collection shards and (with ``load_models``) model weights before forking workers.
+
+    Forked workers then share these pages copy-on-write instead of each loading a copy (see
+    ``serve.py``). Nothing is run through the models here: the thread pools a forward pass
+    starts do not survive a fork, so each worker warms up on its own.
+    """
+    global vectorstore, shards, faq_index
+    vectorstore, _ = build_or_load_index()
+    shards = load_shards(vectorstore)
+    faq_index = load_faq_index()
+    if load_models:
+        vectorstore.embedding_function.load_model()
+        if vectorstore.reranker is not None:
+            vectorstore.reranker.model
+    vectorstore.embedding_function.store.close()
 
 @app.on_event("startup")
 def load_index_on_startup():
-    global vectorstore
-    vectorstore, _ = build_or_load_index()
+    global vectorstore, shards, faq_index, warmup_thread
+    if vectorstore is None:
+        # Not preloaded. The index is memory-mapped and the model loads lazily, so this returns quickly
+        vectorstore, _ = build_or_load_index()
+        shards = load_shards(vectorstore)
+        faq_index = load_faq_index()
+    warmup_thread = threading.Thread(target=warm_up, name="warmup", daemon=True)
+    warmup_thread.start()
 
 class QueryRequest(BaseModel):
     question: str
     top_n: int = TOP_N
+    # Metadata the retrieved chunks must match, e.g. {"collection": "laws", "source": "data/laws/a.pdf"}
+    filter: Optional[Dict[str, Any]] = None
+    timings: bool = False  # add a per-stage timing breakdown (ms) to the response
+    profile: bool = False  # profile the retrieval work; needs PROFILING=1
+    sources: bool = False  # add the source and page of each retrieved chunk, merged near-duplicates included
+    priority: Literal["interactive", "batch"] = "interactive"  # admission lane; interactive goes first
+
+class BatchQueryRequest(BaseModel):
+    questions: List[str]
+    top_n: int = TOP_N
+    filter: Optional[Dict[str, Any]] = None
+    timings: bool = False  # stage times summed over the batch
+    priority: Literal["interactive", "batch"] = "batch"
 
 @app.get("/health")
 def health():
+    if warmup_thread is not None and warmup_thread.is_alive():
+        return {"status": "warming"}
     return {"status": "ok"}
 
+@app.get("/stats")
+def stats():
+    reranker = getattr(vectorstore, "reranker", None)
+    return {"answer_cache": answer_cache.stats(), "intents": intent_stats.stats(),
+            "reranker": reranker.stats() if reranker is not None else None, "coalescing": query_flights.stats(),
+            "faq": faq_index.stats() if faq_index is not None else None,
+            "admission": {"retrieval": retrieval_limiter.stats(), "llm": llm_limiter.stats()}}
+
+@app.get("/metrics")
+def metrics():
+    """Stage latency histograms and request, error and token counters in the Prometheus text format."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/collections")
+def collections():
+    return {"collections": {name: shard.index.ntotal for name, shard in shards.items()}}
+
+def sharded() -> bool:
+    return len(shards) > 1
+
+def retrieve(question: str, top_n: int, where: dict = None):
+    """Query embedding, intent and retrieved chunks; greetings and out-of-scope questions skip retrieval."""
+    query_embedding = embed_query(vectorstore, question)
+    intent = classify_intent(vectorstore, question, query_embedding)
+    if intent in CANNED_RESPONSES:
+        return query_embedding, intent, []
+    if where or sharded():
+        retrieved = retrieve_chunks_sharded(shards or {DEFAULT_COLLECTION: vectorstore}, [question], top_n,
+                                            [query_embedding], where)[0]
+    else:
+        retrieved = retrieve_chunks(vectorstore, question, top_n, query_embedding=query_embedding)
+    return query_embedding, intent, retrieved
+
+def nearest_faq(question: str):
+    return faq_index.nearest(embed_query(vectorstore, question), question)
+
+async def match_faq(req: QueryRequest):
+    """The precomputed answer for the request's question, or None.
+
+    An exact question match is a dict lookup on the event loop; otherwise the question is
+    embedded (the embedding is cached for retrieval) and the nearest FAQ question looked up.
+    Only requests that the answers were built for qualify: no filter and the same ``top_n``.
+    """
+    if faq_index is None or req.filter or req.top_n != faq_index.top_n:
+        return None
+    entry = faq_index.get(req.question)
+    if entry is None:
+        entry = await run_retrieval(nearest_faq, req.question, priority=req.priority)
+    return entry
+
+async def run_retrieval(func, *args, profiler: Profiler = None, priority: str = "interactive"):
+    """Run ``func`` on the retrieval pool once admitted; a bad filter (such as an unknown collection) is a 400.
+
+    ``func`` runs in a copy of the request's context, so its stage timings reach the request,
+    and under ``profiler`` when one is given.
+    """
+    loop = asyncio.get_running_loop()
+    call = functools.partial(profiler.run, func, *args) if profiler is not None else functools.partial(func, *args)
+    try:
+        async with admitted(retrieval_limiter, priority):
+            return await loop.run_in_executor(retrieval_executor, contextvars.copy_context().run, call)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def request_profiler(req: QueryRequest) -> Optional[Profiler]:
+    if not req.profile:
+        return None
+    if not PROFILING:
+        raise HTTPException(status_code=400, detail="Profiling is disabled; start the server with PROFILING=1.")
+    return Profiler()
+
+def diagnostics(timings: Optional[dict], start: float, profiler: Optional[Profiler]) -> dict:
+    """The ``timings_ms`` and ``profile`` response fields a request asked for."""
+    extra = {}
+    if timings is not None:
+        timings["total"] = time.perf_counter() - start
+        extra["timings_ms"] = timings_ms(timings)
+    if profiler is not None:
+        extra["profile"] = profiler.report()
+    return extra
+
 @app.post("/query")
-def query_api(req: QueryRequest):
+async def query_api(req: QueryRequest):
     if vectorstore is None:
         # Return a 400 error with a clear message and the expected keys
         raise HTTPException(status_code=400, detail="Index not loaded.")
-    retrieved = retrieve_chunks(vectorstore, req.question, req.top_n)
-    retrieved_chunks = [chunk for chunk, _ in retrieved]
-    context = build_context(retrieved_chunks)
-    llm_response = ask_llm(context, req.question)
+    start = time.perf_counter()
+    profiler = request_profiler(req)
+    timings = collect_timings() if req.timings else None
+
+    async def run_query():
+        faq = await match_faq(req)
+        if faq is not None:
+            return faq.intent, faq.chunks, faq.answer, False
+        query_embedding, intent, retrieved = await run_retrieval(retrieve, req.question, req.top_n, req.filter,
+                                                                 profiler=profiler, priority=req.priority)
+        retrieved_chunks = [chunk for chunk, _ in retrieved]
+        llm_response, llm_called = await answer(req.question, req.top_n, retrieved_chunks, query_embedding, intent,
+                                                req.priority)
+        return intent, retrieved_chunks, llm_response, llm_called
+
+    # A request asking for its own timings or profile runs the pipeline itself
+    if QUERY_COALESCING and timings is None and profiler is None:
+        (intent, retrieved_chunks, llm_response, llm_called), leader = await query_flights.do(
+            query_key(req.question, req.top_n, req.filter), run_query)
+        llm_called = llm_called and leader
+    else:
+        intent, retrieved_chunks, llm_response, llm_called = await run_query()
+    intent_stats.record(intent, time.perf_counter() - start, llm_called)
+    extra = {}
+    if req.sources:
+        # Looked up by text, so chunks from a precomputed FAQ answer are cited too
+        stores = list((shards or {DEFAULT_COLLECTION: vectorstore}).values())
+        extra["sources"] = await run_retrieval(chunk_sources, stores, retrieved_chunks, priority=req.priority)
     return {
         "question": req.question,
+        "intent": intent,
         "retrieved_chunks": retrieved_chunks,
-        "llm_response": llm_response.strip()
-    } 
\ No newline at end of file
+        **extra,
+        "llm_response": llm_response,
+        **diagnostics(timings, start, profiler),
+    }
+
+async def answer(question: str, top_n: int, retrieved_chunks: List[str], query_embedding,
+                 intent: str = None, priority: str = "interactive") -> Tuple[str, bool]:
+    """Answer and whether the LLM was called: intent fast paths first, then the cache, then the LLM.
+
+    The LLM is only called once admitted to the LLM stage in ``priority``'s lane.
+    """
+    response = fast_answer(intent, question, retrieved_chunks)
+    if response is not None:
+        return response, False
+    chunk_ids = [chunk_id(chunk) for chunk in retrieved_chunks]
+    llm_response = answer_cache.get(question, top_n, chunk_ids, query_embedding)
+    if llm_response is not None:
+        return llm_response, False
+    # Token counting and the embedding-cache reads behind deduplication block, so they run off the event loop
+    context = await run_retrieval(build_context, retrieved_chunks, vectorstore, priority=priority)
+    async with admitted(llm_limiter, priority):
+        llm_response = (await ask_llm_async(context, question)).strip()
+    answer_cache.put(question, top_n, chunk_ids, llm_response, query_embedding)
+    return llm_response, True
+
+def retrieve_batch(questions: List[str], top_n: int, where: dict = None):
+    """Like ``retrieve`` for many questions, with one FAISS search (per shard) for those that need retrieval."""
+    query_embeddings = embed_queries(vectorstore, questions)
+    intents = [classify_intent(vectorstore, question, embedding)
+               for question, embedding in zip(questions, query_embeddings)]
+    retrieved = [[] for _ in questions]
+    positions = [i for i, intent in enumerate(intents) if intent not in CANNED_RESPONSES]
+    if positions:
+        queries = [questions[i] for i in positions]
+        embeddings = [query_embeddings[i] for i in positions]
+        if where or sharded():
+            rows = retrieve_chunks_sharded(shards or {DEFAULT_COLLECTION: vectorstore}, queries, top_n, embeddings, where)
+        else:
+            rows = retrieve_chunks_batch(vectorstore, queries, top_n, query_embeddings=embeddings)
+        for i, row in zip(positions, rows):
+            retrieved[i] = row
+    return query_embeddings, intents, retrieved
+
+@app.post("/query/batch")
+async def query_batch_api(req: BatchQueryRequest):
+    if vectorstore is None:
+        raise HTTPException(status_code=400, detail="Index not loaded.")
+    if len(req.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch.")
+    start = time.perf_counter()
+    timings = collect_timings() if req.timings else None
+    query_embeddings, intents, retrieved = await run_retrieval(retrieve_batch, req.questions, req.top_n, req.filter,
+                                                               priority=req.priority)
+    semaphore = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+    async def answer_one(question, intent, chunks_and_scores, query_embedding):
+        retrieved_chunks = [chunk for chunk, _ in chunks_and_scores]
+        result = {"question": question, "intent": intent, "retrieved_chunks": retrieved_chunks}
+        llm_called = True
+        async with semaphore:
+            try:
+                result["llm_response"], llm_called = await answer(
+                    question, req.top_n, retrieved_chunks, query_embedding, intent, req.priority)
+            except Exception as e:
+                # One failed LLM call should not throw away the rest of a large batch
+                result["llm_response"] = None
+                result["error"] = str(e)
+        intent_stats.record(intent, time.perf_counter() - start, llm_called)
+        return result
+
+    results = await asyncio.gather(*(
+        answer_one(question, intent, chunks_and_scores, query_embedding)
+        for question, intent, chunks_and_scores, query_embedding
+        in zip(req.questions, intents, retrieved, query_embeddings)
+    ))
+    return {"results": results, **diagnostics(timings, start, None)}
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/query/stream")
+async def query_stream_api(req: QueryRequest):
+    """Server-sent events: ``chunks`` first, then ``token`` events, then ``done`` with the full answer."""
+    if vectorstore is None:
+        raise HTTPException(status_code=400, detail="Index not loaded.")
+    start = time.perf_counter()
+    profiler = request_profiler(req)
+    timings = collect_timings() if req.timings else None
+    query_embedding, intent, retrieved = await run_retrieval(retrieve, req.question, req.top_n, req.filter,
+                                                             profiler=profiler, priority=req.priority)
+    retrieved_chunks = [chunk for chunk, _ in retrieved]
+    chunk_ids = [chunk_id(chunk) for chunk in retrieved_chunks]
+
+    async def events():
+        yield sse_event("chunks", {"question": req.question, "intent": intent, "retrieved_chunks": retrieved_chunks})
+        llm_response = fast_answer(intent, req.question, retrieved_chunks)
+        if llm_response is None:
+            llm_response = answer_cache.get(req.question, req.top_n, chunk_ids, query_embedding)
+        llm_called = llm_response is None
+        if llm_response is not None:
+            yield sse_event("token", {"token": llm_response})
+        else:
+            tokens = []
+            try:
+                context = await run_retrieval(build_context, retrieved_chunks, vectorstore, priority=req.priority)
+                async with admitted(llm_limiter, req.priority):
+                    async for token in stream_llm_async(context, req.question):
+                        tokens.append(token)
+                        yield sse_event("token", {"token": token})
+            except Overloaded as e:
+                # The response has already started, so the rejection is an event rather than a 429
+                yield sse_event("error", {"detail": str(e), "retry_after": e.retry_after})
+                return
+            except Exception as e:
+                yield sse_event("error", {"detail": str(e)})
+                return
+            llm_response = "".join(tokens).strip()
+            answer_cache.put(req.question, req.top_n, chunk_ids, llm_response, query_embedding)
+        intent_stats.record(intent, time.perf_counter() - start, llm_called)
+        yield sse_event("done", {"llm_response": llm_response, **diagnostics(timings, start, profiler)})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
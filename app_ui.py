@@ -1,6 +1,6 @@
 import streamlit as st
+import json
 import requests
-import time
 import base64
 
 st.set_page_config(page_title="Philippine History RAG App", layout="centered")
@@ -118,6 +118,7 @@ st.markdown('<div class="main-title">Philippine History RAG App</div>', unsafe_a
 st.markdown('<div class="subtitle">Ask questions about Philippine history and get concise, context-based answers.</div>', unsafe_allow_html=True)
 
 API_URL = "http://localhost:8000/query"
+STREAM_URL = "http://localhost:8000/query/stream"
 HEALTH_URL = "http://localhost:8000/health"
 
 # Check backend status
@@ -140,21 +141,43 @@ with st.form("query_form"):
         top_n = st.slider("Chunks", 1, 10, 5, key="top_n")
     submitted = st.form_submit_button("Ask", use_container_width=True)
 
+def iter_sse(resp):
+    """Yield (event, data) pairs from a server-sent events response."""
+    event, data = "message", []
+    for line in resp.iter_lines(decode_unicode=True):
+        if line == "":
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+
 if submitted and user_query.strip():
-    with st.spinner("Retrieving answer..."):
-        time.sleep(0.5)  # Subtle animation effect
-        try:
-            resp = requests.post(API_URL, json={"question": user_query, "top_n": top_n})
-            if resp.status_code == 200:
-                data = resp.json()
-                st.markdown('<div class="section-title">Retrieved Chunks</div>', unsafe_allow_html=True)
-                for chunk in data["retrieved_chunks"]:
-                    st.markdown(f'<div class="retrieved-chunk">{chunk[:300]}...</div>', unsafe_allow_html=True)
-                st.markdown('<div class="section-title">LLM Response</div>', unsafe_allow_html=True)
-                st.markdown(f'<div class="llm-response">{data["llm_response"]}</div>', unsafe_allow_html=True)
-            else:
-                st.error(f"API error: {resp.status_code}")
-        except Exception as e:
-            st.error(f"Error: {e}")
+    try:
+        with st.spinner("Retrieving answer..."):
+            resp = requests.post(STREAM_URL, json={"question": user_query, "top_n": top_n}, stream=True)
+        if resp.status_code == 200:
+            answer = ""
+            response_box = None
+            for event, data in iter_sse(resp):
+                if event == "chunks":
+                    st.markdown('<div class="section-title">Retrieved Chunks</div>', unsafe_allow_html=True)
+                    for chunk in data["retrieved_chunks"]:
+                        st.markdown(f'<div class="retrieved-chunk">{chunk[:300]}...</div>', unsafe_allow_html=True)
+                    st.markdown('<div class="section-title">LLM Response</div>', unsafe_allow_html=True)
+                    response_box = st.empty()
+                elif event == "token":
+                    answer += data["token"]
+                    response_box.markdown(f'<div class="llm-response">{answer}</div>', unsafe_allow_html=True)
+                elif event == "done":
+                    response_box.markdown(f'<div class="llm-response">{data["llm_response"]}</div>', unsafe_allow_html=True)
+                elif event == "error":
+                    st.error(f"LLM error: {data['detail']}")
+        else:
+            st.error(f"API error: {resp.status_code}")
+    except Exception as e:
+        st.error(f"Error: {e}")
 else:
     st.info("Enter a question and click 'Ask' to get started.") 
\ No newline at end of file
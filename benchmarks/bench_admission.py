@@ -0,0 +1,147 @@
+"""Load test of /query with admission control on and off, against a slow fake LLM.
+
+The fake LLM sleeps ``--llm-delay`` seconds per call and the app may have ``--llm-slots``
+calls in flight, so the server can answer about ``llm_slots / llm_delay`` requests per
+second. Closed-loop clients keep ``--concurrency`` requests outstanding for
+``--duration`` seconds. A client whose request is turned away (429/503) waits for the
+``Retry-After`` it was given before sending the next one, as a well-behaved client would.
+Both the retrieval and the LLM stage get a queue of ``--queue`` requests.
+
+Without admission control every request waits for a free LLM connection, so the p99
+latency grows with the load. With it, at most ``--queue`` requests wait per stage, and
+none for longer than ``--max-wait``. The p99 of the answered requests therefore stays
+bounded, and the excess load is rejected quickly instead. The server runs in its own
+process, so the clients' work does not count towards its latency.
+
+    python benchmarks/bench_admission.py --concurrency 8 32 128 256
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("TEAMIFIED_OPENAI_API_KEY", "sk-local-benchmark")
+
+import httpx
+
+import admission
+import app_api
+import run
+from benchmarks.bench_workers import free_port
+from benchmarks.common import build_fake_vectorstore, percentile
+from benchmarks.fake_llm import start_fake_llm
+
+
+async def drive(url: str, concurrency: int, duration: float) -> dict:
+    latencies = []
+    rejected = {}
+    errors = 0
+    counter = iter(range(10 ** 9))
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        # A connection per client: a shared httpx pool queues requests inside the client under this load
+        async with httpx.AsyncClient(timeout=300) as client:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                # Questions unique across runs, so neither the answer cache nor coalescing short-circuits the LLM
+                question = f"When did event {concurrency}-{next(counter)} happen?"
+                resp = await client.post(f"{url}/query", json={"question": question, "top_n": 5})
+                if resp.status_code == 200:
+                    latencies.append(time.perf_counter() - start)
+                elif resp.status_code in (429, 503):
+                    rejected[resp.status_code] = rejected.get(resp.status_code, 0) + 1
+                    retry_after = float(resp.headers["Retry-After"])
+                    await asyncio.sleep(min(retry_after, max(0.0, deadline - time.perf_counter())))
+                else:
+                    errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "answered": len(latencies),
+        "rejected_429": rejected.get(429, 0),
+        "rejected_503": rejected.get(503, 0),
+        "errors": errors,
+        "answered_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def child_serve(port: int, llm_delay: float, llm_slots: int, queue: int, max_wait: float, chunks: int):
+    import uvicorn
+    llm_server, llm_url = start_fake_llm(delay=llm_delay)
+    # The connection pool stands in for the provider's rate limit, with admission control on or off
+    run._llm = run.create_llm(pool_size=llm_slots, base_url=llm_url)
+    app_api.vectorstore = build_fake_vectorstore(chunks)
+    app_api.shards = {}
+    app_api.retrieval_limiter = admission.StageLimiter("retrieval", app_api.RETRIEVAL_WORKERS, max_queue=queue,
+                                                       max_wait=max_wait)
+    app_api.llm_limiter = admission.StageLimiter("llm", llm_slots, max_queue=queue, max_wait=max_wait)
+    uvicorn.run(app_api.app, host="127.0.0.1", port=port, log_level="warning", lifespan="off", backlog=4096)
+
+
+def start_server(admission_control: bool, llm_delay: float, llm_slots: int, queue: int, max_wait: float,
+                 chunks: int):
+    port = free_port()
+    args = [sys.executable, __file__, "--child", str(port), "--llm-delay", str(llm_delay), "--llm-slots",
+            str(llm_slots), "--queue", str(queue), "--max-wait", str(max_wait), "--chunks", str(chunks)]
+    env = dict(os.environ, ADMISSION_CONTROL="1" if admission_control else "0")
+    proc = subprocess.Popen(args, cwd=ROOT, env=env)
+    url = f"http://127.0.0.1:{port}"
+    while True:
+        try:
+            httpx.get(f"{url}/health")
+            return proc, url
+        except httpx.TransportError:
+            if proc.poll() is not None:
+                raise RuntimeError("benchmark server exited during start-up")
+            time.sleep(0.05)
+
+
+def run_benchmark(concurrency=(8, 32, 128, 256), llm_delay: float = 0.2, llm_slots: int = 8, queue: int = 32,
+                  max_wait: float = 2.0, duration: float = 10.0, chunks: int = 1000) -> dict:
+    results = {"llm_delay_s": llm_delay, "llm_slots": llm_slots, "queue": queue, "max_wait_s": max_wait,
+               "capacity_per_s": round(llm_slots / llm_delay, 1), "off": [], "on": []}
+    for mode in ("off", "on"):
+        proc, url = start_server(mode == "on", llm_delay, llm_slots, queue, max_wait, chunks)
+        try:
+            for c in concurrency:
+                results[mode].append(asyncio.run(drive(url, c, duration)))
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            proc.wait(timeout=60)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 32, 128, 256])
+    parser.add_argument("--llm-delay", type=float, default=0.2, help="fake LLM latency in seconds")
+    parser.add_argument("--llm-slots", type=int, default=8, help="LLM calls in flight (pool size and limiter)")
+    parser.add_argument("--queue", type=int, default=32, help="requests allowed to wait for an LLM slot")
+    parser.add_argument("--max-wait", type=float, default=2.0, help="seconds a request may wait for a slot")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per concurrency level and mode")
+    parser.add_argument("--chunks", type=int, default=1000, help="synthetic corpus size")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child_serve(args.child, args.llm_delay, args.llm_slots, args.queue, args.max_wait, args.chunks)
+        return
+    print(json.dumps(run_benchmark(args.concurrency, args.llm_delay, args.llm_slots, args.queue, args.max_wait,
+                                   args.duration, args.chunks), indent=2))
+
+
+if __name__ == "__main__":
+    main()
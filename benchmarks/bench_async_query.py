@@ -0,0 +1,119 @@
+"""Load test of /query: the async endpoint vs. the previous sync (threadpool) handler.
+
+Both apps serve the same synthetic FAISS index and talk to a local fake LLM
+that sleeps ``--llm-delay`` seconds per call, so throughput is bounded by how
+many requests can wait on the LLM at once. The sync handler has no admission
+control, so the async app runs with it off too (``ADMISSION_CONTROL=0``, whatever
+the environment says); otherwise with the default ``LLM_CONCURRENCY`` and
+``ADMISSION_QUEUE_SIZE`` high concurrency levels would mostly measure 429/503
+rejections. A request that fails at the transport level
+counts as an error, like a non-200 response.
+
+    python benchmarks/bench_async_query.py --concurrency 50 100 250 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+os.environ.setdefault("TEAMIFIED_OPENAI_API_KEY", "sk-local-benchmark")
+
+import httpx
+from fastapi import FastAPI
+
+import admission
+import app_api
+import run
+from benchmarks.common import build_fake_vectorstore, percentile, serve_app
+from benchmarks.fake_llm import start_fake_llm
+
+
+def build_sync_app(vectorstore) -> FastAPI:
+    """The /query handler as it was before the async rewrite: one threadpool worker per request."""
+    sync_app = FastAPI()
+
+    @sync_app.post("/query")
+    def query_api(req: app_api.QueryRequest):
+        retrieved = run.retrieve_chunks(vectorstore, req.question, req.top_n)
+        retrieved_chunks = [chunk for chunk, _ in retrieved]
+        context = run.build_context(retrieved_chunks)
+        return {"question": req.question, "retrieved_chunks": retrieved_chunks,
+                "llm_response": run.ask_llm(context, req.question).strip()}
+
+    return sync_app
+
+
+async def drive(url: str, concurrency: int, total: int) -> dict:
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=120) as client:
+        async def worker():
+            nonlocal errors
+            for i in counter:
+                start = time.perf_counter()
+                try:
+                    # Unique questions so the answer cache never short-circuits the LLM
+                    resp = await client.post(f"{url}/query",
+                                             json={"question": f"When did event {i} happen?", "top_n": 5})
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+                if resp.status_code != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1) if latencies else None,
+    }
+
+
+def run_benchmark(concurrency=(50, 100, 250, 500), llm_delay: float = 0.1, chunks: int = 1000) -> dict:
+    llm_server, llm_url = start_fake_llm(delay=llm_delay)
+    run._llm = run.create_llm(pool_size=max(concurrency), base_url=llm_url)
+    vectorstore = build_fake_vectorstore(chunks)
+    app_api.vectorstore = vectorstore
+
+    async_server, async_url = serve_app(app_api.app)
+    sync_server, sync_url = serve_app(build_sync_app(vectorstore))
+    results = {"llm_delay_s": llm_delay, "admission_control": False, "sync": [], "async": []}
+    try:
+        with patch.object(admission, "ADMISSION_CONTROL", False):
+            for c in concurrency:
+                total = max(4 * c, 200)
+                results["sync"].append(asyncio.run(drive(sync_url, c, total)))
+                app_api.answer_cache.clear()
+                results["async"].append(asyncio.run(drive(async_url, c, total)))
+    finally:
+        async_server.should_exit = True
+        sync_server.should_exit = True
+        llm_server.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 100, 250, 500])
+    parser.add_argument("--llm-delay", type=float, default=0.1, help="fake LLM latency in seconds")
+    parser.add_argument("--chunks", type=int, default=1000, help="synthetic corpus size")
+    args = parser.parse_args()
+    print(json.dumps(run_benchmark(args.concurrency, args.llm_delay, args.chunks), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Retrieval throughput: one retrieve_chunks call per question vs. retrieve_chunks_batch.
+
+By default the corpus uses a cheap deterministic embedding, which isolates the
+FAISS and per-call overhead; pass ``--real-model`` to embed with
+all-MiniLM-L6-v2 (needs sentence-transformers) and include the batched
+forward pass.
+
+    python benchmarks/bench_batch_retrieval.py --questions 2000 --chunks 20000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+
+from langchain_community.vectorstores import FAISS
+
+import run
+from benchmarks.common import build_fake_vectorstore, synthetic_chunks
+
+
+def run_benchmark(questions: int = 2000, chunks: int = 20000, top_n: int = run.TOP_N, real_model: bool = False) -> dict:
+    if real_model:
+        from langchain_huggingface import HuggingFaceEmbeddings
+        embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+        vectorstore = FAISS.from_texts(synthetic_chunks(chunks), embeddings)
+    else:
+        vectorstore = build_fake_vectorstore(chunks)
+    queries = [f"What happened in {1500 + i % 500}? ({i})" for i in range(questions)]
+
+    start = time.perf_counter()
+    single = [run.retrieve_chunks(vectorstore, q, top_n) for q in queries]
+    single_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = run.retrieve_chunks_batch(vectorstore, queries, top_n)
+    batch_s = time.perf_counter() - start
+
+    agreement = sum(
+        [c for c, _ in a] == [c for c, _ in b] for a, b in zip(single, batch)
+    ) / len(queries)
+    return {
+        "questions": questions,
+        "chunks": chunks,
+        "top_n": top_n,
+        "real_model": real_model,
+        "single_qps": round(questions / single_s, 1),
+        "batch_qps": round(questions / batch_s, 1),
+        "speedup": round(single_s / batch_s, 2),
+        "result_agreement": round(agreement, 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", type=int, default=2000)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--top-n", type=int, default=run.TOP_N)
+    parser.add_argument("--real-model", action="store_true", help="embed with all-MiniLM-L6-v2")
+    args = parser.parse_args()
+    print(json.dumps(run_benchmark(args.questions, args.chunks, args.top_n, args.real_model), indent=2))
+
+
+if __name__ == "__main__":
+    main()
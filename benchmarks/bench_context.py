@@ -0,0 +1,99 @@
+"""Prompt tokens: retrieved chunks joined verbatim vs. the token-budgeted context builder.
+
+Questions ask about a rare number in the corpus ("What happened in 1898?"). For each
+top_n the benchmark retrieves with the hybrid retriever and reports the average prompt
+tokens of both contexts, the saving, and how often the number is still in the context.
+Uses the PDF's chunks when it has extractable text, else synthetic pages split with the
+same chunk size and overlap as the index.
+
+    python benchmarks/bench_context.py --queries 200
+    python benchmarks/bench_context.py --fake-embeddings  # no model download; no near-duplicates found
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import context_builder
+import run
+from benchmarks.bench_hybrid import make_questions
+from benchmarks.common import EMBEDDING_DIM, synthetic_chunks
+from bm25_index import BM25Index
+from embedding_cache import CachedEmbeddings, EmbeddingStore
+
+TOP_NS = (3, 5, 10)
+SENTENCES_PER_PAGE = 12
+
+
+def load_corpus(pdf_path: str, pages: int):
+    chunks = run.load_pdf_chunks(pdf_path) if os.path.exists(pdf_path) else []
+    if chunks:
+        return chunks, pdf_path
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    splitter = RecursiveCharacterTextSplitter(chunk_size=run.CHUNK_SIZE, chunk_overlap=run.CHUNK_OVERLAP)
+    sentences = synthetic_chunks(pages * SENTENCES_PER_PAGE)
+    texts = [" ".join(sentences[i:i + SENTENCES_PER_PAGE]) for i in range(0, len(sentences), SENTENCES_PER_PAGE)]
+    return [chunk for text in texts for chunk in splitter.split_text(text)], "synthetic"
+
+
+def old_context(chunks) -> str:
+    return '\n'.join([f'- "{chunk}"' for chunk in chunks])
+
+
+def measure(vectorstore, questions, top_n: int, token_budget: int) -> dict:
+    before, after, kept_before, kept_after = 0, 0, 0, 0
+    for question, key in questions:
+        chunks = [chunk for chunk, _ in run.retrieve_chunks(vectorstore, question, top_n)]
+        verbatim = old_context(chunks)
+        budgeted = run.build_context(chunks, vectorstore, token_budget)
+        before += context_builder.count_tokens(run.build_prompt(verbatim, question))
+        after += context_builder.count_tokens(run.build_prompt(budgeted, question))
+        kept_before += bool(re.search(rf"\b{key}\b", verbatim))
+        kept_after += bool(re.search(rf"\b{key}\b", budgeted))
+    return {
+        "prompt_tokens_verbatim": round(before / len(questions), 1),
+        "prompt_tokens_budgeted": round(after / len(questions), 1),
+        "saved_pct": round(100 * (1 - after / before), 1) if before else 0.0,
+        "recall_verbatim": round(kept_before / len(questions), 4),
+        "recall_budgeted": round(kept_after / len(questions), 4),
+    }
+
+
+def run_benchmark(queries: int = 200, fake_embeddings: bool = False, pdf_path: str = run.PDF_PATH,
+                  pages: int = 400, token_budget: int = context_builder.CONTEXT_TOKEN_BUDGET) -> dict:
+    chunks, corpus = load_corpus(pdf_path, pages)
+    questions = make_questions(chunks, queries)
+    model = DeterministicFakeEmbedding(size=EMBEDDING_DIM) if fake_embeddings else run._create_embedding_model()
+    with tempfile.TemporaryDirectory() as tmp:
+        # Near-duplicate detection reads the vectors the index was built with from this cache
+        embeddings = CachedEmbeddings(model, "bench", EmbeddingStore(os.path.join(tmp, "embeddings.sqlite")))
+        vectorstore = FAISS.from_texts(chunks, embeddings)
+        vectorstore.lexical_index = BM25Index.build(chunks)
+        results = {"corpus": corpus, "chunks": len(chunks), "queries": len(questions), "token_budget": token_budget,
+                   "tokenizer": "tiktoken" if context_builder._load_encoding() else "4 chars/token estimate"}
+        for top_n in TOP_NS:
+            results[f"top_{top_n}"] = measure(vectorstore, questions, top_n, token_budget)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--fake-embeddings", action="store_true", help="use a cheap random embedding instead of the model")
+    parser.add_argument("--pdf", default=run.PDF_PATH)
+    parser.add_argument("--pages", type=int, default=400, help="synthetic pages when the PDF has no text")
+    parser.add_argument("--token-budget", type=int, default=context_builder.CONTEXT_TOKEN_BUDGET)
+    args = parser.parse_args()
+    print(json.dumps(run_benchmark(args.queries, args.fake_embeddings, args.pdf, args.pages, args.token_budget),
+                     indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Near-duplicate chunk elimination: index size and query latency with and without build-time dedup.
+
+The synthetic corpus repeats itself heavily, the way scanned archives do. Every volume
+carries the same long copyright and notice pages, with only the page number changing.
+Reprinted chapters appear in several volumes, and a few pages are left blank. Each mode
+ingests the corpus in a fresh subprocess with ``INDEX_DEDUP_SIMILARITY`` set (0 turns
+dedup off). It then reports the indexed chunks, the bytes on disk, and the search
+latency over the memory-mapped index. It also reports how many of the top 5 results
+are distinct texts.
+
+The embedding model is the bag-of-words stand-in from ``bench_workers`` unless
+``--real-model`` is given.
+
+    python benchmarks/bench_dedup.py --volumes 20 --pages 100
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+sys.path.insert(0, ROOT)
+
+import fitz  # PyMuPDF
+
+from benchmarks.common import TOPICS, percentile
+
+NOTICE = ("Copyright Philippine History Archive. All rights reserved. No part of this publication may be "
+          "reproduced, stored in a retrieval system or transmitted in any form or by any means, electronic, "
+          "mechanical, photocopying, recording or otherwise, without the prior written permission of the "
+          "publisher. This reproduction was digitized from the original holdings of the national library "
+          "and is provided for research and private study only. Page {page}.")
+BLANK = "This page was intentionally left blank in the original printing. Page {page}."
+QUERIES = ["When was the EDSA revolution?", "When was Rizal executed?", "Who won the Battle of Mactan?",
+           "Where was independence declared?", "Who founded the Katipunan?", "When did Japan invade?",
+           "Who may reproduce this publication?", "Which pages were left blank?"]
+
+
+def page_text(volume: int, page: int) -> str:
+    if page % 10 in (1, 2):
+        return NOTICE.format(page=page)  # front matter and a notice at every part break
+    if page % 25 == 0:
+        return BLANK.format(page=page)
+    if page % 10 in (3, 4, 5):
+        # A chapter reprinted in every volume
+        return " ".join(TOPICS[(page + i) % len(TOPICS)] for i in range(4)) + f" Reprinted chapter, page {page}."
+    return (f"Volume {volume}, page {page}. " + " ".join(TOPICS[(volume * 7 + page + i) % len(TOPICS)] for i in range(3))
+            + f" Archival note {volume}-{page}: record {volume * 1000 + page} of the provincial registry.")
+
+
+def make_corpus(directory: str, volumes: int, pages: int):
+    for volume in range(1, volumes + 1):
+        doc = fitz.open()
+        for page in range(1, pages + 1):
+            new_page = doc.new_page()
+            new_page.insert_textbox(new_page.rect + (36, 36, -36, -36), page_text(volume, page), fontsize=9)
+        doc.save(os.path.join(directory, f"volume_{volume:03d}.pdf"))
+        doc.close()
+
+
+def directory_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def measure(corpus: str, real_model: bool, repeats: int) -> dict:
+    # Runs in a child process, with INDEX_DEDUP_SIMILARITY already in its environment
+    from benchmarks.bench_workers import configure
+    import run
+    with tempfile.TemporaryDirectory() as directory:
+        configure(directory, real_model)
+        start = time.perf_counter()
+        stats = run.ingest_directory(corpus)
+        ingest_s = time.perf_counter() - start
+        embeddings = run.load_embeddings()
+        vectorstore = run.load_mapped_index(embeddings)
+        query_embeddings = [embeddings.embed_query(query) for query in QUERIES]
+        latencies, distinct = [], []
+        for _ in range(repeats):
+            for query, query_embedding in zip(QUERIES, query_embeddings):
+                start = time.perf_counter()
+                rows = run.retrieve_chunks(vectorstore, query, 5, query_embedding=query_embedding)
+                latencies.append(time.perf_counter() - start)
+                distinct.append(len({chunk for chunk, _ in rows}))
+        return {"threshold": float(os.environ["INDEX_DEDUP_SIMILARITY"]),
+                "chunks": stats["added"] + stats["duplicates"], "indexed_chunks": stats["total_chunks"],
+                "merged_duplicates": stats["duplicates"],
+                "ingest_s": round(ingest_s, 2),
+                "index_mb": round(directory_bytes(run.INDEX_PATH) / 2 ** 20, 2),
+                "chunk_store_mb": round(directory_bytes(run.CHUNKS_PATH) / 2 ** 20, 2),
+                "bm25_mb": round(directory_bytes(run.BM25_PATH) / 2 ** 20, 2),
+                "query_p50_ms": round(percentile(latencies, 50) * 1000, 3),
+                "query_p99_ms": round(percentile(latencies, 99) * 1000, 3),
+                "distinct_in_top5": round(sum(distinct) / len(distinct), 2)}
+
+
+def run_benchmark(volumes: int = 20, pages: int = 100, thresholds=(0.0, 0.97), real_model: bool = False,
+                  repeats: int = 50) -> dict:
+    results = {"volumes": volumes, "pages": volumes * pages,
+               "model": "all-MiniLM-L6-v2" if real_model else "weighted-fake", "runs": []}
+    with tempfile.TemporaryDirectory() as corpus:
+        make_corpus(corpus, volumes, pages)
+        for threshold in thresholds:
+            args = [sys.executable, __file__, "--child", corpus, "--repeats", str(repeats)]
+            args += ["--real-model"] if real_model else []
+            env = {**os.environ, "INDEX_DEDUP_SIMILARITY": str(threshold)}
+            out = subprocess.run(args, cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+            results["runs"].append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--volumes", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.0, 0.97])
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--real-model", action="store_true")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(measure(args.child, args.real_model, args.repeats)))
+        return
+    print(json.dumps(run_benchmark(args.volumes, args.pages, args.thresholds, args.real_model, args.repeats),
+                     indent=2))
+
+
+if __name__ == "__main__":
+    main()
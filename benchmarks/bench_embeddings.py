@@ -0,0 +1,88 @@
+"""Embedding backends: PyTorch (sentence-transformers) vs. ONNX Runtime fp32 and int8.
+
+Reports single-query latency, batch throughput and retrieval agreement: the
+fraction of each backend's top-k chunks (exact FAISS search over its own chunk
+embeddings) that match the PyTorch backend's. Export the ONNX model first:
+
+    python run.py export-onnx
+    python benchmarks/bench_embeddings.py --chunks 2000 --queries 200 --threads 4
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+
+import faiss
+import numpy as np
+
+import run
+from benchmarks.common import percentile, synthetic_chunks
+from onnx_embeddings import ONNX_MODEL_PATH, OnnxEmbeddings
+
+
+def create_backends(model_dir: str, threads: int) -> dict:
+    from langchain_huggingface import HuggingFaceEmbeddings
+    import torch
+    if threads:
+        torch.set_num_threads(threads)
+    backends = {"torch": HuggingFaceEmbeddings(model_name=run.EMBEDDING_MODEL)}
+    backends["onnx"] = OnnxEmbeddings(model_dir, quantized=False, threads=threads)
+    backends["onnx-int8"] = OnnxEmbeddings(model_dir, quantized=True, threads=threads)
+    return backends
+
+
+def measure(embeddings, chunks, queries, k: int) -> dict:
+    embeddings.embed_query(queries[0])  # warm-up
+    latencies = []
+    query_vectors = []
+    for query in queries:
+        start = time.perf_counter()
+        query_vectors.append(embeddings.embed_query(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+    start = time.perf_counter()
+    chunk_vectors = np.asarray(embeddings.embed_documents(chunks), dtype=np.float32)
+    batch_s = time.perf_counter() - start
+    index = faiss.IndexFlatL2(chunk_vectors.shape[1])
+    index.add(chunk_vectors)
+    _, top_k = index.search(np.asarray(query_vectors, dtype=np.float32), k)
+    return {
+        "query_p50_ms": round(percentile(latencies, 50), 2),
+        "query_p99_ms": round(percentile(latencies, 99), 2),
+        "batch_chunks_per_s": round(len(chunks) / batch_s, 1),
+        "top_k": top_k,
+    }
+
+
+def run_benchmark(chunks: int = 2000, queries: int = 200, k: int = run.TOP_N, threads: int = 0,
+                  model_dir: str = ONNX_MODEL_PATH) -> dict:
+    texts = synthetic_chunks(chunks)
+    questions = [f"What happened in {1500 + i % 500}? ({i})" for i in range(queries)]
+    results = {"chunks": chunks, "queries": queries, "k": k, "threads": threads or "default"}
+    reference = None
+    for name, embeddings in create_backends(model_dir, threads).items():
+        row = measure(embeddings, texts, questions, k)
+        top_k = row.pop("top_k")
+        if reference is None:
+            reference = top_k
+        row[f"agreement@{k}"] = round(
+            sum(len(set(a) & set(b)) for a, b in zip(top_k, reference)) / reference.size, 4)
+        results[name] = row
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=run.TOP_N)
+    parser.add_argument("--threads", type=int, default=0, help="intra-op threads for both backends (0: default)")
+    parser.add_argument("--model-dir", default=ONNX_MODEL_PATH)
+    args = parser.parse_args()
+    print(json.dumps(run_benchmark(args.chunks, args.queries, args.k, args.threads, args.model_dir), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""FAISS index types: recall@k against the flat index, QPS, build time and index memory.
+
+Vectors are synthetic by default: clustered Gaussians with the MiniLM dimension,
+shifted by a shared ``--offset`` so that they are not centred on the origin, as
+sentence embeddings are not. ``mean_cosine`` reports how far off-centre a set is.
+Those numbers show how each index scales with corpus size, not retrieval quality
+on the history PDF. For real embeddings, pass ``--from-index`` with an ingested
+flat index: its vectors are the corpus, and ``--queries`` of them, held out, are
+the queries. 1M vectors need ~1.5 GB per copy; pass smaller ``--sizes`` on small
+machines.
+
+``memory_mb`` is the size of the saved index. ``scanned_mb`` is the part every
+query reads, which has to stay in memory for search to be fast. ``resident_mb``
+is the memory a fresh process holds after it memory-maps the saved index (as the
+API does) from a cold page cache and answers ``--resident-queries`` queries. The
+binary index maps only its bit codes: the rescored candidates' rows of its
+vectors file are read with ``pread``, so they pass through the page cache (which
+the kernel can drop under memory pressure) without being counted here.
+
+    python benchmarks/bench_faiss_indexes.py --sizes 10000 100000 1000000
+    python benchmarks/bench_faiss_indexes.py --from-index data/faiss_index/index.faiss
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+
+import faiss
+import numpy as np
+
+import faiss_indexes
+from benchmarks.common import EMBEDDING_DIM
+
+
+def synthetic_vectors(n: int, dim: int = EMBEDDING_DIM, clusters: int = 256, offset: float = 1.0,
+                      seed: int = 0) -> np.ndarray:
+    """Unit vectors scattered around random topic centres, roughly like sentence embeddings.
+
+    ``offset`` is the length of a shift shared by every vector before normalization; 0
+    leaves them centred on the origin, where sign bits split every dimension evenly.
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim), dtype=np.float32)
+    vectors = centres[rng.integers(0, clusters, n)] + 0.5 * rng.standard_normal((n, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    if offset:
+        shift = rng.standard_normal(dim, dtype=np.float32)
+        vectors += offset * shift / np.linalg.norm(shift)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def index_vectors(path: str, queries: int, seed: int = 0):
+    """The vectors of a saved index, split into a corpus and ``queries`` held-out query vectors."""
+    index = faiss.read_index(path)
+    vectors = index.reconstruct_n(0, index.ntotal)
+    held_out = np.random.default_rng(seed).permutation(len(vectors))
+    return vectors[held_out[queries:]], vectors[held_out[:queries]]
+
+
+def mean_cosine(vectors: np.ndarray, sample: int = 2000) -> float:
+    units = vectors[:sample] / np.linalg.norm(vectors[:sample], axis=1, keepdims=True)
+    return float(np.mean(units @ units.T))
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def time_search(index, queries: np.ndarray, k: int):
+    start = time.perf_counter()
+    _, found = index.search(queries, k)
+    return found, len(queries) / (time.perf_counter() - start)
+
+
+def resident_kb() -> int:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGESIZE') // 1024
+
+
+def scanned_bytes(index) -> int:
+    if isinstance(index, faiss_indexes.BinaryIndex):
+        return faiss_indexes.index_memory_bytes(index.codes)
+    return faiss_indexes.index_memory_bytes(index)
+
+
+def save_index_dir(index, directory: str):
+    """Save ``index`` as ``save_index`` in run.py lays it out: a binary index's vectors in a file of their own."""
+    if isinstance(index, faiss_indexes.BinaryIndex):
+        faiss.write_index(index.codes, os.path.join(directory, "index.faiss"))
+        index.save_vectors(os.path.join(directory, faiss_indexes.BINARY_VECTORS))
+    else:
+        faiss.write_index(index, os.path.join(directory, "index.faiss"))
+
+
+def measure_resident(index_dir: str, queries_path: str, k: int, nprobe: int, ef_search: int,
+                     rescore_factor: int) -> float:
+    # Runs in a child process, so only this index's pages are counted
+    query_vectors = np.load(queries_path)
+    # Start from a cold page cache, as a newly started pod would
+    for name in ("index.faiss", faiss_indexes.BINARY_VECTORS):
+        if os.path.exists(os.path.join(index_dir, name)):
+            fd = os.open(os.path.join(index_dir, name), os.O_RDONLY)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            os.close(fd)
+    before = resident_kb()
+    index = faiss_indexes.read_index_dir(index_dir)
+    faiss_indexes.set_search_params(index, nprobe, ef_search, rescore_factor)
+    for query in query_vectors:
+        index.search(query[None, :], k)
+    return round((resident_kb() - before) / 1024, 1)
+
+
+def resident_mb(index, query_vectors: np.ndarray, k: int, nprobe: int, ef_search: int, rescore_factor: int) -> float:
+    with tempfile.TemporaryDirectory() as directory:
+        index_dir, queries_path = os.path.join(directory, "index"), os.path.join(directory, "queries.npy")
+        os.mkdir(index_dir)
+        save_index_dir(index, index_dir)
+        np.save(queries_path, query_vectors)
+        args = [sys.executable, __file__, "--resident", index_dir, queries_path, "--k", str(k)]
+        for flag, value in (("--nprobe", nprobe), ("--ef-search", ef_search), ("--rescore-factor", rescore_factor)):
+            args += [flag, str(value)] if value else []
+        out = subprocess.run(args, capture_output=True, text=True, check=True)
+        return float(out.stdout.strip().splitlines()[-1])
+
+
+def run_benchmark(sizes=(10000, 100000, 1000000), index_types=faiss_indexes.INDEX_TYPES, queries: int = 1000,
+                  k: int = 5, nprobe: int = None, ef_search: int = None, rescore_factor: int = None,
+                  resident_queries: int = 100, offset: float = 1.0, from_index: str = None) -> list:
+    rows = []
+    for n in ([None] if from_index else sizes):
+        if from_index:
+            vectors, query_vectors = index_vectors(from_index, queries)
+            n = len(vectors)
+        else:
+            # Queries come from the same topic centres as the corpus
+            vectors = synthetic_vectors(n + queries, offset=offset)
+            vectors, query_vectors = vectors[:n], vectors[n:]
+        # Exact neighbours from a flat index are the reference for recall
+        _, truth = faiss_indexes.build_index("flat", vectors).search(query_vectors, k)
+        for index_type in index_types:
+            start = time.perf_counter()
+            index = faiss_indexes.build_index(index_type, vectors)
+            build_s = time.perf_counter() - start
+            faiss_indexes.set_search_params(index, nprobe, ef_search, rescore_factor)
+            found, qps = time_search(index, query_vectors, k)
+            rows.append({
+                "vectors": n,
+                "data": from_index or f"synthetic, offset {offset}",
+                "mean_cosine": round(mean_cosine(vectors), 3),
+                "index_type": faiss_indexes.index_type_of(index),
+                f"recall@{k}": round(recall_at_k(found, truth), 4),
+                "qps": round(qps, 1),
+                "build_s": round(build_s, 2),
+                "memory_mb": round(faiss_indexes.index_memory_bytes(index) / 2 ** 20, 1),
+                "scanned_mb": round(scanned_bytes(index) / 2 ** 20, 1),
+                "resident_mb": resident_mb(index, query_vectors[:resident_queries], k, nprobe, ef_search,
+                                           rescore_factor),
+            })
+            del index
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--index-types", nargs="+", choices=faiss_indexes.INDEX_TYPES,
+                        default=list(faiss_indexes.INDEX_TYPES))
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nprobe", type=int, help=f"default {faiss_indexes.FAISS_NPROBE}")
+    parser.add_argument("--ef-search", type=int, help=f"default {faiss_indexes.FAISS_EF_SEARCH}")
+    parser.add_argument("--rescore-factor", type=int, help=f"default {faiss_indexes.FAISS_RESCORE_FACTOR}")
+    parser.add_argument("--resident-queries", type=int, default=100, help="queries answered before measuring RSS")
+    parser.add_argument("--offset", type=float, default=1.0, help="shared shift of the synthetic vectors (0: centred)")
+    parser.add_argument("--from-index", help="measure on the vectors of this saved index instead of synthetic ones")
+    parser.add_argument("--resident", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.resident:
+        print(measure_resident(*args.resident, args.k, args.nprobe, args.ef_search, args.rescore_factor))
+        return
+    rows = run_benchmark(args.sizes, args.index_types, args.queries, args.k, args.nprobe, args.ef_search,
+                         args.rescore_factor, args.resident_queries, args.offset, args.from_index)
+    print(json.dumps(rows, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Retrieval quality and cost: vector-only vs. hybrid BM25 + vector retrieval fused with RRF.
+
+Questions ask about a rare number in the corpus ("What happened in 1898?"); a question
+counts as answered at top_n when a retrieved chunk contains that number. For each
+top_n the benchmark reports recall, prompt tokens (about 4 characters per token) and
+retrieval latency, plus the smallest top_n at which hybrid retrieval matches the
+recall vector search reaches at the default TOP_N. Uses the PDF's chunks when it has
+extractable text, else a synthetic corpus.
+
+    python benchmarks/bench_hybrid.py --queries 200
+    python benchmarks/bench_hybrid.py --fake-embeddings  # no model download; vectors carry no meaning
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import run
+from benchmarks.common import EMBEDDING_DIM, percentile, synthetic_chunks
+from bm25_index import BM25Index
+
+TOP_NS = (1, 2, 3, 5, 10)
+MAX_KEY_CHUNKS = 3  # a number in more chunks than this is too common to ask about
+
+
+def load_corpus(pdf_path: str, synthetic: int):
+    chunks = run.load_pdf_chunks(pdf_path) if os.path.exists(pdf_path) else []
+    if chunks:
+        return chunks, pdf_path
+    return synthetic_chunks(synthetic), "synthetic"
+
+
+def make_questions(chunks, n: int, seed: int = 0):
+    """(question, key) pairs for numbers that appear in at most MAX_KEY_CHUNKS chunks."""
+    frequency = Counter(key for chunk in chunks for key in set(re.findall(r"\b\d{2,4}\b", chunk)))
+    keys = sorted(key for key, count in frequency.items() if count <= MAX_KEY_CHUNKS)
+    random.Random(seed).shuffle(keys)
+    return [(f"What happened in {key}?", key) for key in keys[:n]]
+
+
+def measure(vectorstore, questions, query_embeddings, top_n: int) -> dict:
+    hits, tokens, latencies = 0, 0, []
+    for (question, key), embedding in zip(questions, query_embeddings):
+        start = time.perf_counter()
+        retrieved = run.retrieve_chunks(vectorstore, question, top_n, query_embedding=embedding)
+        latencies.append((time.perf_counter() - start) * 1000)
+        chunks = [chunk for chunk, _ in retrieved]
+        hits += any(re.search(rf"\b{key}\b", chunk) for chunk in chunks)
+        tokens += len(run.build_prompt(run.build_context(chunks), question)) // 4
+    return {
+        "recall": round(hits / len(questions), 4),
+        "prompt_tokens": round(tokens / len(questions), 1),
+        "retrieve_p50_ms": round(percentile(latencies, 50), 3),
+    }
+
+
+def run_benchmark(queries: int = 200, fake_embeddings: bool = False, pdf_path: str = run.PDF_PATH,
+                  synthetic: int = 5000) -> dict:
+    chunks, corpus = load_corpus(pdf_path, synthetic)
+    questions = make_questions(chunks, queries)
+    embeddings = DeterministicFakeEmbedding(size=EMBEDDING_DIM) if fake_embeddings else run._create_embedding_model()
+    vectorstore = FAISS.from_texts(chunks, embeddings)
+    start = time.perf_counter()
+    vectorstore.lexical_index = BM25Index.build(chunks)
+    bm25_build_s = time.perf_counter() - start
+    query_embeddings = [embeddings.embed_query(question) for question, _ in questions]
+
+    results = {"corpus": corpus, "chunks": len(chunks), "queries": len(questions),
+               "bm25_build_s": round(bm25_build_s, 3)}
+    for mode, hybrid in (("vector", False), ("hybrid", True)):
+        with patch.object(run, "HYBRID_RETRIEVAL", hybrid):
+            results[mode] = {f"top_{n}": measure(vectorstore, questions, query_embeddings, n) for n in TOP_NS}
+    target = results["vector"][f"top_{run.TOP_N}"]["recall"] if run.TOP_N in TOP_NS else None
+    if target is not None:
+        matching = [n for n in TOP_NS if results["hybrid"][f"top_{n}"]["recall"] >= target]
+        results[f"hybrid_top_n_matching_vector_top_{run.TOP_N}"] = matching[0] if matching else None
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--fake-embeddings", action="store_true", help="use a cheap random embedding instead of the model")
+    parser.add_argument("--pdf", default=run.PDF_PATH)
+    parser.add_argument("--synthetic", type=int, default=5000, help="synthetic chunks when the PDF is missing")
+    args = parser.parse_args()
+    print(json.dumps(run_benchmark(args.queries, args.fake_embeddings, args.pdf, args.synthetic), indent=2))
+
+
+if __name__ == "__main__":
+    main()
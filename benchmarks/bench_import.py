@@ -0,0 +1,97 @@
+"""Import time of run and app_api, and API start-up time until /health stops reporting "warming".
+
+Every measurement runs in a fresh interpreter. Start-up loads a saved synthetic index;
+by default the embedding model is a cheap fake, so "ready" measures only the work the
+API does itself. Pass ``--real-model`` to warm up all-MiniLM-L6-v2 (needs
+sentence-transformers).
+
+    python benchmarks/bench_import.py --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+sys.path.insert(0, ROOT)
+
+HEAVY_MODULES = ("fitz", "langchain_openai", "langchain_huggingface", "langchain_text_splitters",
+                 "sentence_transformers", "torch")
+
+
+def child_import(module: str) -> dict:
+    start = time.perf_counter()
+    __import__(module)
+    return {"import_s": time.perf_counter() - start,
+            "heavy_modules": [name for name in HEAVY_MODULES if name in sys.modules]}
+
+
+def child_startup(directory: str, real_model: bool) -> dict:
+    start = time.perf_counter()
+    import app_api
+    import run
+    run.INDEX_PATH = os.path.join(directory, 'faiss_index')
+    run.CHUNKS_PATH = os.path.join(directory, 'chunks')
+    run.BM25_PATH = os.path.join(directory, 'bm25')
+    run.EMBEDDING_CACHE_PATH = os.path.join(directory, 'embeddings.sqlite')
+    if not real_model:
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        from benchmarks.common import EMBEDDING_DIM
+        run._create_embedding_model = lambda: DeterministicFakeEmbedding(size=EMBEDDING_DIM)
+    app_api.load_index_on_startup()
+    serving_s = time.perf_counter() - start
+    while app_api.health()["status"] == "warming":
+        time.sleep(0.005)
+    return {"serving_s": serving_s, "ready_s": time.perf_counter() - start}
+
+
+def _run_child(*args) -> dict:
+    output = subprocess.run([sys.executable, __file__, *args], cwd=ROOT, capture_output=True, text=True, check=True)
+    # The result is the last line; importing PyMuPDF may print a warning first
+    return json.loads(output.stdout.splitlines()[-1])
+
+
+def run_benchmark(repeat: int = 5, chunks: int = 20000, real_model: bool = False) -> dict:
+    import run
+    from benchmarks.common import build_fake_vectorstore
+
+    results = {}
+    for module in ("run", "app_api"):
+        rows = [_run_child("--child-import", module) for _ in range(repeat)]
+        results[f"import_{module}_s"] = round(statistics.median(row["import_s"] for row in rows), 3)
+        results[f"import_{module}_heavy_modules"] = rows[0]["heavy_modules"]
+    with tempfile.TemporaryDirectory() as directory:
+        run.INDEX_PATH = os.path.join(directory, 'faiss_index')
+        run.CHUNKS_PATH = os.path.join(directory, 'chunks')
+        run.BM25_PATH = os.path.join(directory, 'bm25')
+        run.save_index(build_fake_vectorstore(chunks))
+        args = ["--child-startup", directory] + (["--real-model"] if real_model else [])
+        rows = [_run_child(*args) for _ in range(repeat)]
+    results["chunks"] = chunks
+    results["startup_serving_s"] = round(statistics.median(row["serving_s"] for row in rows), 3)
+    results["startup_ready_s"] = round(statistics.median(row["ready_s"] for row in rows), 3)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--real-model", action="store_true", help="warm up all-MiniLM-L6-v2")
+    parser.add_argument("--child-import", help=argparse.SUPPRESS)
+    parser.add_argument("--child-startup", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child_import:
+        print(json.dumps(child_import(args.child_import)))
+    elif args.child_startup:
+        print(json.dumps(child_startup(args.child_startup, args.real_model)))
+    else:
+        print(json.dumps(run_benchmark(args.repeat, args.chunks, args.real_model), indent=2))
+
+
+if __name__ == "__main__":
+    main()
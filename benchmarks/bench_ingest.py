@@ -0,0 +1,88 @@
+"""PDF ingestion: pages/sec and peak RSS of the old concatenate-then-split loader vs. the streaming pipeline.
+
+Each mode runs in a fresh subprocess on the same synthetic PDF so peak RSS is
+measured independently (worker processes are included via RUSAGE_CHILDREN).
+
+    python benchmarks/bench_ingest.py --pages 2000 --workers 4
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+
+import fitz  # PyMuPDF
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+import run
+from benchmarks.common import TOPICS
+
+
+def make_pdf(path: str, pages: int):
+    doc = fitz.open()
+    paragraph = " ".join(TOPICS)
+    for i in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(page.rect + (36, 36, -36, -36), f"Page {i + 1}. " + paragraph * 2, fontsize=9)
+    doc.save(path)
+    doc.close()
+
+
+def legacy_load_pdf_chunks(pdf_path: str):
+    """load_pdf_chunks before the streaming pipeline: one big string, split in one pass."""
+    doc = fitz.open(pdf_path)
+    text = ""
+    for page in doc:
+        text += page.get_text()
+    splitter = RecursiveCharacterTextSplitter(chunk_size=run.CHUNK_SIZE, chunk_overlap=run.CHUNK_OVERLAP)
+    return splitter.split_text(text)
+
+
+def measure(mode: str, pdf_path: str, workers: int) -> dict:
+    start = time.perf_counter()
+    if mode == "legacy":
+        chunks = len(legacy_load_pdf_chunks(pdf_path))
+    else:
+        # Consume in embedding-sized batches, as build_or_load_index does
+        chunks = sum(len(batch) for batch in run.iter_batches(run.iter_pdf_chunks(pdf_path, workers=workers)))
+    elapsed = time.perf_counter() - start
+    peak_kb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return {"mode": mode, "workers": workers, "chunks": chunks, "seconds": round(elapsed, 3),
+            "peak_rss_mb": round(peak_kb / 1024, 1)}
+
+
+def run_benchmark(pages: int = 2000, workers: int = run.INGEST_WORKERS) -> dict:
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = os.path.join(tmp, "synthetic.pdf")
+        make_pdf(pdf_path, pages)
+        for mode, n in (("legacy", 1), ("pipeline", 1), ("pipeline", workers)):
+            out = subprocess.run([sys.executable, __file__, "--measure", mode, "--pdf", pdf_path, "--workers", str(n)],
+                                 capture_output=True, text=True, check=True)
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            result["pages_per_sec"] = round(pages / result["seconds"], 1)
+            results.append(result)
+    return {"pages": pages, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=run.INGEST_WORKERS)
+    parser.add_argument("--measure", choices=["legacy", "pipeline"], help=argparse.SUPPRESS)
+    parser.add_argument("--pdf", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.pdf, args.workers)))
+        return
+    print(json.dumps(run_benchmark(args.pages, args.workers), indent=2))
+
+
+if __name__ == "__main__":
+    main()
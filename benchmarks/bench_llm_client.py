@@ -0,0 +1,67 @@
+"""Per-request latency of ask_llm with a fresh client per call vs. the pooled client.
+
+Runs against a local fake OpenAI endpoint, so the numbers isolate client
+construction and connection setup from model latency.
+
+    python benchmarks/bench_llm_client.py --requests 200
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+os.environ.setdefault("TEAMIFIED_OPENAI_API_KEY", "sk-local-benchmark")
+
+import run
+from benchmarks.common import percentile
+from benchmarks.fake_llm import start_fake_llm
+
+CONTEXT = '- "The EDSA People Power Revolution occurred in February 1986..."'
+QUESTION = "When did EDSA happen?"
+
+
+def _summary(latencies):
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "mean_ms": round(statistics.mean(ordered) * 1000, 3),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+    }
+
+
+def run_benchmark(requests: int = 200, delay: float = 0.0) -> dict:
+    server, base_url = start_fake_llm(delay=delay)
+    try:
+        fresh = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            llm = run.create_llm(base_url=base_url)
+            run.ask_llm(CONTEXT, QUESTION, llm=llm)
+            fresh.append(time.perf_counter() - start)
+            llm.root_client.close()
+
+        pooled_llm = run.create_llm(base_url=base_url)
+        pooled = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            run.ask_llm(CONTEXT, QUESTION, llm=pooled_llm)
+            pooled.append(time.perf_counter() - start)
+    finally:
+        server.shutdown()
+    return {"fresh_client_per_request": _summary(fresh), "pooled_client": _summary(pooled)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--delay", type=float, default=0.0, help="fake LLM latency in seconds")
+    args = parser.parse_args()
+    print(json.dumps(run_benchmark(args.requests, args.delay), indent=2))
+
+
+if __name__ == "__main__":
+    main()
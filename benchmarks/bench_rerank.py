@@ -0,0 +1,98 @@
+"""Cross-encoder reranking: added retrieval latency vs. LLM prompt time saved.
+
+Questions ask about a rare number in the corpus ("What happened in 1898?"). Each is
+answered from the plain hybrid top_n and from the reranked RERANK_TOP_N, and the
+benchmark reports rerank latency (cold and with the score cache warm), prompt tokens,
+how often the number is still in the prompt, and the LLM time the smaller prompt saves
+at ``--ms-per-prompt-token`` (prompt processing time of the hosted model).
+
+    python benchmarks/bench_rerank.py --queries 100
+    python benchmarks/bench_rerank.py --fake-embeddings --fake-reranker  # no model downloads
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import context_builder
+import run
+from benchmarks.bench_context import load_corpus
+from benchmarks.bench_hybrid import make_questions
+from benchmarks.common import EMBEDDING_DIM, percentile
+from bm25_index import BM25Index, tokenize
+from reranker import RERANK_TOP_N, CrossEncoderReranker
+
+
+class OverlapModel:
+    """Cheap cross-encoder stand-in: scores a pair by the query words the chunk contains."""
+
+    def predict(self, pairs, batch_size=32):
+        return [float(len(set(tokenize(query)) & set(tokenize(chunk)))) for query, chunk in pairs]
+
+
+def measure(vectorstore, questions, top_n: int) -> dict:
+    tokens, hits, latencies = 0, 0, []
+    for question, key in questions:
+        start = time.perf_counter()
+        chunks = [chunk for chunk, _ in run.retrieve_chunks(vectorstore, question, top_n)]
+        latencies.append((time.perf_counter() - start) * 1000)
+        prompt = run.build_prompt(run.build_context(chunks), question)
+        tokens += context_builder.count_tokens(prompt)
+        hits += bool(re.search(rf"\b{key}\b", prompt))
+    return {
+        "prompt_tokens": round(tokens / len(questions), 1),
+        "recall": round(hits / len(questions), 4),
+        "retrieve_p50_ms": round(percentile(latencies, 50), 3),
+        "retrieve_p99_ms": round(percentile(latencies, 99), 3),
+    }
+
+
+def run_benchmark(queries: int = 100, fake_embeddings: bool = False, fake_reranker: bool = False,
+                  pdf_path: str = run.PDF_PATH, pages: int = 400, ms_per_prompt_token: float = 0.2) -> dict:
+    chunks, corpus = load_corpus(pdf_path, pages)
+    questions = make_questions(chunks, queries)
+    embeddings = DeterministicFakeEmbedding(size=EMBEDDING_DIM) if fake_embeddings else run._create_embedding_model()
+    vectorstore = FAISS.from_texts(chunks, embeddings)
+    vectorstore.lexical_index = BM25Index.build(chunks)
+    reranker = CrossEncoderReranker(model=OverlapModel() if fake_reranker else None)
+    vectorstore.reranker = reranker
+    reranker.warm_up()
+
+    results = {"corpus": corpus, "chunks": len(chunks), "queries": len(questions), "top_n": run.TOP_N,
+               "rerank_top_n": RERANK_TOP_N, "reranker": "overlap" if fake_reranker else reranker.model_name}
+    results["baseline"] = measure(vectorstore, questions, run.TOP_N)
+    with patch.object(run, "RERANKING", True):
+        results["reranked_cold"] = measure(vectorstore, questions, run.TOP_N)
+        results["reranked_cached"] = measure(vectorstore, questions, run.TOP_N)
+    results["rerank_stats"] = reranker.stats()
+    added_ms = results["reranked_cold"]["retrieve_p50_ms"] - results["baseline"]["retrieve_p50_ms"]
+    saved_ms = (results["baseline"]["prompt_tokens"] - results["reranked_cold"]["prompt_tokens"]) * ms_per_prompt_token
+    results["rerank_added_p50_ms"] = round(added_ms, 3)
+    results["llm_prompt_ms_saved"] = round(saved_ms, 3)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--fake-embeddings", action="store_true", help="use a cheap random embedding instead of the model")
+    parser.add_argument("--fake-reranker", action="store_true", help="score by word overlap instead of the cross-encoder")
+    parser.add_argument("--pdf", default=run.PDF_PATH)
+    parser.add_argument("--pages", type=int, default=400, help="synthetic pages when the PDF has no text")
+    parser.add_argument("--ms-per-prompt-token", type=float, default=0.2,
+                        help="LLM prompt processing time per token, for the time saved")
+    args = parser.parse_args()
+    print(json.dumps(run_benchmark(args.queries, args.fake_embeddings, args.fake_reranker, args.pdf, args.pages,
+                                   args.ms_per_prompt_token), indent=2))
+
+
+if __name__ == "__main__":
+    main()
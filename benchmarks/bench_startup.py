@@ -0,0 +1,99 @@
+"""Index load time and per-worker memory: pickled index and chunk list vs. memory-mapped files.
+
+Saves a synthetic corpus in both layouts, then starts ``--workers`` processes per
+layout at once, as uvicorn workers would, each loading the index and running a few
+searches. RssAnon is memory private to a worker; RssFile is mapped file pages,
+which workers share through the OS page cache. Linux only (reads /proc).
+
+    python benchmarks/bench_startup.py --chunks 200000 --workers 4
+"""
+import argparse
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import run
+from benchmarks.common import EMBEDDING_DIM, build_fake_vectorstore
+
+
+def memory_kb() -> dict:
+    fields = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('VmRSS', 'RssAnon', 'RssFile'):
+                fields[key] = int(value.split()[0])
+    return fields
+
+
+def child(layout: str, directory: str) -> dict:
+    embeddings = DeterministicFakeEmbedding(size=EMBEDDING_DIM)
+    run.INDEX_PATH = os.path.join(directory, 'faiss_index')
+    run.CHUNKS_PATH = os.path.join(directory, 'chunks')
+    run.BM25_PATH = os.path.join(directory, 'bm25')
+    before = memory_kb()
+    start = time.perf_counter()
+    if layout == 'pickle':
+        vectorstore = FAISS.load_local(run.INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
+        with open(os.path.join(directory, 'chunks.pkl'), 'rb') as f:
+            pickle.load(f)
+    else:
+        vectorstore = run.load_mapped_index(embeddings)
+    load_s = time.perf_counter() - start
+    queries = np.random.default_rng(0).standard_normal((20, EMBEDDING_DIM)).astype(np.float32)
+    run.retrieve_chunks_batch(vectorstore, [''] * len(queries), query_embeddings=queries)
+    after = memory_kb()
+    return {"load_s": load_s, **{key: after[key] - before[key] for key in after}}
+
+
+def run_benchmark(chunks: int = 200000, workers: int = 4) -> dict:
+    results = {"chunks": chunks, "workers": workers}
+    with tempfile.TemporaryDirectory() as directory:
+        run.INDEX_PATH = os.path.join(directory, 'faiss_index')
+        run.CHUNKS_PATH = os.path.join(directory, 'chunks')
+        run.BM25_PATH = os.path.join(directory, 'bm25')
+        vectorstore = build_fake_vectorstore(chunks)
+        # save_index writes both layouts' index files; add the old pickled chunk list
+        texts = run.save_index(vectorstore)
+        with open(os.path.join(directory, 'chunks.pkl'), 'wb') as f:
+            pickle.dump(texts, f)
+        del vectorstore, texts
+
+        for layout in ('pickle', 'mmap'):
+            procs = [subprocess.Popen([sys.executable, __file__, '--child', layout, '--dir', directory],
+                                      stdout=subprocess.PIPE, text=True) for _ in range(workers)]
+            # The result is the last line; importing PyMuPDF may print a warning first
+            rows = [json.loads(proc.communicate()[0].splitlines()[-1]) for proc in procs]
+            results[layout] = {
+                "load_s": round(max(row["load_s"] for row in rows), 3),
+                **{f"{key}_mb": round(sum(row[key] for row in rows) / len(rows) / 1024, 1)
+                   for key in ('VmRSS', 'RssAnon', 'RssFile')},
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=200000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--child", choices=("pickle", "mmap"), help=argparse.SUPPRESS)
+    parser.add_argument("--dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(child(args.child, args.dir)))
+        return
+    print(json.dumps(run_benchmark(args.chunks, args.workers), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""End-to-end benchmark suite: every pipeline stage, compared against a stored baseline.
+
+Stages: PDF extraction and chunking (``load_pdf_chunks``), embedding throughput, index
+build and load (``build_or_load_index``), ``retrieve_chunks`` latency at several corpus
+sizes, and ``/query`` under concurrency against the local fake LLM. Every input is
+synthetic and generated the same way on each run. Each timing is the median of
+``--repeat`` runs.
+
+Results are flat ``stage.metric`` values. A metric ending in ``_ms`` or ``_s`` should
+go down, one ending in ``_per_s`` should go up, and failed requests (``errors``) should
+stay at the baseline's count. Any other metric is informational, and so are p99
+latencies, which vary too much from run to run to gate on. A metric that is worse than
+the baseline by more than ``--tolerance`` counts as a regression, and the exit status
+is then 1. A baseline is only compared with results from the same configuration. On a
+machine with another CPU count or CPU model the timings are not comparable either: a
+warning is printed and only the error counts are checked.
+
+    python benchmarks/bench_suite.py                   # compare with benchmarks/baseline.json
+    python benchmarks/bench_suite.py --save-baseline   # record a new baseline on this machine
+    python benchmarks/bench_suite.py --real-model      # embed with MiniLM instead of the fake embedding
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+os.environ.setdefault("TEAMIFIED_OPENAI_API_KEY", "sk-local-benchmark")
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import app_api
+import run
+from benchmarks.bench_async_query import drive
+from benchmarks.bench_ingest import make_pdf
+from benchmarks.common import EMBEDDING_DIM, TOPICS, percentile, serve_app, synthetic_chunks
+from benchmarks.fake_llm import start_fake_llm
+from bm25_index import BM25Index
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+LOWER_IS_BETTER = ("_ms", "_s")
+HIGHER_IS_BETTER = ("_per_s",)
+INFORMATIONAL = ("p99_ms",)
+MIN_COMPARED_MS = 0.1  # latency changes smaller than this are timer noise, whatever the ratio
+MACHINE_KEYS = ("cpus", "cpu_model")  # timings are only compared with a baseline from the same hardware
+
+
+def median_seconds(func, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def cpu_model() -> str:
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def embedding_model(real_model: bool):
+    return run._create_embedding_model() if real_model else DeterministicFakeEmbedding(size=EMBEDDING_DIM)
+
+
+def questions(n: int):
+    return [f"What happened in {TOPICS[i % len(TOPICS)].split(' in ')[-1].rstrip('.')}? ({i})" for i in range(n)]
+
+
+def bench_chunking(directory: str, pages: int, repeat: int) -> dict:
+    pdf_path = os.path.join(directory, "suite.pdf")
+    make_pdf(pdf_path, pages)
+    chunks = run.load_pdf_chunks(pdf_path)
+    seconds = median_seconds(lambda: run.load_pdf_chunks(pdf_path), repeat)
+    return {"pages": pages, "chunks": len(chunks), "total_s": round(seconds, 4),
+            "pages_per_s": round(pages / seconds, 1)}
+
+
+def bench_embedding(embeddings, n_chunks: int, n_queries: int, repeat: int) -> dict:
+    chunks = synthetic_chunks(n_chunks)
+    seconds = median_seconds(lambda: embeddings.embed_documents(chunks), repeat)
+    latencies = []
+    for question in questions(n_queries):
+        start = time.perf_counter()
+        embeddings.embed_query(question)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {"chunks": n_chunks, "chunks_per_s": round(n_chunks / seconds, 1),
+            "query_p50_ms": round(percentile(latencies, 50), 3)}
+
+
+def bench_index(directory: str, pages: int, embeddings, repeat: int) -> dict:
+    pdf_path = os.path.join(directory, "index.pdf")
+    make_pdf(pdf_path, pages)
+    with patch.object(run, "PDF_PATH", pdf_path), \
+            patch.object(run, "INDEX_PATH", os.path.join(directory, "faiss_index")), \
+            patch.object(run, "CHUNKS_PATH", os.path.join(directory, "chunks")), \
+            patch.object(run, "BM25_PATH", os.path.join(directory, "bm25")), \
+            patch.object(run, "MANIFEST_PATH", os.path.join(directory, "index_manifest.json")), \
+            patch.object(run, "COLLECTIONS_PATH", os.path.join(directory, "collections")), \
+            patch.object(run, "EMBEDDING_CACHE_PATH", os.path.join(directory, "embeddings.sqlite")), \
+            patch.object(run, "_create_embedding_model", return_value=embeddings), \
+            patch.object(run, "INDEX_DEDUP_SIMILARITY", 0.0), \
+            contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        _, chunks = run.build_or_load_index()
+        build = time.perf_counter() - start
+        load = median_seconds(run.build_or_load_index, repeat)
+    return {"chunks": len(chunks), "build_s": round(build, 4), "load_ms": round(load * 1000, 3)}
+
+
+def hybrid_vectorstore(n_chunks: int, embeddings):
+    chunks = synthetic_chunks(n_chunks)
+    vectorstore = FAISS.from_texts(chunks, embeddings)
+    vectorstore.lexical_index = BM25Index.build(chunks)
+    return vectorstore
+
+
+def bench_retrieval(sizes, n_queries: int, embeddings) -> dict:
+    """``retrieve_chunks`` with precomputed query embeddings, so only search is timed."""
+    queries = questions(n_queries)
+    query_embeddings = np.asarray(embeddings.embed_documents(queries), dtype=np.float32)
+    results = {}
+    for size in sizes:
+        vectorstore = hybrid_vectorstore(size, embeddings)
+        latencies = []
+        for query, embedding in zip(queries, query_embeddings):
+            start = time.perf_counter()
+            run.retrieve_chunks(vectorstore, query, run.TOP_N, query_embedding=embedding)
+            latencies.append((time.perf_counter() - start) * 1000)
+        results[f"{size}.p50_ms"] = round(percentile(latencies, 50), 3)
+        results[f"{size}.p99_ms"] = round(percentile(latencies, 99), 3)
+    return results
+
+
+def bench_query(concurrency, requests: int, llm_delay: float, n_chunks: int, embeddings) -> dict:
+    llm_server, llm_url = start_fake_llm(delay=llm_delay)
+    run._llm = run.create_llm(pool_size=max(concurrency), base_url=llm_url)
+    app_api.vectorstore = hybrid_vectorstore(n_chunks, embeddings)
+    app_api.shards = {}
+    server, url = serve_app(app_api.app)
+    results = {}
+    try:
+        for c in concurrency:
+            app_api.answer_cache.clear()
+            measured = asyncio.run(drive(url, c, requests))
+            results[f"c{c}.requests_per_s"] = measured["rps"]
+            results[f"c{c}.p50_ms"] = measured["p50_ms"]
+            results[f"c{c}.p99_ms"] = measured["p99_ms"]
+            results[f"c{c}.errors"] = measured["errors"]
+    finally:
+        server.should_exit = True
+        llm_server.shutdown()
+    return results
+
+
+def compare(metrics: dict, baseline: dict, tolerance: float, timings: bool = True) -> list:
+    """Metrics worse than ``baseline`` by more than ``tolerance`` (a fraction of the baseline value).
+
+    With ``timings`` false only the error counts are compared.
+    """
+    regressions = []
+    for key, value in metrics.items():
+        base = baseline.get(key)
+        if key.endswith(".errors") and value > (base or 0):
+            regressions.append({"metric": key, "baseline": base, "value": value})
+            continue
+        if not timings or not base or key.endswith(INFORMATIONAL):
+            continue
+        if key.endswith(HIGHER_IS_BETTER):
+            change = (base - value) / base
+        elif key.endswith(LOWER_IS_BETTER):
+            change = (value - base) / base
+            slower_ms = (value - base) * (1 if key.endswith("_ms") else 1000)
+            if slower_ms < MIN_COMPARED_MS:
+                continue
+        else:
+            continue
+        if change > tolerance:
+            regressions.append({"metric": key, "baseline": base, "value": value, "worse_by": round(change, 3)})
+    return regressions
+
+
+def run_suite(real_model: bool = False, pages: int = 200, embed_chunks: int = 2000,
+              sizes=(1000, 10000, 50000), queries: int = 200, concurrency=(1, 16, 64), requests: int = 400,
+              llm_delay: float = 0.02, repeat: int = 3) -> dict:
+    config = {"real_model": real_model, "pages": pages, "embed_chunks": embed_chunks, "sizes": list(sizes),
+              "queries": queries, "concurrency": list(concurrency), "requests": requests,
+              "llm_delay_s": llm_delay, "repeat": repeat}
+    embeddings = embedding_model(real_model)
+    metrics = {}
+
+    def add(stage, results):
+        metrics.update({f"{stage}.{key}": value for key, value in results.items()})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        add("chunking", bench_chunking(tmp, pages, repeat))
+        add("embedding", bench_embedding(embeddings, embed_chunks, queries, repeat))
+        add("index", bench_index(tmp, pages, embeddings, repeat))
+    add("retrieval", bench_retrieval(sizes, queries, embeddings))
+    add("query", bench_query(concurrency, requests, llm_delay, min(sizes), embeddings))
+    return {"config": config, "machine": {"python": platform.python_version(), "cpus": os.cpu_count(),
+                                          "cpu_model": cpu_model(), "platform": platform.platform()}, "metrics": metrics}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--real-model", action="store_true", help="embed with MiniLM instead of the fake embedding")
+    parser.add_argument("--pages", type=int, default=200, help="synthetic PDF pages for chunking and index build")
+    parser.add_argument("--embed-chunks", type=int, default=2000)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000],
+                        help="corpus sizes (chunks) for retrieval latency")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--requests", type=int, default=400, help="/query requests per concurrency level")
+    parser.add_argument("--llm-delay", type=float, default=0.02, help="fake LLM latency in seconds")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown as a fraction of the baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results to --baseline")
+    args = parser.parse_args()
+    results = run_suite(args.real_model, args.pages, args.embed_chunks, args.sizes, args.queries, args.concurrency,
+                        args.requests, args.llm_delay, args.repeat)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("config") == results["config"]:
+            base_machine = baseline.get("machine", {})
+            same_machine = all(base_machine.get(key) == results["machine"][key] for key in MACHINE_KEYS)
+            if not same_machine:
+                print(f"warning: the baseline was recorded on another machine "
+                      f"({', '.join(f'{key}={base_machine.get(key)}' for key in MACHINE_KEYS)}); "
+                      f"timing thresholds are skipped and only error counts are compared. "
+                      f"Record a baseline here with --save-baseline.", file=sys.stderr)
+            results["regressions"] = compare(results["metrics"], baseline["metrics"], args.tolerance,
+                                             timings=same_machine)
+        else:
+            results["regressions"] = None  # not comparable: the baseline was run with other settings
+    print(json.dumps(results, indent=2))
+    if results.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Multi-worker serving: total memory and start-up time of serve.py with and without preload.
+
+Each run starts ``python serve.py`` with N workers over a synthetic memory-mapped index.
+It measures start-up as the time until every worker has started and /health answers
+``ok``. It then reports the RSS and PSS summed over the parent and all workers. RSS
+counts a shared page once per process. PSS splits each shared page among the processes
+that map it, so total PSS is the memory the node actually spends. Linux only (reads
+/proc).
+
+Without ``--real-model`` the embedding model is a deterministic stand-in that holds a
+MiniLM-sized (~92 MB) weight matrix. Its weights are then shared, or copied per worker,
+the way the real model's would be.
+
+    python benchmarks/bench_workers.py --workers 1 4 8
+    python benchmarks/bench_workers.py --real-model    # needs the model downloaded
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+ROOT = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+sys.path.insert(0, ROOT)
+
+import httpx
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from benchmarks.common import EMBEDDING_DIM
+
+MODEL_ROWS = 60000  # 60000 x 384 float32 is about the size of all-MiniLM-L6-v2's weights
+
+
+class WeightedFakeEmbedding(Embeddings):
+    """Deterministic bag-of-words embedding over a MiniLM-sized random weight matrix."""
+
+    def __init__(self, rows: int = MODEL_ROWS, dim: int = EMBEDDING_DIM):
+        self.weights = np.random.default_rng(0).standard_normal((rows, dim), dtype=np.float32)
+
+    def _embed(self, text: str):
+        ids = [zlib.crc32(word.encode("utf-8")) % len(self.weights) for word in text.lower().split()] or [0]
+        vector = self.weights[ids].sum(axis=0)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def configure(directory: str, real_model: bool):
+    import run
+    run.INDEX_PATH = os.path.join(directory, 'faiss_index')
+    run.CHUNKS_PATH = os.path.join(directory, 'chunks')
+    run.BM25_PATH = os.path.join(directory, 'bm25')
+    run.MANIFEST_PATH = os.path.join(directory, 'index_manifest.json')
+    run.COLLECTIONS_PATH = os.path.join(directory, 'collections')
+    run.EMBEDDING_CACHE_PATH = os.path.join(directory, 'embeddings.sqlite')
+    if not real_model:
+        run._create_embedding_model = WeightedFakeEmbedding
+
+
+def child_serve(directory: str, real_model: bool, workers: int, port: int, preload: bool):
+    configure(directory, real_model)
+    import serve
+    serve.serve(workers, "127.0.0.1", port, preload, log_level="info")
+
+
+def memory_kb(pid: int) -> dict:
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('Rss', 'Pss'):
+                fields[key] = int(value.split()[0])
+    return fields
+
+
+def process_tree(pid: int) -> list:
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [pid] + [int(child) for child in f.read().split()]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure(directory: str, workers: int, preload: bool, real_model: bool, timeout: float = 300) -> dict:
+    port = free_port()
+    args = [sys.executable, __file__, '--child', directory, '--port', str(port), '--workers', str(workers)]
+    args += (['--preload'] if preload else []) + (['--real-model'] if real_model else [])
+    start = time.perf_counter()
+    proc = subprocess.Popen(args, cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    started = threading.Semaphore(0)
+
+    def read_log():
+        for line in proc.stdout:
+            if "Application startup complete" in line:
+                started.release()
+    threading.Thread(target=read_log, daemon=True).start()
+    try:
+        for _ in range(workers):
+            if not started.acquire(timeout=timeout):
+                raise RuntimeError(f"{workers} workers did not start within {timeout}s")
+        # Each worker warms up its model in the background; wait until new connections,
+        # spread over the workers by the kernel, keep finding them ready
+        ready_in_a_row = 0
+        while ready_in_a_row < 4 * workers:
+            status = httpx.get(f"http://127.0.0.1:{port}/health", headers={"Connection": "close"}).json()["status"]
+            ready_in_a_row = ready_in_a_row + 1 if status == "ok" else 0
+            if not ready_in_a_row:
+                time.sleep(0.01)
+        startup_s = time.perf_counter() - start
+        rows = [memory_kb(pid) for pid in process_tree(proc.pid)]
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=60)
+    return {"workers": workers, "preload": preload, "startup_s": round(startup_s, 2),
+            "total_rss_mb": round(sum(row["Rss"] for row in rows) / 1024, 1),
+            "total_pss_mb": round(sum(row["Pss"] for row in rows) / 1024, 1)}
+
+
+def run_benchmark(workers=(1, 4, 8), chunks: int = 20000, real_model: bool = False) -> dict:
+    import run
+    from benchmarks.common import build_fake_vectorstore
+    results = {"chunks": chunks, "model": "all-MiniLM-L6-v2" if real_model else "weighted-fake", "runs": []}
+    with tempfile.TemporaryDirectory() as directory:
+        configure(directory, real_model)
+        run.save_index(build_fake_vectorstore(chunks))
+        for n in workers:
+            for preload in (False, True):
+                results["runs"].append(measure(directory, n, preload, real_model))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--real-model", action="store_true")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--preload", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child_serve(args.child, args.real_model, args.workers[0], args.port, args.preload)
+        return
+    print(json.dumps(run_benchmark(args.workers, args.chunks, args.real_model), indent=2))
+
+
+if __name__ == "__main__":
+    main()
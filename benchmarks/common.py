@@ -0,0 +1,51 @@
+"""Shared helpers for the benchmarks: synthetic corpora and in-process servers."""
+import threading
+import time
+
+import uvicorn
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+EMBEDDING_DIM = 384  # same as all-MiniLM-L6-v2
+
+TOPICS = [
+    "The EDSA People Power Revolution took place in February 1986 and ended the Marcos regime.",
+    "José Rizal was executed in Bagumbayan on December 30, 1896.",
+    "The Battle of Mactan in 1521 saw Lapulapu defeat Ferdinand Magellan.",
+    "Philippine independence from Spain was declared in Kawit, Cavite on June 12, 1898.",
+    "The Katipunan was founded by Andres Bonifacio in 1892.",
+    "Japan invaded the Philippines in December 1941 during World War II.",
+    "The Commonwealth of the Philippines was established in 1935 under Manuel L. Quezon.",
+    "Miguel López de Legazpi founded the first Spanish settlement in Cebu in 1565.",
+]
+
+
+def synthetic_chunks(n: int):
+    """Deterministic chunk texts that look like the history corpus."""
+    return [f"{TOPICS[i % len(TOPICS)]} (section {i})" for i in range(n)]
+
+
+def build_fake_vectorstore(n_chunks: int = 1000):
+    """LangChain FAISS store over synthetic chunks with a cheap deterministic embedding."""
+    return FAISS.from_texts(synthetic_chunks(n_chunks), DeterministicFakeEmbedding(size=EMBEDDING_DIM))
+
+
+def serve_app(app, port: int = 0):
+    """Run an ASGI app with uvicorn on a background thread; returns (server, base_url)."""
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="off",
+                            backlog=4096, limit_concurrency=None)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    sock = server.servers[0].sockets[0]
+    return server, f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
@@ -0,0 +1,112 @@
+"""Local stand-in for the OpenAI chat completions endpoint, used by the benchmarks.
+
+Start it in-process with ``start_fake_llm()`` or from the shell with
+``python benchmarks/fake_llm.py --port 8901 --delay 0.05`` and point the app at
+it with ``OPENAI_BASE_URL=http://127.0.0.1:8901/v1``.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAKE_ANSWER = "The EDSA People Power Revolution happened in February 1986 and ended the Marcos dictatorship."
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+    disable_nagle_algorithm = True
+    delay = 0.0
+    answer = FAKE_ANSWER
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        with self.server.count_lock:  # handlers run on concurrent threads
+            self.server.request_count += 1
+        time.sleep(self.delay)
+        prompt = "".join(m.get("content", "") for m in body.get("messages", []))
+        if body.get("stream"):
+            self._stream(body)
+            return
+        payload = {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-3.5-turbo"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": self.answer},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": len(prompt.split()),
+                "completion_tokens": len(self.answer.split()),
+                "total_tokens": len(prompt.split()) + len(self.answer.split()),
+            },
+        }
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, body):
+        """Send the answer word by word as OpenAI-style server-sent events."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        words = self.answer.split(" ")
+        for i, word in enumerate(words):
+            delta = {"content": word if i == 0 else " " + word}
+            self._send_chunk(body, delta, None)
+        self._send_chunk(body, {}, "stop")
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _send_chunk(self, body, delta, finish_reason):
+        payload = {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-3.5-turbo"),
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        self._write_chunk(f"data: {json.dumps(payload)}\n\n".encode())
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+
+def start_fake_llm(port: int = 0, delay: float = 0.0, answer: str = FAKE_ANSWER):
+    """Serve the fake endpoint on a background thread; returns (server, base_url)."""
+    handler = type("ConfiguredFakeLLMHandler", (FakeLLMHandler,), {"delay": delay, "answer": answer})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    server.request_count = 0
+    server.count_lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to wait before answering")
+    args = parser.parse_args()
+    server, base_url = start_fake_llm(args.port, args.delay)
+    print(f"Fake LLM listening on {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
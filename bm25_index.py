@@ -0,0 +1,130 @@
+import json
+import math
+import os
+import re
+from array import array
+from collections import Counter
+from typing import Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60  # rank offset in reciprocal-rank fusion; 60 is the value from the original paper
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has he in is it its of on or that the to was were which with".split()
+)
+_FILES = ("vocab.json", "offsets.npy", "doc_ids.npy", "tfs.npy", "doc_lengths.npy")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word and number tokens; dates like "1898" and names stay whole."""
+    return [token for token in re.findall(r"\w+", text.lower()) if token not in STOPWORDS]
+
+
+def _save_atomic(path: str, value):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        if path.endswith('.json'):
+            f.write(json.dumps(value).encode('utf-8'))
+        else:
+            np.save(f, value)
+    os.replace(tmp_path, path)
+
+
+class BM25Index:
+    """Okapi BM25 over chunks in FAISS index order, stored as CSR postings lists.
+
+    ``offsets[t]:offsets[t + 1]`` slices ``doc_ids`` and ``tfs`` for term ``t``. Saved
+    arrays are memory-mapped on load, like the chunk store.
+    """
+
+    def __init__(self, vocab: dict, offsets: np.ndarray, doc_ids: np.ndarray, tfs: np.ndarray,
+                 doc_lengths: np.ndarray, k1: float = BM25_K1, b: float = BM25_B):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+        self.avg_doc_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    @classmethod
+    def build(cls, texts: Iterable[str]) -> 'BM25Index':
+        vocab = {}
+        term_ids, doc_ids, tfs, doc_lengths = array('i'), array('i'), array('i'), array('i')
+        for doc_id, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                doc_ids.append(doc_id)
+                tfs.append(tf)
+        term_ids = np.frombuffer(term_ids, dtype=np.int32)
+        # A stable sort keeps each term's postings in document order
+        order = np.argsort(term_ids, kind='stable')
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(vocab)), out=offsets[1:])
+        return cls(vocab, offsets, np.frombuffer(doc_ids, dtype=np.int32)[order],
+                   np.frombuffer(tfs, dtype=np.int32)[order].astype(np.float32),
+                   np.frombuffer(doc_lengths, dtype=np.int32).astype(np.float32))
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return all(os.path.exists(os.path.join(path, name)) for name in _FILES)
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        for name, value in zip(_FILES, (self.vocab, self.offsets, self.doc_ids, self.tfs, self.doc_lengths)):
+            _save_atomic(os.path.join(path, name), value)
+
+    @classmethod
+    def load(cls, path: str) -> 'BM25Index':
+        with open(os.path.join(path, _FILES[0]), 'r', encoding='utf-8') as f:
+            vocab = json.load(f)
+        arrays = [np.load(os.path.join(path, name), mmap_mode='r') for name in _FILES[1:]]
+        return cls(vocab, *arrays)
+
+    def search(self, query: str, k: int, allowed: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Positions and BM25 scores of the ``k`` best-matching chunks, best first.
+
+        With ``allowed`` (sorted positions), postings of other chunks are skipped before scoring.
+        """
+        term_ids = {self.vocab[token] for token in tokenize(query) if token in self.vocab}
+        if not term_ids or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        n = len(self)
+        docs_parts, score_parts = [], []
+        for term_id in term_ids:
+            start, end = int(self.offsets[term_id]), int(self.offsets[term_id + 1])
+            docs, tf = self.doc_ids[start:end], self.tfs[start:end]
+            # IDF stays corpus-wide, so a filter does not change how rare a term counts as
+            idf = math.log(1 + (n - (end - start) + 0.5) / (end - start + 0.5))
+            if allowed is not None:
+                keep = np.isin(docs, allowed)
+                docs, tf = docs[keep], tf[keep]
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[docs] / self.avg_doc_length)
+            docs_parts.append(docs)
+            score_parts.append(idf * tf * (self.k1 + 1) / (tf + norm))
+        # Sum per document over only the postings touched, not over the whole corpus
+        if not sum(len(part) for part in docs_parts):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        docs, inverse = np.unique(np.concatenate(docs_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(score_parts))
+        top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return docs[top].astype(np.int64), scores[top].astype(np.float32)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = RRF_K) -> List[Tuple[int, float]]:
+    """Fuse ranked ID lists: each ID scores the sum of ``1 / (k + rank)`` over the lists it is in."""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[int(doc_id)] = scores.get(int(doc_id), 0.0) + 1.0 / (k + rank)
+    # sorted() is stable, so ties keep the order of the first ranking
+    return sorted(scores.items(), key=lambda item: -item[1])
@@ -0,0 +1,105 @@
+import json
+import mmap
+import os
+from typing import List, Sequence
+
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_core.documents import Document
+
+TEXTS = "texts"
+METADATAS = "metadatas"
+DUPLICATES = "duplicates"  # provenance of near-duplicates merged into each chunk, kept out of its metadata
+
+
+def _write_atomic(path: str, write):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def write_strings(prefix: str, strings: Sequence[str]):
+    """Store ``strings`` as ``<prefix>.bin`` (UTF-8, back to back) and ``<prefix>.offsets.npy``."""
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    # The blob goes first so a reader never sees offsets past the end of it
+    _write_atomic(prefix + '.bin', lambda f: f.writelines(encoded))
+    _write_atomic(prefix + '.offsets.npy', lambda f: np.save(f, offsets))
+
+
+class MappedStrings(Sequence):
+    """Read-only sequence of strings backed by memory-mapped files from ``write_strings``.
+
+    Pages are shared through the OS page cache by every process that maps the same files,
+    and opening does not read the data, so it costs the same for any corpus size.
+    """
+
+    def __init__(self, prefix: str):
+        self.offsets = np.load(prefix + '.offsets.npy', mmap_mode='r')
+        with open(prefix + '.bin', 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            # mmap refuses empty files
+            self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self._blob[int(self.offsets[i]):int(self.offsets[i + 1])].decode('utf-8')
+
+
+class ChunkStore:
+    """Chunk texts and their metadata in FAISS index order, stored under ``path``."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.texts = MappedStrings(os.path.join(path, TEXTS))
+        self.metadatas = MappedStrings(os.path.join(path, METADATAS))
+        duplicates_path = os.path.join(path, DUPLICATES)
+        # Stores written before duplicates were merged have no such file
+        self._duplicates = MappedStrings(duplicates_path) if os.path.exists(duplicates_path + '.bin') else None
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return all(os.path.exists(os.path.join(path, name + suffix))
+                   for name in (TEXTS, METADATAS) for suffix in ('.bin', '.offsets.npy'))
+
+    @staticmethod
+    def write(path: str, texts: List[str], metadatas: List[dict]):
+        os.makedirs(path, exist_ok=True)
+        # A boilerplate chunk can stand in for thousands of pages: parsing that list on every
+        # search hit would cost more than the merge saves, so it is stored on its own
+        duplicates = [json.dumps(m["duplicates"]) if m.get("duplicates") else "" for m in metadatas]
+        write_strings(os.path.join(path, DUPLICATES), duplicates)
+        write_strings(os.path.join(path, METADATAS),
+                      [json.dumps({key: value for key, value in m.items() if key != "duplicates"}) for m in metadatas])
+        write_strings(os.path.join(path, TEXTS), texts)
+
+    def document(self, i: int) -> Document:
+        return Document(page_content=self.texts[i], metadata=json.loads(self.metadatas[i]))
+
+    def duplicates(self, i: int) -> List[dict]:
+        """ID, source and page of each near-duplicate merged into chunk ``i`` at build time."""
+        duplicates = self._duplicates[i] if self._duplicates is not None else ""
+        return json.loads(duplicates) if duplicates else []
+
+
+class ChunkDocstore(Docstore):
+    """Read-only LangChain docstore over a ``ChunkStore``, addressed by FAISS position."""
+
+    def __init__(self, store: ChunkStore):
+        self.store = store
+
+    def search(self, search) -> Document:
+        return self.store.document(int(search))
@@ -0,0 +1,55 @@
+import asyncio
+import json
+import os
+from typing import Any, Awaitable, Callable, Hashable, Optional, Tuple
+
+from answer_cache import normalize_question
+from metrics import COALESCED_REQUESTS
+
+# Identical /query requests in flight at the same time share one retrieval and LLM call
+QUERY_COALESCING = os.getenv("QUERY_COALESCING", "1") == "1"
+
+
+def query_key(question: str, top_n: int, where: Optional[dict] = None) -> Tuple:
+    """Requests with equal keys get the same answer: same normalized question, ``top_n`` and filter."""
+    return normalize_question(question), top_n, json.dumps(where, sort_keys=True, default=str) if where else None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; callers that arrive while it runs await its result.
+
+    Nothing is kept once the call finishes, so a result is never served after the request
+    that produced it has completed. Belongs to one event loop, which makes locking unneeded.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """The result of ``func()`` and whether this caller ran it, or of the same key's call in flight.
+
+        The call runs as its own task, so a caller that is cancelled (a client that went away)
+        does not cancel it for the others. Its exception is raised to every caller.
+        """
+        task = self._calls.get(key)
+        leader = task is None
+        if leader:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.leaders += 1
+        else:
+            self.followers += 1
+        COALESCED_REQUESTS.inc(role="leader" if leader else "follower")
+        return await asyncio.shield(task), leader
+
+    def _forget(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        total = self.leaders + self.followers
+        return {"in_flight": len(self._calls), "leaders": self.leaders, "followers": self.followers,
+                "coalescing_ratio": round(self.followers / total, 4) if total else 0.0}
@@ -0,0 +1,146 @@
+import os
+import threading
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "600"))  # tokens of retrieved text per prompt
+# Cosine similarity above which a lower-ranked chunk is dropped as a near-duplicate of a kept one
+CONTEXT_DEDUP_SIMILARITY = float(os.getenv("CONTEXT_DEDUP_SIMILARITY", "0.95"))
+TOKENIZER_ENCODING = "cl100k_base"  # the gpt-3.5-turbo / gpt-4 encoding
+MIN_MERGE_OVERLAP = 20  # characters two chunks must share before they are merged
+MIN_TRUNCATED_TOKENS = 32  # a chunk cut shorter than this is dropped instead
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def _load_encoding():
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    import tiktoken  # installed with langchain-openai
+                    _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+                except Exception:
+                    # No tiktoken, or its BPE file cannot be fetched: estimate instead
+                    _encoding = False
+    return _encoding or None
+
+
+def count_tokens(text: str) -> int:
+    """Tokens ``text`` costs in the LLM prompt; about 4 characters per token without tiktoken."""
+    encoding = _load_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """The longest prefix of ``text`` that fits in ``max_tokens``, cut at a word boundary."""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _load_encoding()
+    prefix = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens]) if encoding else text[:max_tokens * 4]
+    cut = prefix.rfind(" ")
+    return (prefix[:cut] if cut > 0 else prefix).rstrip()
+
+
+def _overlap(first: str, second: str) -> int:
+    """Length of the longest suffix of ``first`` that starts ``second`` (0 below ``MIN_MERGE_OVERLAP``)."""
+    for k in range(min(len(first), len(second)), MIN_MERGE_OVERLAP - 1, -1):
+        if first.endswith(second[:k]):
+            return k
+    return 0
+
+
+def merge_overlapping(chunks: Sequence[str]) -> List[str]:
+    """Merge chunks that contain one another or share the overlap the text splitter repeats.
+
+    Neighbouring chunks of a page start with the end of the previous one; such pairs become
+    one piece, in the rank of the better-ranked chunk, so the shared text is sent once.
+    """
+    pieces = []
+    for chunk in chunks:
+        merged = False
+        for i, piece in enumerate(pieces):
+            if chunk in piece:
+                merged = True
+            elif piece in chunk:
+                pieces[i], merged = chunk, True
+            else:
+                k = _overlap(piece, chunk)
+                if k:
+                    pieces[i], merged = piece + chunk[k:], True
+                else:
+                    k = _overlap(chunk, piece)
+                    if k:
+                        pieces[i], merged = chunk + piece[k:], True
+            if merged:
+                break
+        if not merged:
+            pieces.append(chunk)
+    # A merge can make a piece overlap another one that was kept apart
+    return pieces if len(pieces) == len(chunks) else merge_overlapping(pieces)
+
+
+def drop_near_duplicates(chunks: Sequence[str], vectors: Sequence[Optional[Sequence[float]]],
+                         threshold: float = CONTEXT_DEDUP_SIMILARITY) -> List[str]:
+    """Chunks in rank order without those too similar to a better-ranked kept chunk.
+
+    ``vectors[i]`` is the embedding of ``chunks[i]``; a chunk without one is always kept.
+    """
+    known = [i for i, vector in enumerate(vectors) if vector is not None]
+    if len(known) < 2:
+        return list(chunks)
+    unit = np.asarray([vectors[i] for i in known], dtype=np.float32)
+    unit /= np.maximum(np.linalg.norm(unit, axis=1, keepdims=True), 1e-12)
+    similarities = unit @ unit.T
+    dropped = set()
+    for row, i in enumerate(known):
+        if i in dropped:
+            continue
+        for col in range(row + 1, len(known)):
+            if similarities[row, col] >= threshold:
+                dropped.add(known[col])
+    return [chunk for i, chunk in enumerate(chunks) if i not in dropped]
+
+
+def fit_to_budget(pieces: Sequence[str], token_budget: int = CONTEXT_TOKEN_BUDGET,
+                  format_piece: Callable[[str], str] = str) -> List[str]:
+    """Best-ranked pieces whose formatted lines fit in ``token_budget``; the last one may be cut short.
+
+    The best piece is always included, cut to at least ``MIN_TRUNCATED_TOKENS`` tokens.
+    """
+    kept, used = [], 0
+    for piece in pieces:
+        tokens = count_tokens(format_piece(piece))
+        if used + tokens <= token_budget:
+            kept.append(piece)
+            used += tokens
+            continue
+        overhead = count_tokens(format_piece(""))
+        remaining = token_budget - used - overhead
+        if not kept:
+            # The best chunk is always sent, however small the budget: the prompt is useless without
+            # context, so it goes over a budget smaller than ``MIN_TRUNCATED_TOKENS`` (even 0 or less)
+            kept.append(truncate_to_tokens(piece, max(remaining, MIN_TRUNCATED_TOKENS)))
+        elif remaining >= MIN_TRUNCATED_TOKENS:
+            kept.append(truncate_to_tokens(piece, remaining))
+        break
+    return kept
+
+
+def assemble_context(chunks: Sequence[str], vectors: Sequence[Optional[Sequence[float]]] = None,
+                     token_budget: int = CONTEXT_TOKEN_BUDGET, threshold: float = CONTEXT_DEDUP_SIMILARITY,
+                     format_piece: Callable[[str], str] = str) -> List[str]:
+    """Context pieces for retrieved ``chunks`` (best first): exact and near-duplicates dropped,
+    overlapping chunks merged, and the result trimmed to ``token_budget``."""
+    unique = list(dict.fromkeys(chunks))
+    if vectors is not None:
+        vector_of = dict(zip(chunks, vectors))
+        unique = drop_near_duplicates(unique, [vector_of[chunk] for chunk in unique], threshold)
+    return fit_to_budget(merge_overlapping(unique), token_budget, format_piece)
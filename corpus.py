@@ -0,0 +1,107 @@
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_COLLECTION = "default"  # the index at INDEX_PATH, built from PDF_PATH
+COLLECTIONS_PATH = os.getenv("COLLECTIONS_PATH", "data/collections")  # one index shard per subdirectory
+SHARD_SEARCH_WORKERS = int(os.getenv("SHARD_SEARCH_WORKERS", "4"))  # shards searched at once per request
+COLLECTION_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+
+
+def validate_collection(name: str) -> str:
+    """``name`` if it can be used as a collection (and directory) name; ValueError otherwise."""
+    if not isinstance(name, str) or not COLLECTION_NAME.match(name):
+        raise ValueError(f"Invalid collection name {name!r}; use letters, digits, '_', '.' and '-'")
+    return name
+
+
+def list_collections(root: str = COLLECTIONS_PATH) -> List[str]:
+    """Collections with a saved index under ``root``, sorted by name."""
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root)
+                  if COLLECTION_NAME.match(name) and os.path.exists(os.path.join(root, name, "faiss_index")))
+
+
+SCALAR_TYPES = (str, int, float, bool)  # metadata values that MetadataIndex indexes
+
+
+def _values(condition) -> list:
+    return list(condition) if isinstance(condition, (list, tuple, set)) else [condition]
+
+
+def split_filter(where: Optional[dict]) -> Tuple[Optional[List[str]], Optional[dict]]:
+    """Separate a metadata filter into the collections it selects and the per-chunk conditions.
+
+    ``where`` maps metadata keys to a value or a list of accepted values, e.g.
+    ``{"collection": "laws", "source": ["a.pdf", "b.pdf"], "page": 3}``. Values must be
+    strings, numbers or booleans; anything else (an operator such as ``{"$eq": ...}``, a
+    nested list, null) is a ValueError.
+    """
+    if not where:
+        return None, None
+    if not isinstance(where, dict):
+        raise ValueError("The filter must map metadata keys to values")
+    for key, condition in where.items():
+        if not all(isinstance(value, SCALAR_TYPES) for value in _values(condition)):
+            raise ValueError(f"Invalid filter value for {key!r}: {condition!r}; "
+                             f"use a string, number or boolean, or a list of them")
+    conditions = dict(where)
+    collections = conditions.pop("collection", None)
+    if collections is not None:
+        collections = [validate_collection(name) for name in _values(collections)]
+    return collections, conditions or None
+
+
+class MetadataIndex:
+    """Chunk positions per metadata value, for resolving filters before a search.
+
+    Built on first use with one pass over the chunk metadata (JSON strings or dicts in
+    FAISS index order), so loading an index stays cheap.
+    """
+
+    def __init__(self, metadatas: Sequence):
+        self.metadatas = metadatas
+        self._postings = None
+        self._lock = threading.Lock()
+
+    @property
+    def postings(self) -> Dict[str, Dict[object, np.ndarray]]:
+        if self._postings is None:
+            with self._lock:
+                if self._postings is None:
+                    postings = {}
+                    for position, metadata in enumerate(self.metadatas):
+                        if isinstance(metadata, str):
+                            metadata = json.loads(metadata)
+                        for key, value in metadata.items():
+                            if isinstance(value, (str, int, float, bool)):
+                                postings.setdefault(key, {}).setdefault(value, []).append(position)
+                    self._postings = {key: {value: np.asarray(positions, dtype=np.int64)
+                                            for value, positions in values.items()}
+                                      for key, values in postings.items()}
+        return self._postings
+
+    def positions(self, conditions: dict) -> np.ndarray:
+        """Sorted positions of chunks that match every condition (any of a condition's values)."""
+        allowed = None
+        for key, condition in conditions.items():
+            by_value = self.postings.get(key, {})
+            parts = [by_value[value] for value in _values(condition) if value in by_value]
+            matches = np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+            allowed = matches if allowed is None else np.intersect1d(allowed, matches, assume_unique=True)
+            if not len(allowed):
+                break
+        return allowed if allowed is not None else np.empty(0, dtype=np.int64)
+
+
+def merge_top_k(rows: Sequence[Sequence[Tuple[str, float]]], k: int, higher_is_better: bool) -> List[Tuple[str, float]]:
+    """The ``k`` best (chunk, score) pairs across shards' result lists."""
+    merged = [item for row in rows for item in row]
+    # sorted() is stable, so ties keep shard order
+    merged.sort(key=lambda item: -item[1] if higher_is_better else item[1])
+    return merged[:k]
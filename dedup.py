@@ -0,0 +1,48 @@
+import os
+
+import faiss
+import numpy as np
+
+# Cosine similarity of chunk embeddings at which a new chunk counts as a near-duplicate and is not indexed.
+# Off (0) by default: a merged chunk's text is not indexed, and chunks that differ only in a date or a
+# number are often this similar, so enable it only for corpora full of boilerplate
+INDEX_DEDUP_SIMILARITY = float(os.getenv("INDEX_DEDUP_SIMILARITY", "0"))
+
+
+def _unit_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def find_duplicates(vectors, index: faiss.Index = None, threshold: float = INDEX_DEDUP_SIMILARITY) -> np.ndarray:
+    """For each row of ``vectors``, the chunk it nearly duplicates, or -1 if it should be indexed.
+
+    Rows and ``index`` are numbered as one sequence: a value below ``index.ntotal`` is a
+    position in ``index``, and ``index.ntotal + j`` is row ``j``, an earlier row that is
+    itself kept. A row is compared with its nearest neighbour in ``index`` (one batched
+    search) and with every earlier kept row (one matrix product), and matches when the
+    cosine similarity is at least ``threshold``.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    duplicate_of = np.full(len(vectors), -1, dtype=np.int64)
+    if threshold <= 0 or not len(vectors):
+        return duplicate_of
+    units = _unit_rows(vectors)
+    ntotal = index.ntotal if index is not None else 0
+    if ntotal:
+        _, nearest = index.search(vectors, 1)
+        nearest = nearest[:, 0]
+        found = np.flatnonzero(nearest >= 0)
+        stored = _unit_rows(np.vstack([index.reconstruct(int(position)) for position in nearest[found]]))
+        similar = np.einsum("ij,ij->i", units[found], stored) >= threshold
+        duplicate_of[found[similar]] = nearest[found[similar]]
+    # Only rows with no indexed match can be new; of those, the first of each similar group is kept
+    similarities = units @ units.T
+    kept = []
+    for row in np.flatnonzero(duplicate_of < 0):
+        matches = np.flatnonzero(similarities[row, kept] >= threshold) if kept else ()
+        if len(matches):
+            duplicate_of[row] = ntotal + kept[matches[0]]
+        else:
+            kept.append(row)
+    return duplicate_of
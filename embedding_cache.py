@@ -0,0 +1,189 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "data/embedding_cache.sqlite")
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "4096"))
+
+
+def embedding_key(model_name: str, text: str) -> bytes:
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).digest()
+
+
+class EmbeddingStore:
+    """Float32 vectors in SQLite, keyed by ``embedding_key``. The file is opened on first use."""
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)")
+        return self._conn
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, List[float]]:
+        found = {}
+        with self._lock:
+            conn = self._connect()
+            for start in range(0, len(keys), 500):  # stay under SQLite's bound-parameter limit
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch)
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, items: Dict[bytes, List[float]]):
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()],
+            )
+            conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        """Close the connection; the next use reopens it. A forked process must not share its parent's."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class LazyEmbeddings(Embeddings):
+    """Creates the wrapped model on first use, so loading an index does not load the model."""
+
+    def __init__(self, factory: Callable[[], Embeddings]):
+        self.factory = factory
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    @property
+    def model(self) -> Embeddings:
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self.factory()
+        return self._model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.model.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.model.embed_query(text)
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an embedding model with a persistent document cache and an in-memory query LRU.
+
+    ``embed_documents`` only runs the model on texts that are not in the store, so rebuilding
+    an index after a chunking change pays only for chunks whose text actually changed. With
+    ``persist_queries`` query embeddings are kept in the store too, which lets a short-lived
+    process answer a repeated question without loading the model.
+    """
+
+    def __init__(self, underlying: Embeddings, model_name: str, store: EmbeddingStore = None,
+                 query_cache_size: int = QUERY_EMBEDDING_CACHE_SIZE, persist_queries: bool = False):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.store = store if store is not None else EmbeddingStore()
+        self.query_cache_size = query_cache_size
+        self.persist_queries = persist_queries
+        self._queries = OrderedDict()
+        self._query_lock = threading.Lock()
+        self.document_hits = 0
+        self.document_misses = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [embedding_key(self.model_name, text) for text in texts]
+        cached = self.store.get_many(list(set(keys)))
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            # Round through float32 so results are identical whether or not they came from the store
+            computed = {key: np.asarray(vector, dtype=np.float32).tolist() for key, vector in zip(missing, vectors)}
+            self.store.put_many(computed)
+            cached.update(computed)
+        self.document_hits += len(texts) - len(missing)
+        self.document_misses += len(missing)
+        return [list(cached[key]) for key in keys]
+
+    def stored_documents(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Stored vectors of ``texts`` (``None`` where there is none) without running the model."""
+        keys = [embedding_key(self.model_name, text) for text in texts]
+        cached = self.store.get_many(list(set(keys)))
+        return [cached.get(key) for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self._cached_query(text)
+        if vector is None:
+            vector = self._stored_query(text) if self.persist_queries else self.underlying.embed_query(text)
+            self._remember_query(text, vector)
+        return vector
+
+    def load_model(self):
+        """Load the model without running it, e.g. in a parent process before it forks workers."""
+        if isinstance(self.underlying, LazyEmbeddings):
+            self.underlying.model
+
+    def warm_up(self):
+        """Load the model and run it once, so the first real query does not pay for either."""
+        self.underlying.embed_query("warm up")
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of queries, running the model once for those not in the LRU."""
+        results = [self._cached_query(text) for text in texts]
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, results) if vector is None))
+        if missing:
+            computed = dict(zip(missing, self.underlying.embed_documents(missing)))
+            for text, vector in computed.items():
+                self._remember_query(text, vector)
+            results = [vector if vector is not None else computed[text] for text, vector in zip(texts, results)]
+        return results
+
+    def _stored_query(self, text: str) -> List[float]:
+        # Kept apart from document keys: some models embed queries and documents differently
+        key = embedding_key(self.model_name + "\0query", text)
+        vector = self.store.get_many([key]).get(key)
+        if vector is None:
+            vector = np.asarray(self.underlying.embed_query(text), dtype=np.float32).tolist()
+            self.store.put_many({key: vector})
+        return vector
+
+    def _cached_query(self, text: str):
+        with self._query_lock:
+            vector = self._queries.get(text)
+            if vector is not None:
+                self._queries.move_to_end(text)
+            return vector
+
+    def _remember_query(self, text: str, vector: List[float]):
+        with self._query_lock:
+            self._queries[text] = vector
+            self._queries.move_to_end(text)
+            while len(self._queries) > self.query_cache_size:
+                self._queries.popitem(last=False)
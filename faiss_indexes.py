@@ -0,0 +1,251 @@
+import math
+import os
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq", "binary")
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+FAISS_NLIST = int(os.getenv("FAISS_NLIST", "0"))  # IVF lists; 0 picks ~4*sqrt(n)
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))  # IVF lists visited per query
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_EF_CONSTRUCTION = int(os.getenv("FAISS_EF_CONSTRUCTION", "200"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))  # HNSW candidates per query
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "48"))  # PQ sub-quantizers; lowered to a divisor of the dimension
+# Hamming candidates per wanted result that the binary index rescores against its float16 vectors
+FAISS_RESCORE_FACTOR = int(os.getenv("FAISS_RESCORE_FACTOR", "128"))
+MIN_ANN_VECTORS = 1000  # below this an exact flat search is already fast
+BINARY_VECTORS = "vectors.f16"  # a binary index's float16 vectors, saved beside its index.faiss
+
+
+def _nlist(n: int) -> int:
+    nlist = FAISS_NLIST or int(4 * math.sqrt(n))
+    # faiss wants ~39 training points per centroid
+    return max(1, min(nlist, n // 39))
+
+
+def _pq_m(dim: int) -> int:
+    return max(m for m in range(1, min(FAISS_PQ_M, dim) + 1) if dim % m == 0)
+
+
+def effective_index_type(index_type: str, n: int) -> str:
+    """The type ``create_index`` actually builds for ``n`` vectors."""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type {index_type!r}; expected one of {', '.join(INDEX_TYPES)}")
+    return "flat" if index_type == "flat" or n < MIN_ANN_VECTORS else index_type
+
+
+def create_index(index_type: str, dim: int, n: int) -> faiss.Index:
+    """An empty (untrained) L2 index of the given type, sized for about ``n`` vectors."""
+    index_type = effective_index_type(index_type, n)
+    if index_type == "flat":
+        return faiss.IndexFlatL2(dim)
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, FAISS_HNSW_M)
+        index.hnsw.efConstruction = FAISS_EF_CONSTRUCTION
+        return index
+    if index_type == "binary":
+        # The bit codes of a ``BinaryIndex``. Each bit compares a dimension with its median over the
+        # corpus rather than 0: sentence embeddings are not centred, so plain sign bits would be
+        # nearly constant in the off-centre dimensions
+        return faiss.IndexLSH(dim, dim, False, True)
+    quantizer = faiss.IndexFlatL2(dim)
+    if index_type == "ivf":
+        return faiss.IndexIVFFlat(quantizer, dim, _nlist(n))
+    nbits = 8 if n >= 256 * 39 else 6
+    return faiss.IndexIVFPQ(quantizer, dim, _nlist(n), _pq_m(dim), nbits)
+
+
+def build_index(index_type: str, vectors: np.ndarray) -> faiss.Index:
+    """Train (if needed) and fill an index of ``index_type``; row i of ``vectors`` gets ID i."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = create_index(index_type, vectors.shape[1], len(vectors))
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    if isinstance(index, faiss.IndexLSH):
+        index = BinaryIndex(index, vectors)
+    set_search_params(index)
+    return index
+
+
+class BinaryIndex:
+    """L2 search over bit codes, with the best candidates rescored against float16 vectors.
+
+    Only ``codes``, an ``IndexLSH`` holding one bit per dimension (48 bytes for MiniLM),
+    stays in memory. A search takes the ``k * rescore_factor`` nearest codes by Hamming
+    distance and ranks them by exact L2 distance to their float16 vectors. Those come from
+    ``vectors``: an array while the index is being built, or the path of the file they were
+    saved to (``save_vectors``). Only the candidates' rows of the file are read, with
+    ``pread``, so they go through the page cache without being mapped into the process.
+    Offers what LangChain's ``FAISS`` and this module use of a ``faiss.Index``.
+    """
+
+    metric_type = faiss.METRIC_L2
+    is_trained = True
+
+    def __init__(self, codes: faiss.IndexLSH, vectors, rescore_factor: int = None):
+        self.codes = codes
+        self.rescore_factor = rescore_factor or FAISS_RESCORE_FACTOR
+        self._row_bytes = codes.d * np.dtype(np.float16).itemsize
+        if isinstance(vectors, str):
+            self._vectors, self._fd = None, os.open(vectors, os.O_RDONLY)
+        else:
+            self._vectors, self._fd = np.asarray(vectors, dtype=np.float16), None
+
+    def __del__(self):
+        if getattr(self, "_fd", None) is not None:
+            os.close(self._fd)
+
+    @property
+    def ntotal(self) -> int:
+        return self.codes.ntotal
+
+    @property
+    def d(self) -> int:
+        return self.codes.d
+
+    def _read(self, start: int, n: int) -> np.ndarray:
+        data = os.pread(self._fd, n * self._row_bytes, start * self._row_bytes)
+        return np.frombuffer(data, dtype=np.float16).reshape(n, self.d)
+
+    def rows(self, positions: np.ndarray) -> np.ndarray:
+        """The float32 vectors at ``positions``, reading nothing else."""
+        if self._vectors is not None:
+            return self._vectors[positions].astype(np.float32)
+        data = b"".join(os.pread(self._fd, self._row_bytes, int(i) * self._row_bytes) for i in positions)
+        return np.frombuffer(data, dtype=np.float16).reshape(len(positions), self.d).astype(np.float32)
+
+    def reconstruct(self, i: int) -> np.ndarray:
+        return self.rows(np.array([i]))[0]
+
+    def reconstruct_n(self, i0: int, n: int) -> np.ndarray:
+        if self._vectors is not None:
+            return self._vectors[i0:i0 + n].astype(np.float32)
+        return self._read(i0, n).astype(np.float32)
+
+    def save_vectors(self, path: str, block: int = 65536):
+        with open(path, "wb") as f:
+            for start in range(0, self.ntotal, block):
+                n = min(block, self.ntotal - start)
+                f.write(self._vectors[start:start + n].tobytes() if self._vectors is not None
+                        else self._read(start, n).tobytes())
+
+    def search(self, x: np.ndarray, k: int):
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        _, candidates = self.codes.search(x, min(self.ntotal, k * self.rescore_factor))
+        return self._rescore(x, candidates, k)
+
+    def filtered_search(self, x: np.ndarray, k: int, ids: np.ndarray):
+        """``search`` over only the positions in ``ids``, still by Hamming distance first.
+
+        The allowed codes are copied into a temporary binary index (``len(ids)`` times 48
+        bytes for MiniLM), so a filter costs what a search of that many codes does.
+        """
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        ids = np.ascontiguousarray(ids, dtype=np.int64)
+        if not len(ids):
+            return self._rescore(x, np.full((len(x), 1), -1, dtype=np.int64), k)
+        size = self.codes.code_size
+        codes = faiss.rev_swig_ptr(self.codes.codes.data(), self.ntotal * size).reshape(self.ntotal, size)
+        allowed = faiss.IndexBinaryFlat(size * 8)
+        allowed.add(np.ascontiguousarray(codes[ids]))
+        _, found = allowed.search(self.codes.sa_encode(x), min(len(ids), k * self.rescore_factor))
+        return self._rescore(x, np.where(found >= 0, ids[np.maximum(found, 0)], -1), k)
+
+    def _rescore(self, x: np.ndarray, candidates: np.ndarray, k: int):
+        # Missing results are reported as faiss does: label -1 at the largest float32 distance
+        distances = np.full((len(x), k), np.finfo(np.float32).max, dtype=np.float32)
+        labels = np.full((len(x), k), -1, dtype=np.int64)
+        for row, (query, found) in enumerate(zip(x, candidates)):
+            # Sorted, so the rows are read in file order
+            found = np.sort(found[found >= 0])
+            scores = ((self.rows(found) - query) ** 2).sum(axis=1)
+            best = np.argsort(scores, kind="stable")[:k]
+            distances[row, :len(best)] = scores[best]
+            labels[row, :len(best)] = found[best]
+        return distances, labels
+
+
+def set_search_params(index: faiss.Index, nprobe: int = None, ef_search: int = None, rescore_factor: int = None):
+    """Apply query-time accuracy/speed knobs; a no-op for index types without them."""
+    if isinstance(index, BinaryIndex):
+        index.rescore_factor = rescore_factor or FAISS_RESCORE_FACTOR
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search or FAISS_EF_SEARCH
+    elif isinstance(index, faiss.IndexIVF):
+        index.nprobe = min(nprobe or FAISS_NPROBE, index.nlist)
+
+
+def filtered_search_params(index: faiss.Index, ids: np.ndarray) -> faiss.SearchParameters:
+    """Search parameters that restrict ``index.search`` to the positions in ``ids``.
+
+    The selector is checked while the index is scanned, so the top k are the best allowed
+    vectors rather than what is left of an unfiltered top k. The index's own nprobe and
+    efSearch are carried over, since parameters passed to a search replace them.
+    """
+    selector = faiss.IDSelectorBatch(np.ascontiguousarray(ids, dtype=np.int64))
+    if isinstance(index, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    elif isinstance(index, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    params.selector_ref = selector  # the parameters do not keep the selector alive
+    return params
+
+
+def filtered_search(index: faiss.Index, vectors: np.ndarray, k: int, ids: np.ndarray):
+    """``index.search`` over only the positions in ``ids``; returns (distances, positions).
+
+    The binary index compares the allowed positions' bit codes, then rescores as usual.
+    """
+    if isinstance(index, BinaryIndex):
+        return index.filtered_search(vectors, k, ids)
+    return index.search(vectors, k, params=filtered_search_params(index, ids))
+
+
+def index_type_of(index: faiss.Index) -> str:
+    if isinstance(index, BinaryIndex):
+        return "binary"
+    if isinstance(index, faiss.IndexLSH):
+        # Bit codes without the vectors to rescore with (read by LangChain's load_local); rebuilt when loaded
+        return "lsh"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+def read_index_mmap(path: str) -> faiss.Index:
+    """Read an index whose vectors stay memory-mapped, shared through the OS page cache.
+
+    ``IO_FLAG_MMAP`` only maps IVF inverted lists; faiss >= 1.9 also maps flat codes with
+    ``IO_FLAG_MMAP_IFC``. Falls back to a normal read for index types that cannot be mapped.
+    """
+    flags = [getattr(faiss, "IO_FLAG_MMAP_IFC", None), faiss.IO_FLAG_MMAP]
+    for flag in filter(None, flags):
+        try:
+            return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            continue
+    return faiss.read_index(path)
+
+
+def read_index_dir(directory: str):
+    """The index saved in ``directory`` as ``index.faiss`` (memory-mapped), with a binary index's vectors file."""
+    index = read_index_mmap(os.path.join(directory, "index.faiss"))
+    vectors_path = os.path.join(directory, BINARY_VECTORS)
+    if isinstance(index, faiss.IndexLSH) and os.path.exists(vectors_path):
+        return BinaryIndex(index, vectors_path)
+    return index
+
+
+def index_memory_bytes(index) -> int:
+    """Size of the index as saved, a binary index's vectors file included."""
+    if isinstance(index, BinaryIndex):
+        return int(faiss.serialize_index(index.codes).nbytes) + index.ntotal * index._row_bytes
+    return int(faiss.serialize_index(index).nbytes)
@@ -0,0 +1,250 @@
+import json
+import os
+import re
+import threading
+import uuid
+from collections import Counter
+from typing import List, NamedTuple, Optional, Sequence
+
+import faiss
+import numpy as np
+
+from answer_cache import normalize_question
+from chunk_store import MappedStrings, write_strings
+from faiss_indexes import build_index, read_index_mmap
+
+FAQ_ANSWERS = os.getenv("FAQ_ANSWERS", "1") == "1"  # 0 ignores the precomputed answers
+FAQ_INDEX_PATH = os.getenv("FAQ_INDEX_PATH", "data/faq_index")
+# Cosine similarity to the nearest FAQ question above which its precomputed answer is served
+FAQ_SIMILARITY = float(os.getenv("FAQ_SIMILARITY", "0.9"))
+FAQ_MAX_QUESTIONS = int(os.getenv("FAQ_MAX_QUESTIONS", "2000"))  # generated questions answered by the warm-up
+FAQ_CONCURRENCY = int(os.getenv("FAQ_CONCURRENCY", "8"))  # LLM calls in flight during the warm-up
+FAQ_INDEX_TYPE = "hnsw"  # built as an exact flat index below MIN_ANN_VECTORS questions
+FAQ_VERSION = 2  # 2: files carry the build they belong to
+
+MONTHS = "January|February|March|April|May|June|July|August|September|October|November|December"
+FULL_DATE_PATTERN = re.compile(rf"\b(?:(?:{MONTHS}) \d{{1,2}}, \d{{4}}|\d{{1,2}} (?:{MONTHS}) \d{{4}})\b")
+FAQ_YEAR_PATTERN = re.compile(r"\b(?:1[5-9][0-9]{2}|20[0-9]{2})\b")
+# Runs of capitalized words, allowing the lowercase joins of names like "Treaty of Paris" or "Emilio y Famy"
+ENTITY_PATTERN = re.compile(r"\b[A-Z][\w'-]+(?:(?: (?:of|de|del|ng|y|the))? [A-Z][\w'-]+)+")
+# Capitalized only because they start a sentence or clause
+LEADING_WORDS = frozenset("A An The In On At By During After Before Since Under From With When While This That "
+                          "These Those His Her Its Their It He She They".split())
+EVENT_WORDS = frozenset("Revolution War Battle Treaty Massacre Uprising Revolt Rebellion Declaration Occupation "
+                        "Act Law Proclamation Constitution Convention Congress Assembly Movement Strike".split())
+INSUFFICIENT_ANSWER = "not enough information in the context"
+
+QUESTIONS = "questions"
+ANSWERS = "answers"
+SOURCES = "sources"  # intent and retrieved chunks behind each answer, as JSON
+INDEX = "index"
+META = "meta.json"
+
+
+def _file(path: str, name: str, build: Optional[str]) -> str:
+    """Where a build's file is stored; builds before ``FAQ_VERSION`` 2 had one unnamed set."""
+    return os.path.join(path, f"{name}-{build}" if build else name)
+
+
+def _entities(chunk: str) -> List[str]:
+    entities = []
+    for match in ENTITY_PATTERN.finditer(chunk):
+        words = match.group(0).split()
+        while words and words[0] in LEADING_WORDS:
+            words.pop(0)
+        if len(words) >= 2 and words[0][0].isupper():
+            entities.append(" ".join(words))
+    return entities
+
+
+def _dates(text: str) -> frozenset:
+    """Full dates as (day, month, year), whichever way round they are written."""
+    dates = set()
+    for date in FULL_DATE_PATTERN.findall(text):
+        words = date.replace(",", "").split()
+        day, month = (words[1], words[0]) if words[0][0].isalpha() else (words[0], words[1])
+        dates.add((int(day), month, words[2]))
+    return frozenset(dates)
+
+
+def _mentions(text: str, entity: str) -> bool:
+    return re.search(rf"\b{re.escape(entity.lower())}\b", text.lower()) is not None
+
+
+def same_subject(query: str, question: str) -> bool:
+    """Whether ``query`` asks about the same dates, years and named entities as ``question``.
+
+    Template questions ("What happened in 1896?", "What is the significance of Jose Rizal?")
+    embed almost identically whatever their subject, so embedding similarity alone would
+    answer one year or person with another's answer. Entities are compared by mention in
+    the other text, which also works for a query typed in lowercase.
+    """
+    if _dates(query) != _dates(question):
+        return False
+    if set(FAQ_YEAR_PATTERN.findall(query)) != set(FAQ_YEAR_PATTERN.findall(question)):
+        return False
+    return (all(_mentions(query, entity) for entity in _entities(question))
+            and all(_mentions(question, entity) for entity in _entities(query)))
+
+
+def chunk_questions(chunk: str) -> List[str]:
+    """Questions a chunk answers, from the dates and named entities in it."""
+    questions = [f"What happened on {date}?" for date in FULL_DATE_PATTERN.findall(chunk)]
+    questions += [f"What happened in {year}?" for year in FAQ_YEAR_PATTERN.findall(chunk)]
+    for entity in _entities(chunk):
+        if entity.split()[-1] in EVENT_WORDS:
+            questions.append(f"When did the {entity} happen?")
+            entity = "the " + entity
+        questions.append(f"What is the significance of {entity}?")
+    return questions
+
+
+def generate_questions(chunks: Sequence[str], limit: int = FAQ_MAX_QUESTIONS) -> List[str]:
+    """Up to ``limit`` distinct questions, those whose subject appears in the most chunks first."""
+    counts = Counter()
+    wording = {}
+    for chunk in chunks:
+        for question in set(chunk_questions(chunk)):
+            key = normalize_question(question)
+            counts[key] += 1
+            wording.setdefault(key, question)
+    # Ties keep the order the questions were first seen in
+    return [wording[key] for key, _ in counts.most_common(limit)]
+
+
+def is_answered(answer: Optional[str]) -> bool:
+    return bool(answer) and not normalize_question(answer).startswith(INSUFFICIENT_ANSWER)
+
+
+def _unit_rows(vectors) -> np.ndarray:
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.ascontiguousarray(vectors / np.where(norms == 0, 1, norms))
+
+
+class FAQEntry(NamedTuple):
+    question: str
+    answer: str
+    intent: str
+    chunks: List[str]
+    similarity: float
+
+
+class FAQIndex:
+    """Answers precomputed for generated FAQ questions, stored under ``path``.
+
+    A question is matched by its normalized text, or else by the nearest question embedding
+    in a FAISS index when the cosine similarity is at least ``similarity`` and the two
+    questions name the same dates, years and entities (``same_subject``). Questions,
+    answers and the index are memory-mapped, so forked workers share one copy. The
+    answers belong to the corpus they were built from, identified by ``fingerprint``.
+
+    Every rebuild writes a new set of files tagged with a build id, then switches
+    ``meta.json`` to it with one rename. A reader never pairs one build's questions with
+    another's answers, even if a rebuild is interrupted.
+    """
+
+    def __init__(self, path: str, similarity: float = FAQ_SIMILARITY):
+        with open(os.path.join(path, META), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.path = path
+        self.version = meta.get("version")
+        self.build = meta.get("build")
+        self.fingerprint = meta["fingerprint"]
+        self.top_n = meta["top_n"]
+        self.similarity = similarity
+        self.index = read_index_mmap(_file(path, INDEX, self.build) + ".faiss")
+        self.questions = MappedStrings(_file(path, QUESTIONS, self.build))
+        self.answers = MappedStrings(_file(path, ANSWERS, self.build))
+        self.sources = MappedStrings(_file(path, SOURCES, self.build))
+        self._positions = {normalize_question(question): i for i, question in enumerate(self.questions)}
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, META))
+
+    @staticmethod
+    def write(path: str, questions: List[str], embeddings, answers: List[str], intents: List[str],
+              chunks: List[List[str]], fingerprint: str, top_n: int):
+        """Save the answers for ``questions`` (with their query embeddings) over any previous set.
+
+        The new files sit next to the current build's until ``meta.json`` points at them.
+        The build before that one is deleted afterwards, while the one being replaced is
+        kept for readers that loaded its ``meta.json`` just before the switch.
+        """
+        os.makedirs(path, exist_ok=True)
+        previous = FAQIndex._build_of(path)
+        build = uuid.uuid4().hex[:12]
+        vectors = _unit_rows(embeddings)
+        index = build_index(FAQ_INDEX_TYPE, vectors)
+        faiss.write_index(index, _file(path, INDEX, build) + ".faiss")
+        write_strings(_file(path, QUESTIONS, build), questions)
+        write_strings(_file(path, ANSWERS, build), answers)
+        write_strings(_file(path, SOURCES, build), [json.dumps({"intent": intent, "chunks": entry_chunks})
+                                                   for intent, entry_chunks in zip(intents, chunks)])
+        # The one switch between builds: until this rename readers keep loading the previous build whole
+        tmp_path = os.path.join(path, META + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": FAQ_VERSION, "build": build, "fingerprint": fingerprint, "top_n": top_n,
+                       "questions": len(questions)}, f)
+        os.replace(tmp_path, os.path.join(path, META))
+        for name in os.listdir(path):
+            if name != META and not any(f"-{kept}" in name for kept in (build, previous) if kept):
+                os.remove(os.path.join(path, name))
+
+    @staticmethod
+    def _build_of(path: str) -> Optional[str]:
+        try:
+            with open(os.path.join(path, META), encoding="utf-8") as f:
+                return json.load(f).get("build")
+        except (OSError, ValueError):
+            return None
+
+    def entry(self, i: int, similarity: float = 1.0) -> FAQEntry:
+        source = json.loads(self.sources[i])
+        return FAQEntry(self.questions[i], self.answers[i], source["intent"], source["chunks"], similarity)
+
+    def get(self, question: str) -> Optional[FAQEntry]:
+        """The entry for exactly this question (after normalization); a dict lookup, no embedding needed."""
+        i = self._positions.get(normalize_question(question))
+        if i is None:
+            return None
+        self._count("exact_hits")
+        return self.entry(i)
+
+    def nearest(self, query_embedding, question: str = None) -> Optional[FAQEntry]:
+        """The entry of the most similar FAQ question, if it is at least ``similarity`` similar.
+
+        Given the query's ``question`` text, a hit about other dates or entities is a miss.
+        """
+        if not len(self):
+            self._count("misses")
+            return None
+        distances, positions = self.index.search(_unit_rows([query_embedding]), 1)
+        # Squared L2 distance between unit vectors is 2 - 2 * cosine similarity
+        similarity = 1 - float(distances[0][0]) / 2
+        position = int(positions[0][0])
+        if position < 0 or similarity < self.similarity or (
+                question is not None and not same_subject(question, self.questions[position])):
+            self._count("misses")
+            return None
+        self._count("similar_hits")
+        return self.entry(position, round(similarity, 4))
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.exact_hits + self.similar_hits
+            lookups = hits + self.misses
+            return {"questions": len(self), "exact_hits": self.exact_hits, "similar_hits": self.similar_hits,
+                    "misses": self.misses, "hit_rate": round(hits / lookups, 4) if lookups else 0.0}
@@ -0,0 +1,168 @@
+import os
+import re
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from bm25_index import tokenize
+
+INTENT_ROUTING = os.getenv("INTENT_ROUTING", "1") == "1"  # 0 sends every query to the LLM
+# Cosine similarity to the nearest intent centroid below which a query is treated as complex
+INTENT_MIN_SIMILARITY = float(os.getenv("INTENT_MIN_SIMILARITY", "0.35"))
+
+GREETING = "greeting"
+OUT_OF_SCOPE = "out_of_scope"
+DATE_LOOKUP = "date_lookup"
+COMPLEX = "complex"
+INTENTS = (GREETING, OUT_OF_SCOPE, DATE_LOOKUP, COMPLEX)
+
+INTENT_EXAMPLES = {
+    GREETING: [
+        "Hi", "Hello there", "Good morning!", "Hey, how are you?", "Thanks!",
+        "Thank you for your help", "Goodbye", "Nice to meet you",
+    ],
+    OUT_OF_SCOPE: [
+        "What's the weather like today?", "Write a Python function to sort a list",
+        "Who won the NBA finals?", "Recommend a good restaurant near me", "What is the capital of France?",
+        "How do I bake a chocolate cake?", "Tell me a joke", "What is the price of bitcoin?",
+    ],
+    DATE_LOOKUP: [
+        "When did the EDSA People Power Revolution happen?", "What year was José Rizal executed?",
+        "When was Philippine independence declared?", "In what year did Magellan arrive in the Philippines?",
+        "When was the Katipunan founded?", "What date did Japan invade the Philippines?",
+        "When did the Battle of Mactan take place?", "What year was the Commonwealth established?",
+    ],
+    COMPLEX: [
+        "Why did the Philippine Revolution against Spain begin?",
+        "How did American colonial rule change Philippine education?",
+        "Compare the leadership of Emilio Aguinaldo and Andres Bonifacio",
+        "What was the significance of the Katipunan?",
+        "Explain the causes and effects of martial law under Marcos",
+        "Who is José Rizal and why is he important?",
+        "What role did the Catholic Church play during Spanish colonization?",
+        "How did World War II affect the Philippines?",
+    ],
+}
+
+CANNED_RESPONSES = {
+    GREETING: "Hello! Ask me anything about Philippine history.",
+    OUT_OF_SCOPE: "I can only answer questions about Philippine history.",
+}
+
+YEAR_PATTERN = re.compile(r"\b(?:1[0-9]{3}|20[0-9]{2})\b")
+# Words that say what kind of answer is wanted but not what it is about
+QUESTION_TERMS = frozenset(
+    "when what which who year date day month did does do happen happened take place occur occurred".split()
+)
+
+
+def _unit_rows(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+class IntentClassifier:
+    """Nearest-centroid intent classifier over query embeddings.
+
+    Each intent's centroid is the mean of its example questions' unit embeddings,
+    computed with the index's own embedding model on first use. A query is given
+    the intent of the most similar centroid, or ``complex`` when no centroid is
+    similar enough, so uncertain queries take the full LLM path.
+    """
+
+    def __init__(self, embeddings, examples: Dict[str, List[str]] = None,
+                 min_similarity: float = INTENT_MIN_SIMILARITY):
+        self.embeddings = embeddings
+        self.examples = examples or INTENT_EXAMPLES
+        self.min_similarity = min_similarity
+        self.labels = list(self.examples)
+        self._centroids = None
+        self._lock = threading.Lock()
+
+    @property
+    def centroids(self) -> np.ndarray:
+        if self._centroids is None:
+            with self._lock:
+                if self._centroids is None:
+                    self._centroids = np.stack([
+                        _unit_rows(_unit_rows(self.embeddings.embed_documents(self.examples[label])).mean(axis=0))
+                        for label in self.labels
+                    ])
+        return self._centroids
+
+    def warm_up(self):
+        self.centroids
+
+    def classify(self, query_embedding: Sequence[float]) -> Tuple[str, float]:
+        """Intent of the query and its cosine similarity to that intent's centroid."""
+        similarities = self.centroids @ _unit_rows(query_embedding)
+        best = int(np.argmax(similarities))
+        similarity = float(similarities[best])
+        if similarity < self.min_similarity:
+            return COMPLEX, similarity
+        return self.labels[best], similarity
+
+
+def extract_date_answer(question: str, chunks: Sequence[str]) -> Optional[str]:
+    """The retrieved sentence with a year that best covers the question's subject, if any.
+
+    At least half of the question's subject words must appear in the sentence;
+    otherwise ``None`` is returned and the question goes to the LLM.
+    """
+    terms = set(tokenize(question)) - QUESTION_TERMS
+    if not terms:
+        return None
+    best, best_overlap = None, 0
+    for chunk in chunks:
+        for sentence in re.split(r"(?<=[.!?])\s+", chunk):
+            if not YEAR_PATTERN.search(sentence):
+                continue
+            overlap = len(terms & set(tokenize(sentence)))
+            if overlap > best_overlap:
+                best, best_overlap = sentence.strip(), overlap
+    if best is None or 2 * best_overlap < len(terms):
+        return None
+    return best
+
+
+def fast_answer(intent: str, question: str, retrieved_chunks: Sequence[str]) -> Optional[str]:
+    """Answer without the LLM when the intent allows it; ``None`` means ask the LLM."""
+    if intent in CANNED_RESPONSES:
+        return CANNED_RESPONSES[intent]
+    if intent == DATE_LOOKUP:
+        return extract_date_answer(question, retrieved_chunks)
+    return None
+
+
+class IntentStats:
+    """Thread-safe per-intent request counts, LLM calls and latency."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = {intent: {"count": 0, "llm_calls": 0, "total_ms": 0.0, "max_ms": 0.0} for intent in INTENTS}
+
+    def record(self, intent: str, seconds: float, llm_called: bool):
+        ms = seconds * 1000
+        with self._lock:
+            row = self._rows[intent]
+            row["count"] += 1
+            row["llm_calls"] += int(llm_called)
+            row["total_ms"] += ms
+            row["max_ms"] = max(row["max_ms"], ms)
+
+    def stats(self) -> dict:
+        with self._lock:
+            by_intent = {
+                intent: {
+                    "count": row["count"],
+                    "llm_calls": row["llm_calls"],
+                    "avg_ms": round(row["total_ms"] / row["count"], 3) if row["count"] else 0.0,
+                    "max_ms": round(row["max_ms"], 3),
+                }
+                for intent, row in self._rows.items()
+            }
+            total = sum(row["count"] for row in self._rows.values())
+            llm_calls = sum(row["llm_calls"] for row in self._rows.values())
+        return {"requests": total, "llm_calls": llm_calls,
+                "llm_fraction": round(llm_calls / total, 4) if total else 0.0, "by_intent": by_intent}
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import os
+from typing import Dict, List
+
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def next_chunk_id(source: str, chunk: str, seen: Dict[bytes, int]) -> str:
+    """Content-derived, stable ID of the next chunk of ``source``, given its chunks so far in order.
+
+    ``seen`` counts the file's earlier chunks by content digest: identical chunks inside a
+    file (repeated headers, for example) are told apart by their occurrence number, so an
+    edit elsewhere in the file does not change their IDs.
+    """
+    digest = hashlib.sha1(chunk.encode('utf-8')).digest()
+    occurrence = seen.get(digest, 0)
+    seen[digest] = occurrence + 1
+    key = f"{source}\0{occurrence}\0{chunk}".encode('utf-8')
+    return hashlib.sha1(key).hexdigest()
+
+
+class IndexManifest:
+    """Which files are in the index, their content hash and the IDs of their chunks."""
+
+    def __init__(self, path: str, settings: dict = None, files: dict = None):
+        self.path = path
+        self.settings = settings or {}
+        self.files = files or {}
+
+    @classmethod
+    def load(cls, path: str) -> 'IndexManifest':
+        if not os.path.exists(path):
+            return cls(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != MANIFEST_VERSION:
+            return cls(path)
+        return cls(path, data.get('settings'), data.get('files'))
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': MANIFEST_VERSION, 'settings': self.settings, 'files': self.files}, f)
+        os.replace(tmp_path, self.path)
+
+    def is_unchanged(self, source: str, sha256: str) -> bool:
+        entry = self.files.get(source)
+        return entry is not None and entry['sha256'] == sha256
+
+    def chunk_ids(self, source: str) -> List[str]:
+        return self.files.get(source, {}).get('chunk_ids', [])
+
+    def record(self, source: str, sha256: str, chunk_ids: List[str]):
+        self.files[source] = {'sha256': sha256, 'chunk_ids': chunk_ids}
+
+    def forget(self, source: str):
+        self.files.pop(source, None)
+
+    def fingerprint(self) -> str:
+        """Changes whenever the indexed files or the settings they were chunked and embedded with change."""
+        content = {'settings': self.settings, 'files': {source: entry['sha256'] for source, entry in self.files.items()}}
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()
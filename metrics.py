@@ -0,0 +1,257 @@
+import bisect
+import contextvars
+import functools
+import inspect
+import io
+import os
+import threading
+import time
+from typing import Dict, Optional, Sequence, Tuple
+
+METRICS = os.getenv("METRICS", "1") == "1"  # 0 turns every timer and counter into a no-op
+# Per-request profiling is opt-in: the profiler slows the request it runs on considerably
+PROFILING = os.getenv("PROFILING", "0") == "1"
+PROFILER = os.getenv("PROFILER", "cprofile")  # cprofile or pyinstrument
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Stage timings of the request being handled, if it asked for them; see ``collect_timings``
+_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("timings", default=None)
+
+
+def _label_key(label_names: Tuple[str, ...], labels: dict) -> Tuple[str, ...]:
+    return tuple(str(labels.get(name, "")) for name in label_names)
+
+
+def _format_labels(label_names: Sequence[str], key: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{value}"' for name, value in zip(label_names, key)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    """Monotonic counter per label combination, rendered in the Prometheus text format."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        if not METRICS:
+            return
+        key = _label_key(self.label_names, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(_label_key(self.label_names, labels), 0)
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {value}" for key, value in items]
+
+
+class Gauge(Counter):
+    """Value per label combination that can go up and down, such as a queue's depth."""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        if not METRICS:
+            return
+        key = _label_key(self.label_names, labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label combination, rendered in the Prometheus text format."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label key -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        if not METRICS:
+            return
+        key = _label_key(self.label_names, labels)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[slot] += 1
+            series[-1] += value
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            series = self._series.get(_label_key(self.label_names, labels))
+            return sum(series[:-1]) if series else 0
+
+    def render(self) -> list:
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "rag_stage_seconds", "Time spent in each pipeline stage", ["stage"]))
+STAGE_ERRORS = REGISTRY.register(Counter(
+    "rag_stage_errors_total", "Exceptions raised by each pipeline stage", ["stage"]))
+RETRIEVED_CHUNKS = REGISTRY.register(Histogram(
+    "rag_retrieved_chunks", "Chunks retrieved per query", buckets=COUNT_BUCKETS))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "rag_llm_tokens_total", "Prompt and completion tokens sent to and received from the LLM", ["kind"]))
+COALESCED_REQUESTS = REGISTRY.register(Counter(
+    "rag_coalesced_requests_total",
+    "/query requests that ran the pipeline (leader) or shared an identical in-flight request's result (follower)",
+    ["role"]))
+ADMISSION_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "rag_admission_queue_depth", "Requests waiting for a slot in each stage", ["stage"]))
+ADMISSION_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "rag_admission_wait_seconds", "Time requests waited for a slot in each stage", ["stage", "priority"]))
+ADMISSION_REJECTED = REGISTRY.register(Counter(
+    "rag_admission_rejected_total", "Requests turned away because a stage's queue was full or too slow",
+    ["stage", "reason"]))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "rag_request_seconds", "Time to respond to an API request, until the response starts", ["endpoint"]))
+REQUEST_ERRORS = REGISTRY.register(Counter(
+    "rag_request_errors_total", "API responses with a 4xx or 5xx status", ["endpoint", "status"]))
+
+
+class timer:
+    """Times a block as ``stage``: observed in ``STAGE_SECONDS``, counted in ``STAGE_ERRORS`` if it raises,
+    and added to the current request's timings when it collects them."""
+
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        STAGE_SECONDS.observe(elapsed, stage=self.stage)
+        # A stream closed early by its consumer (GeneratorExit) has not failed
+        if exc_type is not None and not issubclass(exc_type, GeneratorExit):
+            STAGE_ERRORS.inc(stage=self.stage)
+        timings = _timings.get()
+        if timings is not None:
+            timings[self.stage] = timings.get(self.stage, 0.0) + elapsed
+        return False
+
+
+def timed(stage: str):
+    """Decorator form of ``timer`` for functions, coroutines and async generators."""
+    def decorate(func):
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with timer(stage):
+                    async for item in func(*args, **kwargs):
+                        yield item
+        elif inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with timer(stage):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with timer(stage):
+                    return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def collect_timings() -> Dict[str, float]:
+    """Start collecting stage timings (seconds) for the current request; returns the dict they go into.
+
+    The dict lives in a context variable, so work the request hands to a thread pool must run
+    in a copy of the request's context (``contextvars.copy_context().run``) to be included.
+    """
+    timings = {}
+    _timings.set(timings)
+    return timings
+
+
+def timings_ms(timings: Dict[str, float]) -> Dict[str, float]:
+    return {stage: round(seconds * 1000, 3) for stage, seconds in timings.items()}
+
+
+class Profiler:
+    """Opt-in profiler for one request's work: cProfile, or pyinstrument when ``PROFILER=pyinstrument``.
+
+    Only the thread that runs ``run`` is profiled.
+    """
+
+    def __init__(self, kind: str = PROFILER):
+        self.kind = kind
+        self._profiler = None
+
+    def run(self, func, *args):
+        if self.kind == "pyinstrument":
+            from pyinstrument import Profiler as PyinstrumentProfiler
+            self._profiler = PyinstrumentProfiler()
+            self._profiler.start()
+            try:
+                return func(*args)
+            finally:
+                self._profiler.stop()
+        import cProfile
+        self._profiler = cProfile.Profile()
+        return self._profiler.runcall(func, *args)
+
+    def report(self, limit: int = 30) -> str:
+        if self._profiler is None:
+            return ""
+        if self.kind == "pyinstrument":
+            return self._profiler.output_text()
+        import pstats
+        out = io.StringIO()
+        pstats.Stats(self._profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
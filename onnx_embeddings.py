@@ -0,0 +1,93 @@
+import os
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+ONNX_MODEL_PATH = os.getenv("ONNX_MODEL_PATH", "data/onnx/all-MiniLM-L6-v2")
+ONNX_QUANTIZED = os.getenv("ONNX_QUANTIZED", "0") == "1"  # use the int8 dynamically quantized model
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))  # intra-op threads; 0 lets ONNX Runtime decide
+ONNX_BATCH_SIZE = 32
+MAX_SEQ_LENGTH = 256  # sentence-transformers truncates all-MiniLM-L6-v2 input here too
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model_int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+
+
+class OnnxEmbeddings(Embeddings):
+    """Sentence embeddings from an exported transformer run with ONNX Runtime on CPU.
+
+    Mean pooling over the attention mask followed by L2 normalisation, the same head
+    sentence-transformers puts on all-MiniLM-L6-v2. Only files under ``model_dir`` are read.
+    """
+
+    def __init__(self, model_dir: str = ONNX_MODEL_PATH, quantized: bool = ONNX_QUANTIZED,
+                 threads: int = ONNX_THREADS, batch_size: int = ONNX_BATCH_SIZE, max_length: int = MAX_SEQ_LENGTH):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_path = os.path.join(model_dir, QUANTIZED_MODEL_FILE if quantized else MODEL_FILE)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"No ONNX model at {model_path}; create it with `python run.py export-onnx`")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {node.name for node in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length)
+        pad_token = "[PAD]"
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id(pad_token) or 0, pad_token=pad_token)
+        self.batch_size = batch_size
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": np.array([e.ids for e in encodings], dtype=np.int64), "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        hidden = self.session.run(None, feeds)[0]
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        return pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Batch texts of similar length together so little work goes into padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for i, vector in zip(batch, self._embed([texts[i] for i in batch])):
+                vectors[i] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0].tolist()
+
+
+def export_onnx(model_name: str, output_dir: str = ONNX_MODEL_PATH, quantize: bool = True):
+    """Export ``model_name`` to ``output_dir`` as ONNX, plus an int8 copy when ``quantize``.
+
+    Needs torch and transformers (and network or a local Hugging Face cache) once; serving
+    with ``OnnxEmbeddings`` afterwards needs only onnxruntime and tokenizers.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    tokenizer.save_pretrained(output_dir)  # writes tokenizer.json for the fast tokenizer
+    model = AutoModel.from_pretrained(model_name, return_dict=False).eval()
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    sample = tokenizer(["An example sentence to trace the model with."], return_tensors="pt")
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]}
+    dynamic_axes["pooler_output"] = {0: "batch"}
+    model_path = os.path.join(output_dir, MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(model, tuple(sample[name] for name in input_names), model_path,
+                          input_names=input_names, output_names=["last_hidden_state", "pooler_output"],
+                          dynamic_axes=dynamic_axes, opset_version=14)
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(model_path, os.path.join(output_dir, QUANTIZED_MODEL_FILE), weight_type=QuantType.QInt8)
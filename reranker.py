@@ -0,0 +1,146 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+RERANKING = os.getenv("RERANKING", "0") == "1"  # rerank retrieved chunks with a local cross-encoder
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_DEVICE = os.getenv("RERANK_DEVICE", "cpu")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "50"))  # first-stage results reranked at most
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "3"))  # chunks passed on after reranking
+# Share of the candidates' score spread by which the top result must lead the first chunk left
+# out for the first-stage order to be trusted and reranking skipped
+RERANK_SKIP_GAP = float(os.getenv("RERANK_SKIP_GAP", "0.5"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "16384"))  # (query, chunk) scores kept in memory
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def rerank_depth(scores: Sequence[float], keep: int, higher_is_better: bool,
+                 max_depth: int = RERANK_CANDIDATES, skip_gap: float = RERANK_SKIP_GAP) -> int:
+    """How many first-stage candidates to rerank; 0 when the first-stage order is trusted.
+
+    ``scores`` are the first-stage scores, best first. The bigger the lead of the top result
+    over the first candidate that would be left out (relative to the spread of all scores),
+    the fewer candidates are reranked; past ``skip_gap`` none are.
+    """
+    relevance = np.asarray(scores, dtype=np.float64)[:max_depth]
+    if len(relevance) <= keep:
+        return 0  # everything is passed on anyway
+    if not higher_is_better:
+        relevance = -relevance
+    spread = relevance[0] - relevance[-1]
+    if spread <= 0:
+        return len(relevance)
+    gap = (relevance[0] - relevance[keep]) / spread
+    if gap >= skip_gap:
+        return 0
+    depth = keep + int(round((len(relevance) - keep) * (1 - gap / skip_gap)))
+    return min(len(relevance), max(depth, 2 * keep))
+
+
+class CrossEncoderReranker:
+    """Re-scores (query, chunk) pairs with a cross-encoder, run in batches on CPU.
+
+    The model is loaded on first use (or by ``warm_up``). Scores are cached per query and
+    chunk text, so a repeated query only pays for chunks it has not seen with it.
+    """
+
+    def __init__(self, model_name: str = RERANK_MODEL, device: str = RERANK_DEVICE,
+                 batch_size: int = RERANK_BATCH_SIZE, cache_size: int = RERANK_CACHE_SIZE,
+                 max_depth: int = RERANK_CANDIDATES, skip_gap: float = RERANK_SKIP_GAP, model=None):
+        self.model_name = model_name
+        self.device = device
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.max_depth = max_depth
+        self.skip_gap = skip_gap
+        self._model = model
+        self._model_lock = threading.Lock()
+        self._scores = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.reranked = 0
+        self.skipped = 0
+        self.pairs_scored = 0
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(self.model_name, device=self.device)
+        return self._model
+
+    def warm_up(self):
+        self.model.predict([("warm up", "warm up")], batch_size=1)
+
+    def score(self, pairs: Sequence[Tuple[str, str]]) -> List[float]:
+        """Cross-encoder scores of (query, chunk) pairs; uncached pairs go through the model in one batched call."""
+        keys = [(query, hashlib.sha1(chunk.encode("utf-8")).digest()) for query, chunk in pairs]
+        with self._cache_lock:
+            scores = [self._scores.get(key) for key in keys]
+            for key, score in zip(keys, scores):
+                if score is not None:
+                    self._scores.move_to_end(key)
+        missing = {}
+        for i, (key, score) in enumerate(zip(keys, scores)):
+            if score is None:
+                missing.setdefault(key, i)
+        if missing:
+            predicted = self.model.predict([pairs[i] for i in missing.values()], batch_size=self.batch_size)
+            computed = {key: float(score) for key, score in zip(missing, predicted)}
+            with self._cache_lock:
+                self._scores.update(computed)
+                for key in computed:
+                    self._scores.move_to_end(key)
+                while len(self._scores) > self.cache_size:
+                    self._scores.popitem(last=False)
+            self.pairs_scored += len(computed)
+            scores = [score if score is not None else computed[key] for key, score in zip(keys, scores)]
+        return scores
+
+    def rerank_many(self, queries: Sequence[str], rows: Sequence[Sequence[Tuple[str, float]]], keep: int,
+                    higher_is_better: bool) -> List[List[Tuple[str, float]]]:
+        """The best ``keep`` (chunk, score) pairs per query.
+
+        Confident queries (see ``rerank_depth``) keep their first-stage order and scores; the
+        rest are reranked over an adaptive number of candidates, scoring every query's
+        pairs in one batch, and carry cross-encoder scores (higher is better).
+        """
+        depths = [rerank_depth([score for _, score in row], keep, higher_is_better, self.max_depth, self.skip_gap)
+                  for row in rows]
+        pairs = [(query, chunk) for query, row, depth in zip(queries, rows, depths) for chunk, _ in row[:depth]]
+        scores = iter(self.score(pairs)) if pairs else iter(())
+        results = []
+        for row, depth in zip(rows, depths):
+            if not depth:
+                self.skipped += 1
+                results.append(list(row[:keep]))
+                continue
+            self.reranked += 1
+            rescored = [(chunk, next(scores)) for chunk, _ in row[:depth]]
+            # sorted() is stable, so ties keep the first-stage order
+            results.append(sorted(rescored, key=lambda item: -item[1])[:keep])
+        return results
+
+    def stats(self) -> dict:
+        with self._cache_lock:
+            cached = len(self._scores)
+        return {"reranked": self.reranked, "skipped": self.skipped, "pairs_scored": self.pairs_scored,
+                "cached_scores": cached}
+
+
+def get_reranker() -> CrossEncoderReranker:
+    """The process-wide reranker, shared by every index shard so the model is loaded once."""
+    global _reranker
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                _reranker = CrossEncoderReranker()
+    return _reranker
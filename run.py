@@ -1,13 +1,32 @@
 import os
 import sys
-import fitz  # PyMuPDF
-import pickle
-from typing import List
+import argparse
+import hashlib
+import json
+import faiss
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
 from dotenv import load_dotenv
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_openai import ChatOpenAI
+from manifest import IndexManifest, file_sha256, next_chunk_id
+from embedding_cache import CachedEmbeddings, EmbeddingStore, LazyEmbeddings, EMBEDDING_CACHE_PATH
+from answer_cache import AnswerStore, ANSWER_STORE_PATH
+from faiss_indexes import (BINARY_VECTORS, INDEX_TYPES, FAISS_INDEX_TYPE, BinaryIndex, build_index,
+                           effective_index_type, filtered_search, index_type_of, read_index_dir, set_search_params)
+from chunk_store import ChunkDocstore, ChunkStore
+from onnx_embeddings import ONNX_MODEL_PATH, ONNX_QUANTIZED
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from intent import CANNED_RESPONSES, COMPLEX, INTENT_ROUTING, IntentClassifier, fast_answer
+from context_builder import CONTEXT_TOKEN_BUDGET, assemble_context, count_tokens
+from reranker import RERANK_CANDIDATES, RERANK_TOP_N, RERANKING, CrossEncoderReranker, get_reranker
+from corpus import (COLLECTIONS_PATH, DEFAULT_COLLECTION, SHARD_SEARCH_WORKERS, MetadataIndex, list_collections,
+                    merge_top_k, split_filter, validate_collection)
+from metrics import LLM_TOKENS, RETRIEVED_CHUNKS, timed, timer
+from dedup import INDEX_DEDUP_SIMILARITY, find_duplicates
+from faq_index import (FAQ_ANSWERS, FAQ_CONCURRENCY, FAQ_INDEX_PATH, FAQ_MAX_QUESTIONS, FAQ_VERSION, FAQIndex,
+                       generate_questions, is_answered)
 
 # Suppress tokenizers parallelism warning
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
@@ -19,57 +38,720 @@ PDF_PATH = 'data/philippine_history.pdf'
 CHUNK_SIZE = 500
 CHUNK_OVERLAP = 50
 TOP_N = 5  # Increased for more context
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+PAGES_PER_TASK = 16  # pages extracted per worker task
+PARALLEL_MIN_PAGES = 64  # smaller PDFs are extracted in-process
+EMBED_BATCH_SIZE = 256  # chunks embedded and added to the index per step
 INDEX_PATH = 'data/faiss_index'
-CHUNKS_PATH = 'data/chunks.pkl'
+CHUNKS_PATH = 'data/chunks'
+BM25_PATH = 'data/bm25'
+MANIFEST_PATH = 'data/index_manifest.json'
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_BACKENDS = ("torch", "onnx")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# Fuse BM25 and vector results with reciprocal-rank fusion when the BM25 index is loaded
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1") == "1"
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))  # results taken from each retriever before fusion
+LLM_MODEL = "gpt-3.5-turbo"
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "20"))  # max pooled HTTP connections to the LLM provider
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))  # seconds
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
 
+_llm = None
+_llm_lock = threading.Lock()
+_shard_executor = None
+_shard_executor_lock = threading.Lock()
 
-def load_pdf_chunks(pdf_path: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> List[str]:
-    doc = fitz.open(pdf_path)
-    text = ""
-    for page in doc:
-        text += page.get_text()
+# PyMuPDF, the text splitter, LangChain's FAISS store, sentence-transformers and the OpenAI
+# client are imported inside the functions that use them: together they dominate start-up time.
+
+
+def _extract_page_range(pdf_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    # Runs in a worker process, which opens its own handle on the file
+    import fitz  # PyMuPDF
+    with fitz.open(pdf_path) as doc:
+        return [(page_no + 1, doc[page_no].get_text()) for page_no in range(start, end)]
+
+
+def iter_pdf_pages(pdf_path: str, workers: int = INGEST_WORKERS) -> Iterator[Tuple[int, str]]:
+    """Yield (page_number, text) in page order, extracting large PDFs in a process pool."""
+    import fitz  # PyMuPDF
+    with fitz.open(pdf_path) as doc:
+        page_count = len(doc)
+        if workers <= 1 or page_count < PARALLEL_MIN_PAGES:
+            for page_no, page in enumerate(doc, start=1):
+                yield page_no, page.get_text()
+            return
+    ranges = [(start, min(start + PAGES_PER_TASK, page_count)) for start in range(0, page_count, PAGES_PER_TASK)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Keep only a few tasks in flight so extracted text never piles up ahead of the consumer
+        pending = deque()
+        for start, end in ranges:
+            pending.append(pool.submit(_extract_page_range, pdf_path, start, end))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def iter_pdf_chunks(pdf_path: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP,
+                    workers: int = INGEST_WORKERS) -> Iterator[Tuple[str, int]]:
+    """Yield (chunk, page_number), splitting each page as soon as it is extracted."""
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
     splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-    return splitter.split_text(text)
+    for page_no, text in iter_pdf_pages(pdf_path, workers):
+        for chunk in splitter.split_text(text):
+            yield chunk, page_no
+
+
+def iter_batches(items, batch_size: int = EMBED_BATCH_SIZE):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def load_pdf_chunks(pdf_path: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> List[str]:
+    return [chunk for chunk, _ in iter_pdf_chunks(pdf_path, chunk_size, chunk_overlap)]
+
+
+def embedding_model_id() -> str:
+    """Names the vectors the configured backend produces; the caches and the manifest are keyed on it."""
+    if EMBEDDING_BACKEND not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend {EMBEDDING_BACKEND!r}; expected one of {', '.join(EMBEDDING_BACKENDS)}")
+    if EMBEDDING_BACKEND == "onnx":
+        # ONNX (and especially int8) vectors differ slightly from PyTorch ones and must not mix with them
+        return f"{EMBEDDING_MODEL}@onnx{'-int8' if ONNX_QUANTIZED else ''}"
+    return EMBEDDING_MODEL
+
+
+def _create_embedding_model():
+    if EMBEDDING_BACKEND == "onnx":
+        from onnx_embeddings import OnnxEmbeddings
+        return OnnxEmbeddings(ONNX_MODEL_PATH, ONNX_QUANTIZED)
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+
 
+def load_embeddings() -> CachedEmbeddings:
+    """The MiniLM embedding model behind the persistent chunk cache and query LRU.
 
-def build_or_load_index():
-    if os.path.exists(INDEX_PATH) and os.path.exists(CHUNKS_PATH):
+    The model itself is loaded on first use (or by ``warm_up``), not here.
+    """
+    return CachedEmbeddings(LazyEmbeddings(_create_embedding_model), embedding_model_id(),
+                            EmbeddingStore(EMBEDDING_CACHE_PATH))
+
+
+class IndexPaths(NamedTuple):
+    index: str
+    chunks: str
+    bm25: str
+    manifest: str
+
+
+def collection_paths(collection: str = None) -> IndexPaths:
+    """Where a collection's index shard is saved; the default collection keeps the original paths."""
+    if collection in (None, DEFAULT_COLLECTION):
+        return IndexPaths(INDEX_PATH, CHUNKS_PATH, BM25_PATH, MANIFEST_PATH)
+    root = os.path.join(COLLECTIONS_PATH, validate_collection(collection))
+    return IndexPaths(os.path.join(root, 'faiss_index'), os.path.join(root, 'chunks'), os.path.join(root, 'bm25'),
+                      os.path.join(root, 'index_manifest.json'))
+
+
+@timed("index_load")
+def load_mapped_index(embeddings, paths: IndexPaths = None):
+    """Read-only vectorstore over the memory-mapped FAISS index and chunk store (default collection's by default).
+
+    Uvicorn workers that load the same files share their pages instead of each holding a copy.
+    """
+    from langchain_community.vectorstores import FAISS
+    paths = paths or collection_paths()
+    index = read_index_dir(paths.index)
+    store = ChunkStore(paths.chunks)
+    # The chunk store is in index order, so the docstore is addressed by FAISS position
+    vectorstore = FAISS(embeddings, index, ChunkDocstore(store), range(index.ntotal))
+    vectorstore.lexical_index = BM25Index.load(paths.bm25)
+    vectorstore.metadata_index = MetadataIndex(store.metadatas)
+    vectorstore.intent_classifier = IntentClassifier(embeddings)
+    vectorstore.reranker = get_reranker() if RERANKING else None
+    return vectorstore
+
+
+def load_shards(vectorstore, nprobe: int = None, ef_search: int = None) -> dict:
+    """The default collection's ``vectorstore`` and a memory-mapped shard per collection in ``COLLECTIONS_PATH``.
+
+    Every shard shares the default one's embedding model, so a query is embedded once for all of them.
+    """
+    shards = {DEFAULT_COLLECTION: vectorstore}
+    for name in list_collections(COLLECTIONS_PATH):
+        paths = collection_paths(name)
+        if name == DEFAULT_COLLECTION or not (ChunkStore.exists(paths.chunks) and BM25Index.exists(paths.bm25)):
+            continue
+        shard = load_mapped_index(vectorstore.embedding_function, paths)
+        set_search_params(shard.index, nprobe, ef_search)
+        shards[name] = shard
+    return shards
+
+
+def build_or_load_index(index_type: str = None, nprobe: int = None, ef_search: int = None):
+    """Load the persisted index (or build it from the PDF) as ``index_type`` (default ``FAISS_INDEX_TYPE``).
+
+    The returned vectorstore is memory-mapped and read-only; the chunks are a lazy sequence.
+    ``nprobe`` and ``ef_search`` override the IVF and HNSW query-time settings.
+    """
+    from langchain_community.vectorstores import FAISS
+    index_type = index_type or FAISS_INDEX_TYPE
+    embeddings = load_embeddings()
+    if os.path.exists(INDEX_PATH) and ChunkStore.exists(CHUNKS_PATH) and BM25Index.exists(BM25_PATH):
         print("Loading FAISS index and chunks from disk...")
-        vectorstore = FAISS.load_local(
-            INDEX_PATH,
-            HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2"),
-            allow_dangerous_deserialization=True
-        )
-        with open(CHUNKS_PATH, 'rb') as f:
-            chunks = pickle.load(f)
-        return vectorstore, chunks
+        vectorstore = load_mapped_index(embeddings)
+        if index_type_of(vectorstore.index) == effective_index_type(index_type, vectorstore.index.ntotal):
+            set_search_params(vectorstore.index, nprobe, ef_search)
+            return vectorstore, vectorstore.docstore.store.texts
+    if os.path.exists(INDEX_PATH):
+        # Another index type was asked for, or the index predates the chunk store or BM25 index
+        print(f"Converting the saved index to {index_type}...")
+        vectorstore = FAISS.load_local(INDEX_PATH, embeddings, allow_dangerous_deserialization=True)
+        ensure_index_type(vectorstore, index_type)
     else:
         print("Index not found. Building FAISS index from PDF...")
         if not os.path.exists(PDF_PATH):
             print(f"PDF file not found at {PDF_PATH}")
             sys.exit(1)
-        chunks = load_pdf_chunks(PDF_PATH)
-        print(f"Loaded {len(chunks)} chunks.")
-        embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-        vectorstore = FAISS.from_texts(chunks, embeddings)
-        vectorstore.save_local(INDEX_PATH)
-        with open(CHUNKS_PATH, 'wb') as f:
-            pickle.dump(chunks, f)
-        return vectorstore, chunks
-
-
-def retrieve_chunks(vectorstore, query: str, top_n: int = TOP_N):
-    docs_and_scores = vectorstore.similarity_search_with_score(query, k=top_n)
+        vectorstore, _ = update_index([PDF_PATH], None, embeddings, index_type=index_type)
+        if vectorstore is None:
+            print(f"No text could be extracted from {PDF_PATH}")
+            sys.exit(1)
+    chunks = save_index(vectorstore)
+    print(f"Loaded {len(chunks)} chunks.")
+    # Serve from the files just written, as a later start would
+    vectorstore = load_mapped_index(embeddings)
+    set_search_params(vectorstore.index, nprobe, ef_search)
+    return vectorstore, vectorstore.docstore.store.texts
+
+
+def index_settings() -> dict:
+    # Changing any of these invalidates the chunks recorded in the manifest
+    return {"chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP, "embedding_model": embedding_model_id()}
+
+
+def index_vectors(vectorstore) -> np.ndarray:
+    """Stored vectors in FAISS index order."""
+    index = vectorstore.index
+    if index_type_of(index) in ("flat", "hnsw", "binary"):
+        # The binary index gives back its float16 vectors, within rounding of the originals
+        return index.reconstruct_n(0, index.ntotal)
+    # IVF lists cannot be read back by position (PQ and bit codes are lossy); re-embed from the cache
+    vectors = np.asarray(vectorstore.embedding_function.embed_documents(index_chunks(vectorstore)), dtype=np.float32)
+    if getattr(vectorstore, "_normalize_L2", False):
+        faiss.normalize_L2(vectors)
+    return vectors
+
+
+def ensure_index_type(vectorstore, index_type: str) -> bool:
+    """Rebuild ``vectorstore.index`` as ``index_type`` if it is not already; returns whether it did."""
+    target = effective_index_type(index_type, vectorstore.index.ntotal)
+    if index_type_of(vectorstore.index) == target:
+        return False
+    # Positions are kept, so index_to_docstore_id stays valid
+    vectorstore.index = build_index(target, index_vectors(vectorstore))
+    return True
+
+
+def _editable(vectorstore):
+    # LangChain deletes by position and appends at ntotal, which only a flat index supports;
+    # edit a flat copy and rebuild the ANN index once the update is done
+    if vectorstore is not None:
+        ensure_index_type(vectorstore, "flat")
+    return vectorstore
+
+
+def _add_chunks(vectorstore, embeddings, batch, source: str, collection: str):
+    """Embed a batch of (chunk ID, text, page) and index the chunks that are not near-duplicates.
+
+    A chunk at least ``INDEX_DEDUP_SIMILARITY`` similar to an indexed chunk, or to an earlier
+    one in the batch, is left out: its ID, source and page are appended to the ``duplicates``
+    metadata of the chunk it matched, so repeated headers, footers and boilerplate pages are
+    stored once with every page they came from. Returns (vectorstore, duplicates left out).
+    """
+    from langchain_community.vectorstores import FAISS
+    vectors = np.asarray(embeddings.embed_documents([chunk for _, chunk, _ in batch]), dtype=np.float32)
+    index = vectorstore.index if vectorstore is not None else None
+    duplicate_of = find_duplicates(vectors, index, INDEX_DEDUP_SIMILARITY)
+    ntotal = index.ntotal if index is not None else 0
+    metadatas = [{"source": source, "page": page_no, "collection": collection} for _, _, page_no in batch]
+    for row in np.flatnonzero(duplicate_of >= 0):
+        target = int(duplicate_of[row])
+        if target < ntotal:
+            # An in-memory docstore hands out the stored document, so this edits it in place
+            metadata = vectorstore.docstore.search(vectorstore.index_to_docstore_id[target]).metadata
+        else:
+            metadata = metadatas[target - ntotal]
+        cid, _, page_no = batch[row]
+        metadata.setdefault("duplicates", []).append({"id": cid, "source": source, "page": page_no})
+    kept = np.flatnonzero(duplicate_of < 0)
+    if len(kept):
+        text_embeddings = [(batch[i][1], vectors[i].tolist()) for i in kept]
+        kept_metadatas = [metadatas[i] for i in kept]
+        kept_ids = [batch[i][0] for i in kept]
+        if vectorstore is None:
+            vectorstore = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=kept_metadatas, ids=kept_ids)
+        else:
+            vectorstore.add_embeddings(text_embeddings, metadatas=kept_metadatas, ids=kept_ids)
+    return vectorstore, len(batch) - len(kept)
+
+
+def _delete_chunks(vectorstore, ids: List[str]):
+    """Delete chunks by ID, including near-duplicates that were never indexed.
+
+    A deleted duplicate is dropped from the ``duplicates`` list it is in. A deleted indexed
+    chunk whose list still holds live duplicates is not lost to them: its text and vector
+    are re-added under the first duplicate's ID, source and page, carrying the rest.
+    """
+    ids = set(ids)
+    positions = {cid: position for position, cid in vectorstore.index_to_docstore_id.items()}
+    merged = ids.difference(positions)
+    if merged:
+        for cid in positions:
+            metadata = vectorstore.docstore.search(cid).metadata
+            duplicates = metadata.get("duplicates")
+            if duplicates and any(entry["id"] in merged for entry in duplicates):
+                duplicates[:] = [entry for entry in duplicates if entry["id"] not in merged]
+                if not duplicates:
+                    del metadata["duplicates"]
+    indexed = [cid for cid in ids if cid in positions]
+    promoted, promoted_metadatas, promoted_ids = [], [], []
+    for cid in indexed:
+        doc = vectorstore.docstore.search(cid)
+        survivors = [entry for entry in doc.metadata.get("duplicates", []) if entry["id"] not in ids]
+        if survivors:
+            first, rest = survivors[0], survivors[1:]
+            metadata = {**doc.metadata, "source": first["source"], "page": first["page"]}
+            metadata.pop("duplicates")
+            if rest:
+                metadata["duplicates"] = rest
+            promoted.append((doc.page_content, vectorstore.index.reconstruct(positions[cid]).tolist()))
+            promoted_metadatas.append(metadata)
+            promoted_ids.append(first["id"])
+    if indexed:
+        vectorstore.delete(indexed)
+    if promoted:
+        vectorstore.add_embeddings(promoted, metadatas=promoted_metadatas, ids=promoted_ids)
+
+
+def _iter_new_chunks(source: str, old_ids: set, ids: List[str]) -> Iterator[Tuple[str, str, int]]:
+    """Stream (chunk ID, chunk, page) for the chunks of ``source`` whose ID is not in ``old_ids``.
+
+    Every chunk's ID is appended to ``ids`` as it is read, so only the IDs of the whole
+    file are held, not its text.
+    """
+    seen = {}
+    for chunk, page_no in iter_pdf_chunks(source, CHUNK_SIZE, CHUNK_OVERLAP):
+        cid = next_chunk_id(source, chunk, seen)
+        ids.append(cid)
+        if cid not in old_ids:
+            yield cid, chunk, page_no
+
+
+def update_index(pdf_paths: List[str], vectorstore, embeddings, remove_missing_under: str = None,
+                 index_type: str = None, collection: str = None):
+    """Bring the index in line with ``pdf_paths``, embedding only chunks it does not already hold.
+
+    Unchanged files (same SHA-256 and chunking settings) are skipped. For new or changed
+    files, chunks are streamed from the PDF in embedding-sized batches: chunks whose
+    content-hashed ID is already indexed are kept, new ones are embedded and added, and
+    stale ones are deleted once the file has been read. Files recorded under ``remove_missing_under`` that
+    are no longer in ``pdf_paths`` have their chunks deleted. New chunks that nearly duplicate
+    an indexed one are not added but listed under its ``duplicates`` metadata (see
+    ``_add_chunks``); the manifest still records them. The result is an index of
+    ``index_type`` (default ``FAISS_INDEX_TYPE``). Chunks are tagged with ``collection``, whose
+    manifest is used. Returns (vectorstore, stats).
+    """
+    from langchain_community.vectorstores import FAISS
+    manifest = IndexManifest.load(collection_paths(collection).manifest)
+    collection = collection or DEFAULT_COLLECTION
+    settings = index_settings()
+    if vectorstore is None or manifest.settings.get("embedding_model") != embedding_model_id():
+        # Nothing reusable: the index is missing or its vectors come from another model
+        vectorstore = None
+        manifest.files = {}
+    rechunk_all = manifest.settings != settings
+    manifest.settings = settings
+    stats = {"added": 0, "deleted": 0, "duplicates": 0, "unchanged_files": 0, "updated_files": 0, "removed_files": 0}
+
+    sources = [os.path.normpath(path) for path in pdf_paths]
+    if remove_missing_under is not None:
+        prefix = os.path.normpath(remove_missing_under) + os.sep
+        for source in list(manifest.files):
+            if source.startswith(prefix) and source not in sources:
+                stale = manifest.chunk_ids(source)
+                if stale and vectorstore is not None:
+                    _delete_chunks(_editable(vectorstore), stale)
+                stats["deleted"] += len(stale)
+                stats["removed_files"] += 1
+                manifest.forget(source)
+
+    for source in sources:
+        sha256 = file_sha256(source)
+        if not rechunk_all and manifest.is_unchanged(source, sha256):
+            stats["unchanged_files"] += 1
+            continue
+        old_ids = set(manifest.chunk_ids(source))
+        ids = []
+        for batch in iter_batches(_iter_new_chunks(source, old_ids, ids), EMBED_BATCH_SIZE):
+            vectorstore, duplicates = _add_chunks(_editable(vectorstore), embeddings, batch, source, collection)
+            stats["added"] += len(batch) - duplicates
+            stats["duplicates"] += duplicates
+        # The stale IDs are only known once the whole file has been read
+        stale = list(old_ids.difference(ids))
+        if stale and vectorstore is not None:
+            _delete_chunks(_editable(vectorstore), stale)
+        stats["deleted"] += len(stale)
+        stats["updated_files"] += 1
+        manifest.record(source, sha256, ids)
+
+    if vectorstore is not None:
+        ensure_index_type(vectorstore, index_type or FAISS_INDEX_TYPE)
+    manifest.save()
+    return vectorstore, stats
+
+
+def index_documents(vectorstore) -> list:
+    """Chunk documents in FAISS index order."""
+    mapping = vectorstore.index_to_docstore_id
+    return [vectorstore.docstore.search(mapping[i]) for i in sorted(mapping)]
+
+
+def index_chunks(vectorstore) -> List[str]:
+    """Chunk texts in FAISS index order."""
+    return [doc.page_content for doc in index_documents(vectorstore)]
+
+
+def save_index(vectorstore, paths: IndexPaths = None) -> List[str]:
+    paths = paths or collection_paths()
+    # Write beside the live files and swap them in: processes that mapped the old ones keep reading them
+    tmp_path = paths.index + '.tmp'
+    index = vectorstore.index
+    if isinstance(index, BinaryIndex):
+        # LangChain saves the bit codes as index.faiss; the float16 vectors get a file of their own
+        vectorstore.index = index.codes
+        try:
+            vectorstore.save_local(tmp_path)
+        finally:
+            vectorstore.index = index
+        index.save_vectors(os.path.join(tmp_path, BINARY_VECTORS))
+    else:
+        vectorstore.save_local(tmp_path)
+    os.makedirs(paths.index, exist_ok=True)
+    for name in os.listdir(tmp_path):
+        os.replace(os.path.join(tmp_path, name), os.path.join(paths.index, name))
+    os.rmdir(tmp_path)
+    if not isinstance(index, BinaryIndex) and os.path.exists(os.path.join(paths.index, BINARY_VECTORS)):
+        os.remove(os.path.join(paths.index, BINARY_VECTORS))
+    docs = index_documents(vectorstore)
+    chunks = [doc.page_content for doc in docs]
+    ChunkStore.write(paths.chunks, chunks, [doc.metadata for doc in docs])
+    BM25Index.build(chunks).save(paths.bm25)
+    return chunks
+
+
+def ingest_directory(directory: str, index_type: str = None, collection: str = None) -> dict:
+    """Incrementally index every PDF under ``directory`` into ``collection`` (default: the default collection)."""
+    from langchain_community.vectorstores import FAISS
+    pdf_paths = sorted(
+        os.path.join(root, name)
+        for root, _, files in os.walk(directory)
+        for name in files if name.lower().endswith('.pdf')
+    )
+    paths = collection_paths(collection)
+    embeddings = load_embeddings()
+    vectorstore = None
+    if os.path.exists(paths.index):
+        vectorstore = FAISS.load_local(paths.index, embeddings, allow_dangerous_deserialization=True)
+        # LangChain reads only the bit codes of a binary index; its vectors file is opened beside them
+        vectorstore.index = read_index_dir(paths.index) if isinstance(vectorstore.index, faiss.IndexLSH) \
+            else vectorstore.index
+    vectorstore, stats = update_index(pdf_paths, vectorstore, embeddings, remove_missing_under=directory,
+                                      index_type=index_type, collection=collection)
+    if vectorstore is not None:
+        stats["total_chunks"] = len(save_index(vectorstore, paths))
+        stats["index_type"] = index_type_of(vectorstore.index)
+    return stats
+
+
+def chunk_id(chunk: str) -> str:
+    """Stable content-derived identifier for a chunk."""
+    return hashlib.sha1(chunk.encode("utf-8")).hexdigest()[:16]
+
+
+@timed("embed")
+def embed_query(vectorstore, query: str) -> List[float]:
+    return vectorstore.embedding_function.embed_query(query)
+
+
+def classify_intent(vectorstore, query: str, query_embedding: List[float] = None) -> str:
+    """Intent of the query; ``complex`` (the full LLM path) when routing is off or unavailable."""
+    classifier = getattr(vectorstore, "intent_classifier", None)
+    if not INTENT_ROUTING or not isinstance(classifier, IntentClassifier):
+        return COMPLEX
+    if query_embedding is None:
+        query_embedding = embed_query(vectorstore, query)
+    with timer("intent"):
+        return classifier.classify(query_embedding)[0]
+
+
+def _lexical_index(vectorstore):
+    lexical = getattr(vectorstore, "lexical_index", None)
+    return lexical if HYBRID_RETRIEVAL and isinstance(lexical, BM25Index) else None
+
+
+def _metadata_index(vectorstore) -> MetadataIndex:
+    metadata_index = getattr(vectorstore, "metadata_index", None)
+    if not isinstance(metadata_index, MetadataIndex):
+        # Stores built in memory rather than loaded from disk index their docstore once
+        metadata_index = MetadataIndex([doc.metadata for doc in index_documents(vectorstore)])
+        vectorstore.metadata_index = metadata_index
+    return metadata_index
+
+
+def _chunk_positions(vectorstore) -> Dict[str, int]:
+    chunk_positions = getattr(vectorstore, "chunk_positions", None)
+    if chunk_positions is None:
+        # One pass over the texts on first use; a text stored twice is cited by its first copy
+        store = getattr(vectorstore.docstore, "store", None)
+        texts = store.texts if isinstance(store, ChunkStore) else index_chunks(vectorstore)
+        chunk_positions = {}
+        for position, text in enumerate(texts):
+            chunk_positions.setdefault(chunk_id(text), position)
+        vectorstore.chunk_positions = chunk_positions
+    return chunk_positions
+
+
+def _pages_at(vectorstore, position: int) -> List[dict]:
+    doc = vectorstore.docstore.search(vectorstore.index_to_docstore_id[position])
+    store = getattr(vectorstore.docstore, "store", None)
+    duplicates = store.duplicates(position) if isinstance(store, ChunkStore) else doc.metadata.get("duplicates", [])
+    pages = [{"source": doc.metadata.get("source"), "page": doc.metadata.get("page")}]
+    return pages + [{"source": entry["source"], "page": entry["page"]} for entry in duplicates]
+
+
+def chunk_sources(vectorstores: Sequence, chunks: List[str]) -> List[List[dict]]:
+    """Source and page of each retrieved chunk, followed by those of the near-duplicates merged into it.
+
+    A chunk is looked up by its text in each of ``vectorstores`` (the shards, for example)
+    in turn; one found in none of them has no sources.
+    """
+    sources = []
+    for chunk in chunks:
+        key = chunk_id(chunk)
+        pages = []
+        for vectorstore in vectorstores:
+            position = _chunk_positions(vectorstore).get(key)
+            if position is not None:
+                pages = _pages_at(vectorstore, position)
+                break
+        sources.append(pages)
+    return sources
+
+
+def retrieve_chunks(vectorstore, query: str, top_n: int = TOP_N, query_embedding: List[float] = None,
+                    where: dict = None):
+    """Top-N (chunk, score) pairs: L2 distance for vector search, fused RRF score for hybrid search.
+
+    ``where`` restricts the search to chunks whose metadata matches it (see ``retrieve_chunks_batch``).
+    """
+    if where or _lexical_index(vectorstore) is not None or _reranker(vectorstore) is not None:
+        if query_embedding is None:
+            query_embedding = embed_query(vectorstore, query)
+        return retrieve_chunks_batch(vectorstore, [query], top_n, query_embeddings=[query_embedding], where=where)[0]
+    with timer("search"):
+        # Reuse an embedding the caller already computed instead of embedding the query again
+        if query_embedding is not None:
+            docs_and_scores = vectorstore.similarity_search_with_score_by_vector(query_embedding, k=top_n)
+        else:
+            docs_and_scores = vectorstore.similarity_search_with_score(query, k=top_n)
+    RETRIEVED_CHUNKS.observe(len(docs_and_scores))
     return [(doc.page_content, score) for doc, score in docs_and_scores]
 
 
-def build_context(chunks: List[str]) -> str:
-    return '\n'.join([f'- "{chunk}"' for chunk in chunks])
+@timed("embed")
+def embed_queries(vectorstore, queries: List[str]) -> np.ndarray:
+    """Embed many queries in one batched forward pass of the embedding model."""
+    embedder = vectorstore.embedding_function
+    if isinstance(embedder, CachedEmbeddings):
+        return np.asarray(embedder.embed_queries(list(queries)), dtype=np.float32)
+    return np.asarray(embedder.embed_documents(list(queries)), dtype=np.float32)
+
+
+def _reranker(vectorstore):
+    reranker = getattr(vectorstore, "reranker", None)
+    return reranker if RERANKING and isinstance(reranker, CrossEncoderReranker) else None
+
+
+def _first_stage_depth(reranker, top_n: int) -> int:
+    return max(top_n, RERANK_CANDIDATES) if reranker is not None else top_n
+
+
+def _rerank(reranker, queries: List[str], rows, top_n: int, higher_is_better: bool):
+    if reranker is None:
+        return rows
+    with timer("rerank"):
+        return reranker.rerank_many(queries, rows, min(top_n, RERANK_TOP_N), higher_is_better)
+
+
+def _observe_retrieved(rows):
+    for row in rows:
+        RETRIEVED_CHUNKS.observe(len(row))
+    return rows
+
+
+def retrieve_chunks_batch(vectorstore, queries: List[str], top_n: int = TOP_N, query_embeddings=None,
+                          where: dict = None):
+    """Top-N chunks for every query using a single FAISS search over the whole batch.
+
+    With a BM25 index loaded, each query's FAISS and BM25 candidates are fused with
+    reciprocal-rank fusion and the score is the fused one. ``where`` maps metadata keys to a
+    value or a list of values; only matching chunks are scored by either retriever. With
+    reranking on, up to ``RERANK_CANDIDATES`` results are re-scored by the cross-encoder and
+    at most ``RERANK_TOP_N`` are returned.
+    """
+    if query_embeddings is None and queries:
+        query_embeddings = embed_queries(vectorstore, queries)
+    reranker = _reranker(vectorstore)
+    rows = _search_batch(vectorstore, queries, _first_stage_depth(reranker, top_n), query_embeddings, where)
+    return _observe_retrieved(_rerank(reranker, queries, rows, top_n, _lexical_index(vectorstore) is not None))
+
+
+@timed("search")
+def _search_batch(vectorstore, queries: List[str], top_n: int, query_embeddings, where: dict = None):
+    if not queries:
+        return []
+    allowed = _metadata_index(vectorstore).positions(where) if where else None
+    if allowed is not None and not len(allowed):
+        return [[] for _ in queries]
+    vectors = np.array(query_embeddings, dtype=np.float32)
+    if getattr(vectorstore, "_normalize_L2", False):
+        faiss.normalize_L2(vectors)
+    lexical = _lexical_index(vectorstore)
+    k = max(top_n, HYBRID_CANDIDATES) if lexical is not None else top_n
+    if allowed is not None:
+        scores, indices = filtered_search(vectorstore.index, vectors, k, allowed)
+    else:
+        scores, indices = vectorstore.index.search(vectors, k)
+    results = []
+    for query, row_scores, row_indices in zip(queries, scores, indices):
+        ranked = [(i, score) for score, i in zip(row_scores, row_indices) if i != -1]
+        if lexical is not None:
+            lexical_ids, _ = lexical.search(query, k, allowed)
+            ranked = reciprocal_rank_fusion([[i for i, _ in ranked], lexical_ids])
+        row = []
+        for i, score in ranked[:top_n]:
+            doc = vectorstore.docstore.search(vectorstore.index_to_docstore_id[i])
+            row.append((doc.page_content, score))
+        results.append(row)
+    return results
+
+
+def format_context_line(chunk: str) -> str:
+    return f'- "{chunk}"'
+
+
+def stored_chunk_vectors(vectorstore, chunks: List[str]):
+    """Index-time embeddings of ``chunks`` from the embedding cache, or ``None`` without one."""
+    embedder = getattr(vectorstore, "embedding_function", None)
+    if not isinstance(embedder, CachedEmbeddings):
+        return None
+    return embedder.stored_documents(list(chunks))
 
 
-def ask_llm(context: str, question: str) -> str:
-    llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0, openai_api_key=os.getenv("TEAMIFIED_OPENAI_API_KEY"))
-    prompt = (
+def _shard_pool() -> ThreadPoolExecutor:
+    global _shard_executor
+    if _shard_executor is None:
+        with _shard_executor_lock:
+            if _shard_executor is None:
+                _shard_executor = ThreadPoolExecutor(max_workers=SHARD_SEARCH_WORKERS, thread_name_prefix="shard")
+    return _shard_executor
+
+
+def retrieve_chunks_sharded(shards: dict, queries: List[str], top_n: int = TOP_N, query_embeddings=None,
+                            where: dict = None):
+    """Top-N chunks for every query across collection shards, searched in parallel and merged by score.
+
+    ``shards`` maps collection names to vectorstores (see ``load_shards``). A ``collection``
+    entry in ``where`` picks the shards to search, so a query scoped to one collection only
+    touches that shard; the other entries filter chunks within each shard before scoring.
+    Raises ValueError for an unknown collection.
+    """
+    collections, conditions = split_filter(where)
+    unknown = [name for name in collections or () if name not in shards]
+    if unknown:
+        raise ValueError(f"Unknown collection: {', '.join(unknown)}")
+    selected = [shards[name] for name in (collections or shards)]
+    if not queries or not selected:
+        return [[] for _ in queries]
+    if query_embeddings is None:
+        query_embeddings = embed_queries(selected[0], queries)
+    if len(selected) == 1:
+        return retrieve_chunks_batch(selected[0], queries, top_n, query_embeddings, conditions)
+    # Shards share one reranker, which runs once on the merged candidates
+    reranker = _reranker(selected[0])
+    depth = _first_stage_depth(reranker, top_n)
+    # FAISS releases the GIL while it searches, so threads search the shards at the same time
+    per_shard = list(_shard_pool().map(
+        lambda shard: _search_batch(shard, queries, depth, query_embeddings, conditions), selected))
+    # Shards are saved the same way, so they all score by RRF (higher is better) or all by L2 distance
+    hybrid = _lexical_index(selected[0]) is not None
+    rows = [merge_top_k(rows, depth, higher_is_better=hybrid) for rows in zip(*per_shard)]
+    return _observe_retrieved(_rerank(reranker, queries, rows, top_n, hybrid))
+
+
+@timed("context")
+def build_context(chunks: List[str], vectorstore=None, token_budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """Prompt context from retrieved chunks (best first), at most ``token_budget`` tokens.
+
+    Duplicate chunks are dropped, chunks sharing the splitter's overlap are merged, and with
+    ``vectorstore`` chunks whose stored embeddings are near-identical to a better-ranked one
+    are dropped too.
+    """
+    vectors = stored_chunk_vectors(vectorstore, chunks) if vectorstore is not None else None
+    pieces = assemble_context(chunks, vectors, token_budget, format_piece=format_context_line)
+    return '\n'.join(format_context_line(piece) for piece in pieces)
+
+
+def create_llm(pool_size: int = LLM_POOL_SIZE, timeout: float = LLM_TIMEOUT,
+               max_retries: int = LLM_MAX_RETRIES, base_url: str = None):
+    """Build a ChatOpenAI client backed by a keep-alive HTTP connection pool."""
+    import httpx
+    from langchain_openai import ChatOpenAI
+    limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+    return ChatOpenAI(
+        model=LLM_MODEL,
+        temperature=0,
+        openai_api_key=os.getenv("TEAMIFIED_OPENAI_API_KEY"),
+        base_url=base_url or os.getenv("OPENAI_BASE_URL"),
+        timeout=timeout,
+        max_retries=max_retries,
+        http_client=httpx.Client(limits=limits, timeout=timeout),
+        http_async_client=httpx.AsyncClient(limits=limits, timeout=timeout),
+    )
+
+
+def get_llm():
+    """Return the process-wide LLM client, creating it on first use."""
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                _llm = create_llm()
+    return _llm
+
+
+def build_prompt(context: str, question: str) -> str:
+    return (
         "You are a helpful Philippine history expert. "
         "Using only the provided context, answer the user's question in a single, clear, and accurate sentence. "
         "Your answer must include both the date and the significance of the event, and should be concise and self-contained. "
@@ -77,28 +759,182 @@ def ask_llm(context: str, question: str) -> str:
         "If the context is insufficient, say 'Not enough information in the context.'\n\n"
         f"Context:\n{context}\n\nQuestion: {question}\nAnswer:"
     )
+
+
+def record_llm_tokens(prompt: str, completion: str, usage=None):
+    """Count prompt and completion tokens, as reported by the provider or else estimated locally."""
+    usage = usage if isinstance(usage, dict) else {}
+    prompt_tokens, completion_tokens = usage.get("input_tokens"), usage.get("output_tokens")
+    LLM_TOKENS.inc(prompt_tokens if isinstance(prompt_tokens, int) else count_tokens(prompt), kind="prompt")
+    LLM_TOKENS.inc(completion_tokens if isinstance(completion_tokens, int) else count_tokens(completion),
+                   kind="completion")
+
+
+@timed("llm")
+def ask_llm(context: str, question: str, llm=None) -> str:
+    if llm is None:
+        llm = get_llm()
+    prompt = build_prompt(context, question)
     response = llm.invoke(prompt)
-    if hasattr(response, 'content'):
-        return response.content
-    return str(response)
+    text = response.content if hasattr(response, 'content') else str(response)
+    record_llm_tokens(prompt, text, getattr(response, 'usage_metadata', None))
+    return text
 
 
-def main():
-    vectorstore, _ = build_or_load_index()
+@timed("llm")
+async def ask_llm_async(context: str, question: str, llm=None) -> str:
+    if llm is None:
+        llm = get_llm()
+    prompt = build_prompt(context, question)
+    response = await llm.ainvoke(prompt)
+    text = response.content if hasattr(response, 'content') else str(response)
+    record_llm_tokens(prompt, text, getattr(response, 'usage_metadata', None))
+    return text
+
+
+@timed("llm")
+async def stream_llm_async(context: str, question: str, llm=None):
+    """Yield the LLM answer piece by piece as the provider streams it."""
+    if llm is None:
+        llm = get_llm()
+    prompt = build_prompt(context, question)
+    tokens, usage = [], None
+    async for message_chunk in llm.astream(prompt):
+        token = message_chunk.content if hasattr(message_chunk, 'content') else str(message_chunk)
+        # Providers that report usage on a stream do so on its last chunk
+        usage = getattr(message_chunk, 'usage_metadata', None) or usage
+        if token:
+            tokens.append(token)
+            yield token
+    record_llm_tokens(prompt, "".join(tokens), usage)
+
+
+def corpus_fingerprint() -> str:
+    """Identifies what is indexed: the files and settings of the default collection and every other one."""
+    names = [DEFAULT_COLLECTION] + [name for name in list_collections(COLLECTIONS_PATH) if name != DEFAULT_COLLECTION]
+    manifests = {name: IndexManifest.load(collection_paths(name).manifest).fingerprint() for name in names}
+    return hashlib.sha256(json.dumps(manifests, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def build_faq_index(vectorstore, shards: dict = None, max_questions: int = FAQ_MAX_QUESTIONS,
+                    concurrency: int = FAQ_CONCURRENCY, path: str = FAQ_INDEX_PATH, top_n: int = TOP_N) -> dict:
+    """Answer questions generated from the chunks ahead of time and save them as a ``FAQIndex`` at ``path``.
+
+    Each question takes the path of a ``/query`` request: intent, retrieval (across ``shards``
+    when there are several), the intent fast paths, then ``ask_llm`` with at most ``concurrency``
+    calls in flight. Greetings, out-of-scope questions and questions the corpus cannot answer
+    are left out.
+    """
+    questions = generate_questions(index_chunks(vectorstore), max_questions)
+    embeddings = embed_queries(vectorstore, questions) if questions else np.zeros((0, vectorstore.index.d), np.float32)
+    intents = [classify_intent(vectorstore, question, embedding) for question, embedding in zip(questions, embeddings)]
+    positions = [i for i, intent in enumerate(intents) if intent not in CANNED_RESPONSES]
+    queries, query_embeddings = [questions[i] for i in positions], [embeddings[i] for i in positions]
+    if not positions:
+        rows = []
+    elif shards and len(shards) > 1:
+        rows = retrieve_chunks_sharded(shards, queries, top_n, query_embeddings)
+    else:
+        rows = retrieve_chunks_batch(vectorstore, queries, top_n, query_embeddings=query_embeddings)
+
+    def answer(i, retrieved):
+        chunks = [chunk for chunk, _ in retrieved]
+        try:
+            response = fast_answer(intents[i], questions[i], chunks)
+            return response or ask_llm(build_context(chunks, vectorstore), questions[i]).strip()
+        except Exception as e:
+            # One failed LLM call should not throw away a long warm-up
+            print(f"Not answered: {questions[i]!r} ({e})")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        answers = list(pool.map(answer, positions, rows))
+    kept = [(i, answer_text, [chunk for chunk, _ in retrieved])
+            for i, answer_text, retrieved in zip(positions, answers, rows) if is_answered(answer_text)]
+    FAQIndex.write(path, [questions[i] for i, _, _ in kept], embeddings[[i for i, _, _ in kept]],
+                   [answer_text for _, answer_text, _ in kept], [intents[i] for i, _, _ in kept],
+                   [chunks for _, _, chunks in kept], corpus_fingerprint(), top_n)
+    return {"questions": len(questions), "answered": len(kept), "skipped": len(questions) - len(kept)}
+
+
+def load_faq_index(path: str = FAQ_INDEX_PATH) -> Optional[FAQIndex]:
+    """The precomputed FAQ answers, unless turned off, not built, or built from another corpus."""
+    if not FAQ_ANSWERS or not FAQIndex.exists(path):
+        return None
+    faq_index = FAQIndex(path)
+    if faq_index.version != FAQ_VERSION or faq_index.fingerprint != corpus_fingerprint():
+        print("Ignoring the precomputed FAQ answers: the index changed since they were built. "
+              "Rebuild them with `python run.py warm-faq`.")
+        return None
+    return faq_index
+
+
+def main(index_type: str = None, nprobe: int = None, ef_search: int = None):
+    vectorstore, _ = build_or_load_index(index_type, nprobe, ef_search)
+    # A CLI run is one question long: keep its query embedding on disk so asking it again
+    # finds both the embedding and the answer cached, without loading the model or the LLM client
+    vectorstore.embedding_function.persist_queries = True
     print("User Query:", end=' ')
     user_query = input().strip()
+    intent = classify_intent(vectorstore, user_query)
+    if intent in CANNED_RESPONSES:
+        print("\nLLM Response:")
+        print(f'"{CANNED_RESPONSES[intent]}"')
+        return
     print("\nRetrieving relevant chunks...")
     retrieved = retrieve_chunks(vectorstore, user_query, TOP_N)
     retrieved_chunks = [chunk for chunk, _ in retrieved]
     print("\nRetrieved Chunks:")
-    for chunk in retrieved_chunks:
+    for chunk, pages in zip(retrieved_chunks, chunk_sources([vectorstore], retrieved_chunks)):
         # Print only the first sentence or up to 80 chars, as in the sample
         first_sentence = chunk.split(". ")[0] + ("..." if "." in chunk else "")
         print(f'- "{first_sentence.strip()}"')
-    context = build_context(retrieved_chunks)
+        # Merged near-duplicates are cited too: the same text appears on each of these pages
+        if len(pages) > 1:
+            print("  Also on: " + ", ".join(f"{page['source']} p. {page['page']}" for page in pages[1:]))
+    context = build_context(retrieved_chunks, vectorstore)
     print("\nLLM Response:")
-    response = ask_llm(context, user_query)
+    answers = AnswerStore(ANSWER_STORE_PATH)
+    chunk_ids = [chunk_id(chunk) for chunk in retrieved_chunks]
+    response = fast_answer(intent, user_query, retrieved_chunks) or answers.get(user_query, TOP_N, chunk_ids)
+    if response is None:
+        response = ask_llm(context, user_query).strip()
+        answers.put(user_query, TOP_N, chunk_ids, response)
     print(f'"{response.strip()}"')
 
+def cli(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Philippine history RAG pipeline.")
+    parser.add_argument("--index-type", choices=INDEX_TYPES,
+                        help=f"FAISS index to build (default: FAISS_INDEX_TYPE or {FAISS_INDEX_TYPE})")
+    parser.add_argument("--nprobe", type=int, help="IVF lists searched per query")
+    parser.add_argument("--ef-search", type=int, help="HNSW candidate list size per query")
+    subparsers = parser.add_subparsers(dest="command")
+    ingest_parser = subparsers.add_parser("ingest", help="incrementally index every PDF in a directory")
+    ingest_parser.add_argument("directory")
+    ingest_parser.add_argument("--collection", help=f"collection to index into (default: {DEFAULT_COLLECTION})")
+    export_parser = subparsers.add_parser("export-onnx", help="export the embedding model for EMBEDDING_BACKEND=onnx")
+    export_parser.add_argument("--output", default=ONNX_MODEL_PATH)
+    export_parser.add_argument("--no-quantize", action="store_true", help="skip the int8 copy")
+    faq_parser = subparsers.add_parser("warm-faq", help="precompute answers to questions generated from the chunks")
+    faq_parser.add_argument("--max-questions", type=int, default=FAQ_MAX_QUESTIONS)
+    faq_parser.add_argument("--concurrency", type=int, default=FAQ_CONCURRENCY, help="LLM calls in flight")
+    faq_parser.add_argument("--output", default=FAQ_INDEX_PATH)
+    args = parser.parse_args(argv)
+    if args.command == "ingest":
+        stats = ingest_directory(args.directory, args.index_type, args.collection)
+        print(", ".join(f"{key}={value}" for key, value in stats.items()))
+    elif args.command == "export-onnx":
+        from onnx_embeddings import export_onnx
+        export_onnx(EMBEDDING_MODEL, args.output, quantize=not args.no_quantize)
+        print(f"Exported {EMBEDDING_MODEL} to {args.output}")
+    elif args.command == "warm-faq":
+        vectorstore, _ = build_or_load_index(args.index_type, args.nprobe, args.ef_search)
+        stats = build_faq_index(vectorstore, load_shards(vectorstore, args.nprobe, args.ef_search),
+                                args.max_questions, args.concurrency, args.output)
+        print(", ".join(f"{key}={value}" for key, value in stats.items()))
+    else:
+        main(args.index_type, args.nprobe, args.ef_search)
+
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    cli() 
\ No newline at end of file
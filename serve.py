@@ -0,0 +1,103 @@
+"""Run the API in several worker processes that share one preloaded index and embedding model.
+
+The parent loads the index, collection shards and model weights once (``app_api.preload``)
+and then forks the workers, which share those pages copy-on-write. uvicorn's own
+``--workers`` starts each worker as a new interpreter, and every one of those loads its own
+copy. Unix only (needs ``os.fork``).
+
+    python serve.py --workers 4 --port 8000
+    python serve.py --workers 4 --no-preload    # every worker loads the index and model itself
+"""
+import argparse
+import gc
+import os
+import signal
+import sys
+import time
+import traceback
+from typing import List
+
+import uvicorn
+
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", str(os.cpu_count() or 1)))
+SERVE_HOST = os.getenv("SERVE_HOST", "127.0.0.1")
+SERVE_PORT = int(os.getenv("SERVE_PORT", "8000"))
+RESTART_DELAY = 1.0  # seconds before replacing a worker that exited
+
+
+def _run_worker(config: uvicorn.Config, sock):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    code = 1
+    try:
+        uvicorn.Server(config).run(sockets=[sock])
+        code = 0
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        # Skip the atexit handlers inherited from the parent
+        os._exit(code)
+
+
+def serve(workers: int = SERVE_WORKERS, host: str = SERVE_HOST, port: int = SERVE_PORT, preload: bool = True,
+          log_level: str = "info"):
+    """Fork ``workers`` uvicorn workers on one listening socket and restart any that die."""
+    if not hasattr(os, "fork"):
+        sys.exit("serve.py needs os.fork; use `uvicorn app_api:app --workers N` on this platform.")
+    config = uvicorn.Config("app_api:app", host=host, port=port, log_level=log_level)
+    sock = config.bind_socket()
+    if preload:
+        import app_api
+        app_api.preload()
+        # Keep the garbage collector from writing to (and so un-sharing) every preloaded object's page
+        gc.freeze()
+
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(config, sock)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    for _ in range(workers):
+        spawn()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"Serving on http://{host}:{port} with {workers} worker(s) (preload {'on' if preload else 'off'})")
+    while children:
+        pid, status = os.wait()
+        children.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}; starting another")
+            time.sleep(RESTART_DELAY)  # a worker that cannot start should not turn into a fork loop
+            spawn()
+    sock.close()
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--no-preload", dest="preload", action="store_false",
+                        help="let every worker load the index and model itself")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+    serve(args.workers, args.host, args.port, args.preload, args.log_level)
+
+
+if __name__ == "__main__":
+    main()
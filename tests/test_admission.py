@@ -0,0 +1,68 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+import asyncio
+import pytest
+from admission import Overloaded, StageLimiter
+
+
+def test_waiters_are_served_by_priority_then_arrival():
+    limiter = StageLimiter("test", concurrency=1, max_queue=10, max_wait=5)
+    order = []
+
+    async def request(name, priority):
+        async with limiter.slot(priority):
+            order.append(name)
+            await asyncio.sleep(0.001)
+
+    async def scenario():
+        await limiter.acquire()  # occupy the only slot while the others queue up
+        tasks = [asyncio.ensure_future(request(name, priority)) for name, priority in
+                 [("batch-1", "batch"), ("ui-1", "interactive"), ("batch-2", "batch"), ("ui-2", "interactive")]]
+        await asyncio.sleep(0)
+        assert limiter.queued == 4
+        limiter.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    assert order == ["ui-1", "ui-2", "batch-1", "batch-2"]
+    assert limiter.stats()["active"] == 0 and limiter.stats()["queued"] == 0
+
+
+def test_full_queue_rejects_with_429_and_slow_queue_with_503():
+    limiter = StageLimiter("test", concurrency=1, max_queue=1, max_wait=0.05)
+
+    async def scenario():
+        await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as full:
+            await limiter.acquire()
+        with pytest.raises(Overloaded) as slow:
+            await waiter
+        limiter.release()
+        return full.value, slow.value
+
+    full, slow = asyncio.run(scenario())
+    assert full.status_code == 429 and full.retry_after >= 1
+    assert slow.status_code == 503
+    assert limiter.stats()["rejected"] == 2
+    assert limiter.active == 0 and limiter.queued == 0
+
+
+def test_cancelled_waiter_does_not_leak_its_slot():
+    limiter = StageLimiter("test", concurrency=1, max_queue=5, max_wait=5)
+
+    async def scenario():
+        await limiter.acquire()
+        gone = asyncio.ensure_future(limiter.acquire())
+        kept = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        gone.cancel()
+        await asyncio.sleep(0)
+        limiter.release()
+        await kept
+        limiter.release()
+
+    asyncio.run(scenario())
+    assert limiter.active == 0 and limiter.queued == 0
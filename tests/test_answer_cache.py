@@ -0,0 +1,72 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+from unittest.mock import patch
+from answer_cache import AnswerCache, AnswerStore, normalize_question
+
+
+def test_normalize_question():
+    assert normalize_question("  When did   EDSA happen? ") == "when did edsa happen"
+
+
+def test_exact_hit_and_miss_counters():
+    cache = AnswerCache()
+    assert cache.get("When did EDSA happen?", 5, ["a", "b"]) is None
+    cache.put("When did EDSA happen?", 5, ["a", "b"], "February 1986.")
+    assert cache.get("when did edsa happen", 5, ["a", "b"]) == "February 1986."
+    # Different retrieval result or top_n is a different key
+    assert cache.get("When did EDSA happen?", 5, ["a", "c"]) is None
+    assert cache.get("When did EDSA happen?", 3, ["a", "b"]) is None
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 3
+
+
+def test_lru_eviction():
+    cache = AnswerCache(max_entries=2)
+    cache.put("q1", 5, ["a"], "one")
+    cache.put("q2", 5, ["a"], "two")
+    cache.get("q1", 5, ["a"])
+    cache.put("q3", 5, ["a"], "three")
+    assert cache.get("q2", 5, ["a"]) is None
+    assert cache.get("q1", 5, ["a"]) == "one"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_memory_budget_eviction():
+    cache = AnswerCache(max_bytes=400)
+    cache.put("q1", 5, ["a"], "x" * 150)
+    cache.put("q2", 5, ["a"], "y" * 150)
+    assert cache.stats()["bytes"] <= 400
+    assert cache.get("q1", 5, ["a"]) is None
+    assert cache.get("q2", 5, ["a"]) == "y" * 150
+
+
+def test_ttl_expiry():
+    cache = AnswerCache(ttl=10)
+    with patch("answer_cache.time.monotonic", return_value=100.0):
+        cache.put("q", 5, ["a"], "answer")
+    with patch("answer_cache.time.monotonic", return_value=105.0):
+        assert cache.get("q", 5, ["a"]) == "answer"
+    with patch("answer_cache.time.monotonic", return_value=111.0):
+        assert cache.get("q", 5, ["a"]) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_semantic_hit_requires_same_chunks():
+    cache = AnswerCache(similarity_threshold=0.95)
+    cache.put("When did EDSA happen?", 5, ["a"], "February 1986.", query_embedding=[1.0, 0.0])
+    assert cache.get("What year was EDSA?", 5, ["a"], query_embedding=[0.99, 0.05]) == "February 1986."
+    assert cache.get("What year was EDSA?", 5, ["b"], query_embedding=[0.99, 0.05]) is None
+    assert cache.get("Who was Rizal?", 5, ["a"], query_embedding=[0.0, 1.0]) is None
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_answer_store_persists_and_expires(tmp_path):
+    path = str(tmp_path / 'answers.sqlite')
+    AnswerStore(path).put("When did EDSA happen?", 5, ["c1"], "In 1986.")
+    store = AnswerStore(path)
+    assert store.get("when did EDSA happen", 5, ["c1"]) == "In 1986."
+    assert store.get("When did EDSA happen?", 5, ["c2"]) is None
+    with patch("answer_cache.time.time", return_value=10 ** 12):
+        assert store.get("When did EDSA happen?", 5, ["c1"]) is None
@@ -1,11 +1,13 @@
 import sys
 import os
+import threading
 import warnings
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
 import pytest
 from fastapi.testclient import TestClient
 import app_api
+from metrics import timer
 
 client = TestClient(app_api.app)
 
@@ -16,18 +18,357 @@ def test_health():
 
 def test_query_endpoint(monkeypatch):
     # Mock the retrieval and LLM logic
+    context_threads = []
+    contexts = []
+    monkeypatch.setattr(app_api, "vectorstore", object())
+    monkeypatch.setattr(app_api, "answer_cache", app_api.AnswerCache())
+    monkeypatch.setattr(app_api, "embed_query", lambda vs, q: [1.0, 0.0])
     monkeypatch.setattr(app_api, "retrieve_chunks", lambda *a, **kw: [("Mock chunk", 0.1)])
-    monkeypatch.setattr(app_api, "build_context", lambda chunks: "- \"Mock chunk\"")
-    monkeypatch.setattr(app_api, "ask_llm", lambda context, question: "Mock answer.")
+
+    def fake_build_context(chunks, vectorstore=None, token_budget=None):
+        context_threads.append(threading.current_thread().name)
+        return "- \"Mock chunk\""
+    monkeypatch.setattr(app_api, "build_context", fake_build_context)
+    async def fake_ask_llm_async(context, question):
+        contexts.append(context)
+        return "Mock answer."
+    monkeypatch.setattr(app_api, "ask_llm_async", fake_ask_llm_async)
 
     response = client.post("/query", json={"question": "Test?", "top_n": 1})
-    # Accept either 200 (if index is loaded) or 400 (if not loaded)
-    assert response.status_code in (200, 400)
-    if response.status_code == 200:
-        data = response.json()
-        assert data["question"] == "Test?"
-        assert data["retrieved_chunks"] == ["Mock chunk"]
-        assert data["llm_response"] == "Mock answer."
-    else:
-        data = response.json()
-        assert "detail" in data and "Index not loaded" in data["detail"] 
\ No newline at end of file
+    assert response.status_code == 200
+    data = response.json()
+    assert data["question"] == "Test?"
+    assert data["retrieved_chunks"] == ["Mock chunk"]
+    assert data["llm_response"] == "Mock answer."
+    assert contexts == ['- "Mock chunk"']
+    # The context is built on the retrieval pool, not on the event loop
+    assert context_threads[0].startswith("retrieval")
+
+def test_query_endpoint_cites_merged_duplicate_pages(monkeypatch):
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    boilerplate = "Property of the National Archives."
+    vectorstore = FAISS.from_texts(
+        [boilerplate, "Rizal was born in 1861."], DeterministicFakeEmbedding(size=8),
+        metadatas=[{"source": "a.pdf", "page": 2, "duplicates": [{"id": "x", "source": "b.pdf", "page": 7}]},
+                   {"source": "a.pdf", "page": 1}])
+    monkeypatch.setattr(app_api, "vectorstore", vectorstore)
+    monkeypatch.setattr(app_api, "shards", {"default": vectorstore})
+    monkeypatch.setattr(app_api, "answer_cache", app_api.AnswerCache())
+    monkeypatch.setattr(app_api, "embed_query", lambda vs, q: [1.0] * 8)
+    monkeypatch.setattr(app_api, "classify_intent", lambda vs, question, embedding: "complex")
+    monkeypatch.setattr(app_api, "retrieve_chunks", lambda *a, **kw: [(boilerplate, 0.1), ("Unknown chunk", 0.2)])
+    async def fake_ask_llm_async(context, question):
+        return "Mock answer."
+    monkeypatch.setattr(app_api, "ask_llm_async", fake_ask_llm_async)
+
+    data = client.post("/query", json={"question": "Who owns this?", "top_n": 2, "sources": True}).json()
+    assert data["sources"] == [[{"source": "a.pdf", "page": 2}, {"source": "b.pdf", "page": 7}], []]
+    # Only requests that ask for them pay for the lookup
+    assert "sources" not in client.post("/query", json={"question": "Who owns this?", "top_n": 2}).json()
+
+def test_query_endpoint_context_fits_token_budget(monkeypatch):
+    from run import CONTEXT_TOKEN_BUDGET, count_tokens
+    contexts = []
+    chunks = [f"Chunk {i} " + "about the revolution and its leaders " * 40 for i in range(5)]
+    monkeypatch.setattr(app_api, "vectorstore", object())
+    monkeypatch.setattr(app_api, "answer_cache", app_api.AnswerCache())
+    monkeypatch.setattr(app_api, "embed_query", lambda vs, q: [1.0, 0.0])
+    monkeypatch.setattr(app_api, "retrieve_chunks", lambda *a, **kw: [(chunk, 0.1) for chunk in chunks])
+    async def fake_ask_llm_async(context, question):
+        contexts.append(context)
+        return "Mock answer."
+    monkeypatch.setattr(app_api, "ask_llm_async", fake_ask_llm_async)
+
+    response = client.post("/query", json={"question": "Who led the revolution?", "top_n": 5})
+    assert response.status_code == 200
+    assert len(response.json()["retrieved_chunks"]) == 5
+    # The best-ranked chunks are kept until the budget runs out
+    assert count_tokens(contexts[0]) <= CONTEXT_TOKEN_BUDGET
+    assert "Chunk 0 " in contexts[0] and "Chunk 4 " not in contexts[0]
+
+def test_query_repeat_question_skips_llm(monkeypatch):
+    calls = []
+    monkeypatch.setattr(app_api, "vectorstore", object())
+    monkeypatch.setattr(app_api, "answer_cache", app_api.AnswerCache())
+    monkeypatch.setattr(app_api, "embed_query", lambda vs, q: [1.0, 0.0])
+    monkeypatch.setattr(app_api, "retrieve_chunks", lambda *a, **kw: [("Mock chunk", 0.1)])
+    async def fake_ask_llm_async(context, question):
+        calls.append(question)
+        return "Mock answer."
+    monkeypatch.setattr(app_api, "ask_llm_async", fake_ask_llm_async)
+
+    for question in ("When did EDSA happen?", "when did EDSA happen"):
+        response = client.post("/query", json={"question": question, "top_n": 1})
+        assert response.status_code == 200
+        assert response.json()["llm_response"] == "Mock answer."
+    assert calls == ["When did EDSA happen?"]
+
+    stats = client.get("/stats").json()["answer_cache"]
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_query_stream_sends_chunks_then_tokens(monkeypatch):
+    monkeypatch.setattr(app_api, "vectorstore", object())
+    monkeypatch.setattr(app_api, "answer_cache", app_api.AnswerCache())
+    monkeypatch.setattr(app_api, "embed_query", lambda vs, q: [1.0, 0.0])
+    monkeypatch.setattr(app_api, "retrieve_chunks", lambda *a, **kw: [("Mock chunk", 0.1)])
+
+    async def fake_stream(context, question):
+        for token in ("Mock", " answer."):
+            yield token
+    monkeypatch.setattr(app_api, "stream_llm_async", fake_stream)
+
+    response = client.post("/query/stream", json={"question": "Test?", "top_n": 1})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [block.split("\n", 1) for block in response.text.strip().split("\n\n")]
+    names = [name[len("event: "):] for name, _ in events]
+    assert names == ["chunks", "token", "token", "done"]
+    assert '"retrieved_chunks": ["Mock chunk"]' in events[0][1]
+    assert '"llm_response": "Mock answer."' in events[-1][1]
+    assert app_api.answer_cache.get("Test?", 1, [app_api.chunk_id("Mock chunk")]) == "Mock answer."
+
+
+def test_query_batch(monkeypatch):
+    monkeypatch.setattr(app_api, "vectorstore", object())
+    monkeypatch.setattr(app_api, "answer_cache", app_api.AnswerCache())
+    monkeypatch.setattr(app_api, "embed_queries", lambda vs, qs: [[1.0, float(i)] for i in range(len(qs))])
+    monkeypatch.setattr(app_api, "retrieve_chunks_batch",
+                        lambda vs, qs, top_n, query_embeddings=None: [[(f"Chunk for {q}", 0.1)] for q in qs])
+
+    async def fake_ask_llm_async(context, question):
+        if question == "Bad?":
+            raise RuntimeError("rate limited")
+        return f"Answer to {question}"
+    monkeypatch.setattr(app_api, "ask_llm_async", fake_ask_llm_async)
+
+    response = client.post("/query/batch", json={"questions": ["One?", "Bad?", "Two?"], "top_n": 1})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["question"] for r in results] == ["One?", "Bad?", "Two?"]
+    assert results[0]["retrieved_chunks"] == ["Chunk for One?"]
+    assert results[0]["llm_response"] == "Answer to One?"
+    assert results[1]["llm_response"] is None and "rate limited" in results[1]["error"]
+    assert results[2]["llm_response"] == "Answer to Two?"
+
+
+def test_query_batch_rejects_oversized_batch(monkeypatch):
+    monkeypatch.setattr(app_api, "vectorstore", object())
+    monkeypatch.setattr(app_api, "BATCH_MAX_QUESTIONS", 2)
+    response = client.post("/query/batch", json={"questions": ["a", "b", "c"]})
+    assert response.status_code == 400
+
+
+def test_health_reports_warming(monkeypatch):
+    release = threading.Event()
+    thread = threading.Thread(target=release.wait)
+    thread.start()
+    monkeypatch.setattr(app_api, "warmup_thread", thread)
+    assert client.get("/health").json() == {"status": "warming"}
+    release.set()
+    thread.join()
+    assert client.get("/health").json() == {"status": "ok"}
+
+
+def test_query_routes_by_intent(monkeypatch):
+    calls = []
+    monkeypatch.setattr(app_api, "vectorstore", object())
+    monkeypatch.setattr(app_api, "answer_cache", app_api.AnswerCache())
+    monkeypatch.setattr(app_api, "intent_stats", app_api.IntentStats())
+    monkeypatch.setattr(app_api, "embed_query", lambda vs, q: [1.0, 0.0])
+    intents = {"Hello!": "greeting", "When did EDSA happen?": "date_lookup", "Why did EDSA happen?": "complex"}
+    monkeypatch.setattr(app_api, "classify_intent", lambda vs, question, embedding: intents[question])
+
+    def fake_retrieve_chunks(vs, question, top_n, query_embedding=None):
+        calls.append(("retrieve", question))
+        return [("The EDSA People Power Revolution happened in February 1986.", 0.1)]
+    monkeypatch.setattr(app_api, "retrieve_chunks", fake_retrieve_chunks)
+
+    async def fake_ask_llm_async(context, question):
+        calls.append(("llm", question))
+        return "Mock answer."
+    monkeypatch.setattr(app_api, "ask_llm_async", fake_ask_llm_async)
+
+    greeting = client.post("/query", json={"question": "Hello!", "top_n": 1}).json()
+    assert greeting["intent"] == "greeting"
+    assert greeting["retrieved_chunks"] == []
+    assert greeting["llm_response"] == app_api.CANNED_RESPONSES["greeting"]
+    date = client.post("/query", json={"question": "When did EDSA happen?", "top_n": 1}).json()
+    assert date["llm_response"] == "The EDSA People Power Revolution happened in February 1986."
+    complex_ = client.post("/query", json={"question": "Why did EDSA happen?", "top_n": 1}).json()
+    assert complex_["llm_response"] == "Mock answer."
+    assert calls == [("retrieve", "When did EDSA happen?"), ("retrieve", "Why did EDSA happen?"),
+                     ("llm", "Why did EDSA happen?")]
+
+    stats = client.get("/stats").json()["intents"]
+    assert stats["requests"] == 3
+    assert stats["llm_calls"] == 1
+    assert stats["by_intent"]["greeting"]["count"] == 1
+
+
+def test_query_filter_searches_selected_shards(monkeypatch):
+    calls = []
+    monkeypatch.setattr(app_api, "vectorstore", object())
+    monkeypatch.setattr(app_api, "shards", {"default": object(), "laws": object()})
+    monkeypatch.setattr(app_api, "answer_cache", app_api.AnswerCache())
+    monkeypatch.setattr(app_api, "embed_query", lambda vs, q: [1.0, 0.0])
+    monkeypatch.setattr(app_api, "embed_queries", lambda vs, qs: [[1.0, 0.0] for _ in qs])
+    monkeypatch.setattr(app_api, "classify_intent", lambda vs, question, embedding: "complex")
+
+    def fake_retrieve_chunks_sharded(shards, questions, top_n, query_embeddings=None, where=None):
+        if where and where.get("collection") == "unknown":
+            raise ValueError("Unknown collection: unknown")
+        calls.append(where)
+        return [[("Law chunk", 0.1)] for _ in questions]
+    monkeypatch.setattr(app_api, "retrieve_chunks_sharded", fake_retrieve_chunks_sharded)
+
+    async def fake_ask_llm_async(context, question):
+        return "Mock answer."
+    monkeypatch.setattr(app_api, "ask_llm_async", fake_ask_llm_async)
+
+    response = client.post("/query", json={"question": "Test?", "top_n": 1, "filter": {"collection": "laws"}})
+    assert response.status_code == 200
+    assert response.json()["retrieved_chunks"] == ["Law chunk"]
+    response = client.post("/query/batch", json={"questions": ["Test?"], "filter": {"source": "a.pdf"}})
+    assert response.json()["results"][0]["retrieved_chunks"] == ["Law chunk"]
+    assert calls == [{"collection": "laws"}, {"source": "a.pdf"}]
+    response = client.post("/query", json={"question": "Test?", "filter": {"collection": "unknown"}})
+    assert response.status_code == 400 and "unknown" in response.json()["detail"]
+
+
+def test_query_filter_with_invalid_value_is_a_bad_request(monkeypatch):
+    monkeypatch.setattr(app_api, "vectorstore", object())
+    monkeypatch.setattr(app_api, "shards", {"default": object()})
+    monkeypatch.setattr(app_api, "answer_cache", app_api.AnswerCache())
+    monkeypatch.setattr(app_api, "embed_query", lambda vs, q: [1.0, 0.0])
+    monkeypatch.setattr(app_api, "classify_intent", lambda vs, question, embedding: "complex")
+    # An operator is not a metadata value; it used to reach the postings lookup and fail there with a 500
+    response = client.post("/query", json={"question": "Test?", "filter": {"source": {"$eq": "a.pdf"}}})
+    assert response.status_code == 400 and "source" in response.json()["detail"]
+
+
+def test_metrics_and_request_timings(monkeypatch):
+    monkeypatch.setattr(app_api, "vectorstore", object())
+    monkeypatch.setattr(app_api, "answer_cache", app_api.AnswerCache())
+    monkeypatch.setattr(app_api, "embed_query", lambda vs, q: [1.0, 0.0])
+
+    def fake_retrieve_chunks(*a, **kw):
+        with timer("search"):
+            return [("Mock chunk", 0.1)]
+    monkeypatch.setattr(app_api, "retrieve_chunks", fake_retrieve_chunks)
+
+    async def fake_ask_llm_async(context, question):
+        return "Mock answer."
+    monkeypatch.setattr(app_api, "ask_llm_async", fake_ask_llm_async)
+
+    data = client.post("/query", json={"question": "Timed?", "top_n": 1, "timings": True}).json()
+    assert set(data["timings_ms"]) >= {"search", "context", "total"}
+    assert data["timings_ms"]["total"] >= data["timings_ms"]["search"]
+    assert "timings_ms" not in client.post("/query", json={"question": "Untimed?", "top_n": 1}).json()
+    assert client.post("/query", json={"question": "Profiled?", "profile": True}).status_code == 400
+    monkeypatch.setattr(app_api, "PROFILING", True)
+    assert "function calls" in client.post("/query", json={"question": "Profiled?", "profile": True}).json()["profile"]
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'rag_stage_seconds_count{stage="search"}' in response.text
+    assert 'rag_request_seconds_count{endpoint="/query"}' in response.text
+    assert 'rag_request_errors_total{endpoint="/query",status="400"}' in response.text
+
+
+def test_identical_concurrent_queries_share_one_llm_call(monkeypatch):
+    import asyncio
+    from httpx import ASGITransport, AsyncClient
+    calls = []
+    monkeypatch.setattr(app_api, "vectorstore", object())
+    monkeypatch.setattr(app_api, "answer_cache", app_api.AnswerCache())
+    monkeypatch.setattr(app_api, "query_flights", app_api.SingleFlight())
+    monkeypatch.setattr(app_api, "embed_query", lambda vs, q: [1.0, 0.0])
+    monkeypatch.setattr(app_api, "retrieve_chunks", lambda *a, **kw: [("Mock chunk", 0.1)])
+
+    async def slow_ask_llm_async(context, question):
+        calls.append(question)
+        await asyncio.sleep(0.05)
+        return "Mock answer."
+    monkeypatch.setattr(app_api, "ask_llm_async", slow_ask_llm_async)
+
+    async def burst():
+        async with AsyncClient(transport=ASGITransport(app=app_api.app), base_url="http://test") as http:
+            questions = ["When did EDSA happen?"] * 4 + ["when did EDSA happen", "Why did EDSA happen?"]
+            return await asyncio.gather(*(http.post("/query", json={"question": q, "top_n": 1}) for q in questions))
+
+    responses = asyncio.run(burst())
+    assert [r.json()["llm_response"] for r in responses] == ["Mock answer."] * 6
+    assert responses[4].json()["question"] == "when did EDSA happen"
+    assert sorted(calls) == ["When did EDSA happen?", "Why did EDSA happen?"]
+    coalescing = client.get("/stats").json()["coalescing"]
+    assert coalescing["followers"] == 4 and coalescing["coalescing_ratio"] == round(4 / 6, 4)
+    assert 'rag_coalesced_requests_total{role="follower"}' in client.get("/metrics").text
+
+
+def test_llm_stage_rejects_with_retry_after_when_full(monkeypatch):
+    import asyncio
+    from httpx import ASGITransport, AsyncClient
+    monkeypatch.setattr(app_api, "vectorstore", object())
+    monkeypatch.setattr(app_api, "answer_cache", app_api.AnswerCache())
+    monkeypatch.setattr(app_api, "llm_limiter", app_api.StageLimiter("llm", 1, max_queue=1, max_wait=5))
+    monkeypatch.setattr(app_api, "embed_query", lambda vs, q: [1.0, 0.0])
+    monkeypatch.setattr(app_api, "retrieve_chunks", lambda *a, **kw: [("Mock chunk", 0.1)])
+
+    async def slow_ask_llm_async(context, question):
+        await asyncio.sleep(0.05)
+        return "Mock answer."
+    monkeypatch.setattr(app_api, "ask_llm_async", slow_ask_llm_async)
+
+    async def burst():
+        async with AsyncClient(transport=ASGITransport(app=app_api.app), base_url="http://test") as http:
+            return await asyncio.gather(*(http.post("/query", json={"question": f"Question {i}?", "top_n": 1})
+                                          for i in range(4)))
+
+    responses = asyncio.run(burst())
+    statuses = sorted(r.status_code for r in responses)
+    assert statuses == [200, 200, 429, 429]
+    rejected = next(r for r in responses if r.status_code == 429)
+    assert int(rejected.headers["Retry-After"]) >= 1
+    assert client.get("/stats").json()["admission"]["llm"]["rejected"] == 2
+    assert 'rag_admission_rejected_total{stage="llm",reason="queue_full"}' in client.get("/metrics").text
+
+
+def test_query_serves_precomputed_faq_answers(monkeypatch, tmp_path):
+    import numpy as np
+    from faq_index import FAQIndex
+    path = str(tmp_path / "faq")
+    FAQIndex.write(path, ["When was Rizal executed?"], np.array([[1.0, 0.0]], dtype=np.float32),
+                   ["Rizal was executed on December 30, 1896."], ["date_lookup"], [["Rizal chunk"]], "corpus", 5)
+    monkeypatch.setattr(app_api, "faq_index", FAQIndex(path, similarity=0.9))
+    monkeypatch.setattr(app_api, "vectorstore", object())
+    monkeypatch.setattr(app_api, "answer_cache", app_api.AnswerCache())
+    embedded = []
+
+    def fake_embed_query(vs, question):
+        embedded.append(question)
+        return [0.98, 0.2] if "Rizal" in question else [0.0, 1.0]
+    monkeypatch.setattr(app_api, "embed_query", fake_embed_query)
+    monkeypatch.setattr(app_api, "retrieve_chunks", lambda *a, **kw: [("Mock chunk", 0.1)])
+    llm_calls = []
+    async def fake_ask_llm_async(context, question):
+        llm_calls.append(question)
+        return "Mock answer."
+    monkeypatch.setattr(app_api, "ask_llm_async", fake_ask_llm_async)
+
+    exact = client.post("/query", json={"question": "when was rizal executed"}).json()
+    assert exact["llm_response"] == "Rizal was executed on December 30, 1896."
+    assert exact["retrieved_chunks"] == ["Rizal chunk"] and exact["intent"] == "date_lookup"
+    assert embedded == []  # matched by text, without embedding the question
+    similar = client.post("/query", json={"question": "What year did Rizal die?"}).json()
+    assert similar["llm_response"] == "Rizal was executed on December 30, 1896."
+    assert llm_calls == []
+    # Other questions, other top_n values and filtered requests take the normal path
+    assert client.post("/query", json={"question": "Who founded the Katipunan?"}).json()["llm_response"] == "Mock answer."
+    client.post("/query", json={"question": "When was Rizal executed?", "top_n": 2})
+    assert len(llm_calls) == 2
+    assert client.get("/stats").json()["faq"] == {"questions": 1, "exact_hits": 1, "similar_hits": 1, "misses": 1,
+                                                  "hit_rate": 0.6667}
@@ -0,0 +1,62 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+import numpy as np
+from bm25_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+CHUNKS = [
+    'José Rizal was executed in 1896 at Bagumbayan.',
+    'The Philippine Declaration of Independence was proclaimed on 12 June 1898.',
+    'Lapu-Lapu defeated Magellan at the Battle of Mactan in 1521.',
+    'The EDSA People Power Revolution happened in 1986.',
+]
+
+
+def test_tokenize_drops_stopwords_and_keeps_years():
+    assert tokenize('When was the Declaration of Independence, in 1898?') == ['when', 'declaration', 'independence', '1898']
+
+
+def test_search_ranks_matching_chunks():
+    index = BM25Index.build(CHUNKS)
+    ids, scores = index.search('independence declared in 1898', k=3)
+    assert ids.tolist() == [1]
+    ids, scores = index.search('What happened in 1898?', k=3)
+    assert ids.tolist() == [3, 1]  # equally rare terms; the shorter EDSA chunk scores higher
+    assert scores[0] > scores[1] > 0
+    assert index.search('Mactan Magellan', k=1)[0].tolist() == [2]
+    assert index.search('unknown words', k=3)[0].size == 0
+
+
+def test_search_within_allowed_chunks():
+    index = BM25Index.build(CHUNKS)
+    ids, scores = index.search('What happened in 1898?', k=3, allowed=np.array([1, 2]))
+    assert ids.tolist() == [1]
+    assert index.search('Rizal 1896', k=3, allowed=np.array([2, 3]))[0].size == 0
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / 'bm25')
+    assert not BM25Index.exists(path)
+    index = BM25Index.build(CHUNKS)
+    index.save(path)
+    assert BM25Index.exists(path)
+    loaded = BM25Index.load(path)
+    assert len(loaded) == len(CHUNKS)
+    for query in ('Rizal 1896', 'People Power', 'independence proclaimed June'):
+        expected_ids, expected_scores = index.search(query, k=4)
+        ids, scores = loaded.search(query, k=4)
+        assert ids.tolist() == expected_ids.tolist()
+        np.testing.assert_allclose(scores, expected_scores)
+
+
+def test_empty_index(tmp_path):
+    path = str(tmp_path / 'bm25')
+    BM25Index.build([]).save(path)
+    assert BM25Index.load(path).search('Rizal', k=3)[0].size == 0
+
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([[3, 1, 2], [1, 4]], k=60)
+    assert [doc_id for doc_id, _ in fused] == [1, 3, 4, 2]
+    assert fused[0][1] == 1 / 62 + 1 / 61
+    assert reciprocal_rank_fusion([]) == []
@@ -0,0 +1,45 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+import pytest
+from chunk_store import ChunkDocstore, ChunkStore, MappedStrings, write_strings
+
+
+def test_mapped_strings_round_trip(tmp_path):
+    prefix = str(tmp_path / 'texts')
+    strings = ['Rizal', '', 'Lapu-Lapu at Mactan', 'José Rizal — 1896']
+    write_strings(prefix, strings)
+    mapped = MappedStrings(prefix)
+    assert len(mapped) == 4
+    assert list(mapped) == strings
+    assert mapped[-1] == 'José Rizal — 1896'
+    assert mapped[1:3] == ['', 'Lapu-Lapu at Mactan']
+    with pytest.raises(IndexError):
+        mapped[4]
+
+
+def test_empty_store(tmp_path):
+    path = str(tmp_path / 'chunks')
+    assert not ChunkStore.exists(path)
+    ChunkStore.write(path, [], [])
+    assert ChunkStore.exists(path)
+    assert len(ChunkStore(path)) == 0
+
+
+def test_docstore_by_position(tmp_path):
+    path = str(tmp_path / 'chunks')
+    ChunkStore.write(path, ['a', 'b'], [{'source': 'x.pdf', 'page': 1}, {'source': 'x.pdf', 'page': 2}])
+    docstore = ChunkDocstore(ChunkStore(path))
+    doc = docstore.search(1)
+    assert doc.page_content == 'b'
+    assert doc.metadata == {'source': 'x.pdf', 'page': 2}
+
+
+def test_duplicates_stored_apart_from_metadata(tmp_path):
+    path = str(tmp_path / 'chunks')
+    duplicates = [{'id': 'c2', 'source': 'y.pdf', 'page': 4}]
+    ChunkStore.write(path, ['a', 'b'], [{'source': 'x.pdf', 'page': 1, 'duplicates': duplicates},
+                                        {'source': 'x.pdf', 'page': 2}])
+    store = ChunkStore(path)
+    assert store.document(0).metadata == {'source': 'x.pdf', 'page': 1}
+    assert store.duplicates(0) == duplicates and store.duplicates(1) == []
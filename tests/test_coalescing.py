@@ -0,0 +1,60 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+import asyncio
+import pytest
+from coalescing import SingleFlight, query_key
+
+
+def test_query_key_normalizes_question_and_includes_filter():
+    assert query_key("When did EDSA happen?", 5) == query_key("  when did EDSA   happen", 5)
+    assert query_key("When did EDSA happen?", 5) != query_key("When did EDSA happen?", 3)
+    assert query_key("Q?", 5, {"source": "a.pdf", "page": 1}) == query_key("Q?", 5, {"page": 1, "source": "a.pdf"})
+    assert query_key("Q?", 5, {"collection": "laws"}) != query_key("Q?", 5)
+
+
+def test_concurrent_calls_share_one_run():
+    flights = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def burst():
+        first = await asyncio.gather(*(flights.do("key", work) for _ in range(5)), flights.do("other", work))
+        # Once the call has finished nothing is reused
+        later = await flights.do("key", work)
+        return first, later
+
+    first, later = asyncio.run(burst())
+    assert [result for result, _ in first] == ["answer"] * 6
+    assert [leader for _, leader in first] == [True, False, False, False, False, True]
+    assert later == ("answer", True)
+    assert len(calls) == 3
+    assert flights.stats() == {"in_flight": 0, "leaders": 3, "followers": 4, "coalescing_ratio": round(4 / 7, 4)}
+
+
+def test_errors_reach_every_caller_and_cancelling_one_keeps_the_call():
+    flights = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("LLM down")
+
+    async def slow():
+        await asyncio.sleep(0.02)
+        return "answer"
+
+    async def scenario():
+        results = await asyncio.gather(flights.do("bad", fail), flights.do("bad", fail), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        leader = asyncio.ensure_future(flights.do("slow", slow))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flights.do("slow", slow))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(scenario()) == ("answer", False)
@@ -0,0 +1,57 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+import pytest
+from context_builder import (MIN_TRUNCATED_TOKENS, assemble_context, count_tokens, drop_near_duplicates,
+                             fit_to_budget, merge_overlapping, truncate_to_tokens)
+
+FIRST = 'The Katipunan was founded by Andres Bonifacio in 1892 in Tondo, Manila, as a secret society.'
+# The text splitter starts the next chunk with the end of the previous one
+SECOND = 'in Tondo, Manila, as a secret society. It led the revolution against Spain in 1896.'
+OTHER = 'José Rizal was executed in Bagumbayan on December 30, 1896.'
+
+
+def test_merge_overlapping_joins_split_neighbours():
+    merged = FIRST + ' It led the revolution against Spain in 1896.'
+    assert merge_overlapping([FIRST, OTHER, SECOND]) == [merged, OTHER]
+    # Rank order is kept whichever half was retrieved first
+    assert merge_overlapping([SECOND, FIRST]) == [merged]
+
+
+def test_merge_overlapping_drops_contained_chunks_and_keeps_short_overlaps_apart():
+    assert merge_overlapping([FIRST, 'founded by Andres Bonifacio', OTHER]) == [FIRST, OTHER]
+    assert merge_overlapping(['The end of 1896.', '1896. A new year.']) == ['The end of 1896.', '1896. A new year.']
+
+
+def test_drop_near_duplicates_keeps_better_ranked_chunk():
+    chunks = ['a', 'b', 'c', 'd']
+    vectors = [[1.0, 0.0], [0.0, 1.0], [0.99, 0.01], None]
+    assert drop_near_duplicates(chunks, vectors, threshold=0.95) == ['a', 'b', 'd']
+    assert drop_near_duplicates(chunks, vectors, threshold=1.01) == chunks
+
+
+def test_fit_to_budget_truncates_last_piece():
+    pieces = [' '.join(['word'] * 100), ' '.join(['more'] * 100), 'tail']
+    kept = fit_to_budget(pieces, count_tokens(pieces[0]) + 50)
+    assert kept[0] == pieces[0]
+    assert len(kept) == 2 and pieces[1].startswith(kept[1]) and kept[1] != pieces[1]
+    assert sum(count_tokens(piece) for piece in kept) <= count_tokens(pieces[0]) + 50
+    # The best piece is sent even when it alone is over budget
+    assert fit_to_budget(pieces, 5) == [truncate_to_tokens(pieces[0], MIN_TRUNCATED_TOKENS)]
+
+
+@pytest.mark.parametrize('token_budget', [0, -20])
+def test_fit_to_budget_sends_best_piece_when_budget_is_used_up(token_budget):
+    pieces = [' '.join(['word'] * 100), 'tail']
+    kept = fit_to_budget(pieces, token_budget, format_piece=lambda piece: f'[1] {piece}')
+    assert len(kept) == 1 and kept[0] and pieces[0].startswith(kept[0])
+    assert count_tokens(kept[0]) <= MIN_TRUNCATED_TOKENS
+
+
+def test_assemble_context():
+    pieces = assemble_context([FIRST, FIRST, SECOND, OTHER], [[1.0, 0.0], [1.0, 0.0], [0.0, 1.0], [0.0, 1.0]],
+                              token_budget=1000, threshold=0.95)
+    # The repeated FIRST and OTHER (same vector as SECOND) are dropped, then FIRST and SECOND merge
+    assert pieces == [FIRST + ' It led the revolution against Spain in 1896.']
+    assert assemble_context([FIRST, OTHER], token_budget=1000) == [FIRST, OTHER]
+    assert assemble_context([], token_budget=1000) == []
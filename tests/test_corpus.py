@@ -0,0 +1,59 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+import json
+import pytest
+from corpus import MetadataIndex, list_collections, merge_top_k, split_filter, validate_collection
+
+METADATAS = [
+    {'source': 'a.pdf', 'page': 1, 'collection': 'history'},
+    {'source': 'a.pdf', 'page': 2, 'collection': 'history'},
+    {'source': 'b.pdf', 'page': 1, 'collection': 'laws'},
+]
+
+
+def test_validate_collection():
+    assert validate_collection('laws-2024') == 'laws-2024'
+    for name in ('', '../data', 'a/b', '.hidden', None):
+        with pytest.raises(ValueError):
+            validate_collection(name)
+
+
+def test_split_filter():
+    assert split_filter(None) == (None, None)
+    assert split_filter({'collection': 'laws'}) == (['laws'], None)
+    assert split_filter({'collection': ['a', 'b'], 'page': 3}) == (['a', 'b'], {'page': 3})
+    with pytest.raises(ValueError):
+        split_filter({'collection': '../x'})
+    with pytest.raises(ValueError):
+        split_filter(['laws'])
+    assert split_filter({'source': ['a.pdf', 'b.pdf'], 'draft': False}) == (None, {'source': ['a.pdf', 'b.pdf'],
+                                                                                  'draft': False})
+    for value in ({'$eq': 'a.pdf'}, ['a.pdf', {'$eq': 'b.pdf'}], [['a.pdf']], None):
+        with pytest.raises(ValueError):
+            split_filter({'source': value})
+
+
+def test_metadata_index_positions():
+    index = MetadataIndex([json.dumps(m) for m in METADATAS])
+    assert index.positions({'source': 'a.pdf'}).tolist() == [0, 1]
+    assert index.positions({'page': [1, 2], 'source': 'b.pdf'}).tolist() == [2]
+    assert index.positions({'page': 1, 'collection': 'history'}).tolist() == [0]
+    assert index.positions({'source': 'missing.pdf'}).size == 0
+    assert index.positions({'unknown_key': 1}).size == 0
+    assert MetadataIndex(METADATAS).positions({'collection': 'laws'}).tolist() == [2]
+
+
+def test_merge_top_k():
+    rows = [[('a', 0.5), ('b', 0.2)], [('c', 0.4)]]
+    assert merge_top_k(rows, 2, higher_is_better=True) == [('a', 0.5), ('c', 0.4)]
+    assert merge_top_k(rows, 2, higher_is_better=False) == [('b', 0.2), ('c', 0.4)]
+
+
+def test_list_collections(tmp_path):
+    assert list_collections(str(tmp_path / 'missing')) == []
+    for name in ('laws', 'history', 'empty'):
+        (tmp_path / name).mkdir()
+    (tmp_path / 'laws' / 'faiss_index').mkdir()
+    (tmp_path / 'history' / 'faiss_index').mkdir()
+    assert list_collections(str(tmp_path)) == ['history', 'laws']
@@ -0,0 +1,22 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+import faiss
+import numpy as np
+from dedup import find_duplicates
+
+
+def test_find_duplicates_within_batch():
+    vectors = np.array([[1, 0, 0], [0, 1, 0], [2, 0.01, 0], [0, 1, 0], [0, 0, 1]], dtype=np.float32)
+    assert find_duplicates(vectors, threshold=0.97).tolist() == [-1, -1, 0, 1, -1]
+    # Disabled: everything is kept
+    assert find_duplicates(vectors, threshold=0).tolist() == [-1] * 5
+    assert find_duplicates(np.empty((0, 3), dtype=np.float32)).tolist() == []
+
+
+def test_find_duplicates_against_index():
+    index = faiss.IndexFlatL2(3)
+    index.add(np.array([[0, 0, 1], [1, 0, 0]], dtype=np.float32))
+    vectors = np.array([[0, 1, 0], [3, 0, 0], [0, 1.01, 0], [0.7, 0.7, 0]], dtype=np.float32)
+    # Rows continue the index's numbering: 2 is row 0 of the batch
+    assert find_duplicates(vectors, index, threshold=0.97).tolist() == [-1, 1, 2, -1]
@@ -0,0 +1,88 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from embedding_cache import CachedEmbeddings, EmbeddingStore, LazyEmbeddings
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    documents_embedded: int = 0
+    queries_embedded: int = 0
+
+    def embed_documents(self, texts):
+        self.documents_embedded += len(texts)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.queries_embedded += 1
+        return super().embed_query(text)
+
+
+def test_documents_are_embedded_once_and_persisted(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    model = CountingEmbedding(size=8)
+    cached = CachedEmbeddings(model, 'mini', EmbeddingStore(path))
+    first = cached.embed_documents(['a', 'b', 'a'])
+    assert model.documents_embedded == 2
+    assert first[0] == first[2]
+
+    reopened = CachedEmbeddings(model, 'mini', EmbeddingStore(path))
+    second = reopened.embed_documents(['b', 'c', 'a'])
+    assert model.documents_embedded == 3
+    assert second[0] == first[1]
+    assert reopened.document_hits == 2 and reopened.document_misses == 1
+    assert len(reopened.store) == 3
+
+
+def test_cache_key_includes_model_name(tmp_path):
+    store = EmbeddingStore(str(tmp_path / 'cache.sqlite'))
+    model = CountingEmbedding(size=8)
+    CachedEmbeddings(model, 'mini', store).embed_documents(['a'])
+    CachedEmbeddings(model, 'other', store).embed_documents(['a'])
+    assert model.documents_embedded == 2
+
+
+def test_query_lru(tmp_path):
+    model = CountingEmbedding(size=8)
+    cached = CachedEmbeddings(model, 'mini', EmbeddingStore(str(tmp_path / 'cache.sqlite')), query_cache_size=2)
+    cached.embed_query('q1')
+    cached.embed_query('q2')
+    cached.embed_query('q1')
+    assert model.queries_embedded == 2
+    cached.embed_query('q3')  # evicts q2
+    cached.embed_query('q2')
+    assert model.queries_embedded == 4
+    # Queries never reach the persistent store
+    assert not os.path.exists(cached.store.path)
+
+
+def test_embed_queries_batches_misses(tmp_path):
+    model = CountingEmbedding(size=8)
+    cached = CachedEmbeddings(model, 'mini', EmbeddingStore(str(tmp_path / 'cache.sqlite')))
+    cached.embed_query('q1')
+    vectors = cached.embed_queries(['q1', 'q2', 'q2', 'q3'])
+    assert model.documents_embedded == 2
+    assert vectors[0] == cached.embed_query('q1')
+    assert vectors[1] == vectors[2]
+
+
+def test_lazy_model_and_persisted_queries(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    models = []
+
+    def factory():
+        models.append(CountingEmbedding(size=8))
+        return models[-1]
+
+    cached = CachedEmbeddings(LazyEmbeddings(factory), 'mini', EmbeddingStore(path), persist_queries=True)
+    assert models == []
+    vector = cached.embed_query('q1')
+    assert len(models) == 1 and models[0].queries_embedded == 1
+
+    # A new process finds the query on disk and never creates the model
+    reopened = CachedEmbeddings(LazyEmbeddings(factory), 'mini', EmbeddingStore(path), persist_queries=True)
+    assert reopened.embed_query('q1') == vector
+    assert len(models) == 1
+    assert not reopened.underlying.loaded
+    reopened.warm_up()
+    assert reopened.underlying.loaded
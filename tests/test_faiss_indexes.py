@@ -0,0 +1,114 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+import numpy as np
+import pytest
+import faiss_indexes
+
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(0)
+    return rng.standard_normal((2000, 32)).astype(np.float32)
+
+
+@pytest.mark.parametrize('index_type', faiss_indexes.INDEX_TYPES)
+def test_build_index_finds_stored_vectors(vectors, index_type):
+    index = faiss_indexes.build_index(index_type, vectors)
+    assert faiss_indexes.index_type_of(index) == index_type
+    assert index.ntotal == len(vectors)
+    faiss_indexes.set_search_params(index, nprobe=1000, ef_search=256)
+    _, found = index.search(vectors[:50], 1)
+    assert (found[:, 0] == np.arange(50)).mean() >= 0.9
+
+
+def test_small_corpora_stay_flat(vectors):
+    assert faiss_indexes.effective_index_type('hnsw', 10) == 'flat'
+    index = faiss_indexes.build_index('ivf', vectors[:10])
+    assert faiss_indexes.index_type_of(index) == 'flat'
+
+
+def test_unknown_index_type():
+    with pytest.raises(ValueError):
+        faiss_indexes.effective_index_type('lsh', 10)
+
+
+def test_pq_subquantizers_divide_dimension():
+    assert 384 % faiss_indexes._pq_m(384) == 0
+    assert faiss_indexes._pq_m(30) in (1, 2, 3, 5, 6, 10, 15, 30)
+
+
+def test_search_params(vectors):
+    index = faiss_indexes.build_index('ivf', vectors)
+    faiss_indexes.set_search_params(index, nprobe=10 ** 6)
+    assert index.nprobe == index.nlist
+    hnsw = faiss_indexes.build_index('hnsw', vectors)
+    faiss_indexes.set_search_params(hnsw, ef_search=7)
+    assert hnsw.hnsw.efSearch == 7
+
+
+@pytest.mark.parametrize('index_type', faiss_indexes.INDEX_TYPES)
+def test_filtered_search_only_returns_allowed_ids(vectors, index_type):
+    index = faiss_indexes.build_index(index_type, vectors)
+    faiss_indexes.set_search_params(index, nprobe=1000, ef_search=256)
+    allowed = np.array([5, 50, 500])
+    _, found = faiss_indexes.filtered_search(index, vectors[:3], 10, allowed)
+    assert set(found.ravel().tolist()) <= {5, 50, 500, -1}
+    _, found = faiss_indexes.filtered_search(index, vectors[50:51], 1, allowed)
+    assert found[0, 0] == 50
+
+
+def test_binary_index_rescores_bit_codes(vectors, tmp_path, monkeypatch):
+    import faiss
+    index = faiss_indexes.build_index('binary', vectors)
+    flat = faiss_indexes.build_index('flat', vectors)
+    # 1 bit per dimension is all that is searched in memory
+    assert index.codes.code_size * 32 == vectors.shape[1] * 4
+    distances, found = index.search(vectors[:50], 5)
+    exact_distances, exact = flat.search(vectors[:50], 5)
+    assert np.mean([len(set(a) & set(b)) / 5 for a, b in zip(found, exact)]) >= 0.8
+    # Rescored distances are L2 distances, comparable with the flat index's
+    assert np.allclose(distances[:, 0], exact_distances[:, 0], atol=1e-2)
+
+    # Saved as the codes plus a file of float16 vectors
+    directory = tmp_path / 'index'
+    directory.mkdir()
+    faiss.write_index(index.codes, str(directory / 'index.faiss'))
+    index.save_vectors(str(directory / faiss_indexes.BINARY_VECTORS))
+    assert faiss_indexes.index_type_of(faiss.read_index(str(directory / 'index.faiss'))) == 'lsh'
+    mapped = faiss_indexes.read_index_dir(str(directory))
+    assert faiss_indexes.index_type_of(mapped) == 'binary'
+    assert np.allclose(mapped.reconstruct(7), vectors[7], atol=1e-2)
+    assert np.allclose(mapped.reconstruct_n(0, len(vectors)), vectors, atol=1e-2)
+    # Only the candidates' rows are read from the vectors file
+    reads = []
+    pread = os.pread
+    monkeypatch.setattr(os, 'pread', lambda fd, n, offset: reads.append(n) or pread(fd, n, offset))
+    faiss_indexes.set_search_params(mapped, rescore_factor=4)
+    mapped_distances, mapped_found = mapped.search(vectors[:50], 5)
+    assert sum(reads) == 50 * 5 * 4 * mapped._row_bytes
+    faiss_indexes.set_search_params(index, rescore_factor=4)
+    assert (mapped_found == index.search(vectors[:50], 5)[1]).all()
+
+
+def test_binary_filtered_search_uses_bit_codes(vectors):
+    index = faiss_indexes.build_index('binary', vectors)
+    allowed = np.arange(0, len(vectors), 2)
+    index.rows = lambda positions: pytest.fail('read every allowed vector') if len(positions) > 20 else \
+        faiss_indexes.BinaryIndex.rows(index, positions)
+    faiss_indexes.set_search_params(index, rescore_factor=4)
+    distances, found = faiss_indexes.filtered_search(index, vectors[:3], 5, allowed)
+    assert set(found.ravel().tolist()) <= set(allowed.tolist())
+    # A query's own vector is allowed for even positions and comes first
+    assert found[0, 0] == 0 and found[2, 0] == 2
+    _, none = faiss_indexes.filtered_search(index, vectors[:1], 5, np.array([], dtype=np.int64))
+    assert (none == -1).all()
+
+
+def test_binary_index_handles_off_centre_vectors(vectors):
+    # Every dimension shifted far from 0: plain sign bits would be the same for every vector
+    shifted = vectors + 10
+    index = faiss_indexes.build_index('binary', shifted)
+    _, found = index.search(shifted[:50], 5)
+    _, exact = faiss_indexes.build_index('flat', shifted).search(shifted[:50], 5)
+    assert np.mean([len(set(a) & set(b)) / 5 for a, b in zip(found, exact)]) >= 0.8
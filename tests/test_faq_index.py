@@ -0,0 +1,118 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+from unittest.mock import patch
+import numpy as np
+import pytest
+import faq_index
+from faq_index import FAQIndex, chunk_questions, generate_questions, is_answered, same_subject
+
+CHUNKS = [
+    "The EDSA People Power Revolution happened on February 25, 1986 and ended the rule of Ferdinand Marcos.",
+    "During the Spanish period, Jose Rizal wrote Noli Me Tangere in 1887.",
+    "Jose Rizal was executed in Bagumbayan in 1896.",
+]
+
+
+def test_chunk_questions_from_dates_and_entities():
+    questions = chunk_questions(CHUNKS[0])
+    assert "What happened on February 25, 1986?" in questions
+    assert "What happened in 1986?" in questions
+    assert "When did the EDSA People Power Revolution happen?" in questions
+    assert "What is the significance of the EDSA People Power Revolution?" in questions
+    assert "What is the significance of Ferdinand Marcos?" in questions
+    # "During the Spanish" is not a name
+    assert not any("During" in question for question in chunk_questions(CHUNKS[1]))
+
+
+def test_generate_questions_puts_common_subjects_first():
+    questions = generate_questions(CHUNKS, limit=4)
+    assert questions[0] == "What is the significance of Jose Rizal?"
+    assert len(questions) == 4 == len(set(questions))
+
+
+def test_is_answered():
+    assert is_answered("Rizal was executed on December 30, 1896.")
+    assert not is_answered("Not enough information in the context.")
+    assert not is_answered(None)
+
+
+def test_write_and_match(tmp_path):
+    path = str(tmp_path / "faq")
+    assert not FAQIndex.exists(path)
+    embeddings = np.eye(3, 4, dtype=np.float32)
+    FAQIndex.write(path, ["When was Rizal executed?", "What happened in 1986?", "Who founded the Katipunan?"],
+                   embeddings, ["In 1896.", "EDSA.", "Bonifacio."], ["date_lookup", "complex", "complex"],
+                   [["Rizal chunk"], ["EDSA chunk"], []], "corpus-a", 5)
+    faq = FAQIndex(path, similarity=0.9)
+    assert len(faq) == 3 and faq.fingerprint == "corpus-a" and faq.top_n == 5
+
+    exact = faq.get("when was rizal executed")
+    assert (exact.answer, exact.intent, exact.chunks, exact.similarity) == ("In 1896.", "date_lookup", ["Rizal chunk"], 1.0)
+    close = faq.nearest([0.05, 0.99, 0.0, 0.1])
+    assert close.question == "What happened in 1986?" and 0.9 <= close.similarity < 1
+    assert faq.nearest([0.6, 0.6, 0.0, 0.5]) is None
+    assert faq.get("Who was Rizal?") is None
+    assert faq.stats() == {"questions": 3, "exact_hits": 1, "similar_hits": 1, "misses": 1, "hit_rate": 0.6667}
+
+
+def test_interrupted_rebuild_keeps_serving_the_previous_build(tmp_path):
+    path = str(tmp_path / "faq")
+    FAQIndex.write(path, ["When was Rizal executed?", "What happened in 1986?"], np.eye(2, 4, dtype=np.float32),
+                   ["In 1896.", "EDSA."], ["date_lookup", "complex"], [[], []], "corpus-a", 5)
+    write_strings = faq_index.write_strings
+
+    def fail_on_answers(prefix, strings):
+        if os.path.basename(prefix).startswith("answers"):
+            raise OSError("disk full")
+        write_strings(prefix, strings)
+
+    # The new build's index and questions are written, in the other order, before it fails
+    with patch("faq_index.write_strings", fail_on_answers), pytest.raises(OSError):
+        FAQIndex.write(path, ["What happened in 1986?", "When was Rizal executed?"], np.eye(2, 4, dtype=np.float32),
+                       ["EDSA.", "In 1896."], ["complex", "date_lookup"], [[], []], "corpus-a", 5)
+    faq = FAQIndex(path)
+    assert faq.get("When was Rizal executed?").answer == "In 1896."
+    assert faq.nearest([1.0, 0.0, 0.0, 0.0]).answer == "In 1896."
+
+    first = faq.build
+    for answer in ("Executed in 1896.", "On December 30, 1896."):
+        FAQIndex.write(path, ["When was Rizal executed?"], np.eye(1, 4, dtype=np.float32), [answer],
+                       ["date_lookup"], [[]], "corpus-a", 5)
+    faq = FAQIndex(path)
+    assert faq.get("When was Rizal executed?").answer == "On December 30, 1896."
+    # The failed build and the first one are cleaned up; the build just replaced stays for readers
+    builds = {name.split("-")[1].split(".")[0] for name in os.listdir(path) if name != "meta.json"}
+    assert faq.build in builds and first not in builds and len(builds) == 2
+
+
+def test_same_subject():
+    assert same_subject("what happened in 1896", "What happened in 1896?")
+    assert not same_subject("What happened in 1898?", "What happened in 1896?")
+    assert same_subject("What happened on 30 December 1896?", "What happened on December 30, 1896?")
+    assert not same_subject("What happened on December 29, 1896?", "What happened on December 30, 1896?")
+    assert same_subject("what is the significance of jose rizal", "What is the significance of Jose Rizal?")
+    assert not same_subject("What is the significance of Andres Bonifacio?", "What is the significance of Jose Rizal?")
+
+
+def test_nearest_rejects_template_question_about_another_year(tmp_path):
+    path = str(tmp_path / "faq")
+    FAQIndex.write(path, ["What happened in 1896?", "What happened in 1986?"],
+                   np.array([[1.0, 0.0, 0.0, 0.0], [0.0, 1.0, 0.0, 0.0]], dtype=np.float32),
+                   ["The Philippine Revolution began.", "EDSA."], ["date_lookup", "date_lookup"],
+                   [["1896 chunk"], ["1986 chunk"]], "corpus-a", 5)
+    faq = FAQIndex(path, similarity=0.9)
+    # The two template questions embed almost identically; only the year tells them apart
+    query_embedding = [0.99, 0.05, 0.0, 0.0]
+    assert faq.nearest(query_embedding).question == "What happened in 1896?"
+    assert faq.nearest(query_embedding, "What happened in 1898?") is None
+    assert faq.nearest(query_embedding, "what happened in 1896").answer == "The Philippine Revolution began."
+    assert faq.stats()["misses"] == 1
+
+
+def test_empty_set(tmp_path):
+    path = str(tmp_path / "faq")
+    FAQIndex.write(path, [], np.zeros((0, 4), dtype=np.float32), [], [], [], "corpus-a", 5)
+    faq = FAQIndex(path)
+    assert len(faq) == 0
+    assert faq.nearest([1.0, 0.0, 0.0, 0.0]) is None
@@ -0,0 +1,84 @@
+import sys
+import os
+import zlib
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from bm25_index import tokenize
+from intent import (CANNED_RESPONSES, COMPLEX, DATE_LOOKUP, GREETING, OUT_OF_SCOPE, IntentClassifier,
+                    IntentStats, extract_date_answer, fast_answer)
+
+
+class BagOfWordsEmbedding(Embeddings):
+    """Hashed word counts: texts that share words get similar vectors."""
+
+    def embed_query(self, text):
+        vector = np.zeros(256, dtype=np.float32)
+        for token in tokenize(text) or ['_']:
+            vector[zlib.crc32(token.encode()) % 256] += 1
+        return vector.tolist()
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+def test_classifier_routes_by_nearest_centroid():
+    embeddings = BagOfWordsEmbedding()
+    classifier = IntentClassifier(embeddings, min_similarity=0.2)
+    assert classifier.classify(embeddings.embed_query('Hello, good morning!'))[0] == GREETING
+    assert classifier.classify(embeddings.embed_query('What year was Andres Bonifacio executed?'))[0] == DATE_LOOKUP
+    assert classifier.classify(embeddings.embed_query('Tell me a joke about the weather'))[0] == OUT_OF_SCOPE
+    assert classifier.classify(embeddings.embed_query('Why was José Rizal important?'))[0] == COMPLEX
+    # Nothing in common with any example: too uncertain to short-cut, so the LLM answers
+    intent, similarity = classifier.classify(embeddings.embed_query('Sakdalista uprising'))
+    assert (intent, similarity) == (COMPLEX, 0.0)
+
+
+def test_centroids_are_computed_once():
+    calls = []
+
+    class CountingEmbedding(BagOfWordsEmbedding):
+        def embed_documents(self, texts):
+            calls.append(len(texts))
+            return super().embed_documents(texts)
+
+    classifier = IntentClassifier(CountingEmbedding(), examples={GREETING: ['hi'], COMPLEX: ['why']})
+    classifier.warm_up()
+    classifier.classify([1.0] * 256)
+    assert calls == [1, 1]
+    assert classifier.centroids.shape == (2, 256)
+
+
+def test_extract_date_answer():
+    chunks = [
+        'The Katipunan was founded by Andres Bonifacio in 1892. It led the revolution.',
+        'The EDSA People Power Revolution took place in February 1986. Marcos left the country.',
+    ]
+    assert extract_date_answer('When did the EDSA People Power Revolution happen?', chunks) == \
+        'The EDSA People Power Revolution took place in February 1986.'
+    assert extract_date_answer('When was the Katipunan founded?', chunks) == \
+        'The Katipunan was founded by Andres Bonifacio in 1892.'
+    # The subject is not in any dated sentence
+    assert extract_date_answer('When was the Treaty of Paris signed?', chunks) is None
+    assert extract_date_answer('When?', chunks) is None
+
+
+def test_fast_answer():
+    assert fast_answer(GREETING, 'Hi', []) == CANNED_RESPONSES[GREETING]
+    assert fast_answer(OUT_OF_SCOPE, 'Weather?', []) == CANNED_RESPONSES[OUT_OF_SCOPE]
+    assert fast_answer(DATE_LOOKUP, 'When was Rizal executed?', ['Rizal was executed in 1896.']) == \
+        'Rizal was executed in 1896.'
+    assert fast_answer(COMPLEX, 'When was Rizal executed?', ['Rizal was executed in 1896.']) is None
+
+
+def test_intent_stats():
+    stats = IntentStats()
+    stats.record(GREETING, 0.001, False)
+    stats.record(COMPLEX, 0.5, True)
+    stats.record(COMPLEX, 0.3, True)
+    result = stats.stats()
+    assert result['requests'] == 3
+    assert result['llm_calls'] == 2
+    assert result['llm_fraction'] == round(2 / 3, 4)
+    assert result['by_intent'][COMPLEX] == {'count': 2, 'llm_calls': 2, 'avg_ms': 400.0, 'max_ms': 500.0}
+    assert result['by_intent'][DATE_LOOKUP]['count'] == 0
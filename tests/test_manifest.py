@@ -0,0 +1,56 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+from manifest import IndexManifest, file_sha256, next_chunk_id
+
+
+def chunk_ids_for(source, chunks):
+    seen = {}
+    return [next_chunk_id(source, chunk, seen) for chunk in chunks]
+
+
+def test_chunk_ids_are_stable_and_unique():
+    ids = chunk_ids_for('a.pdf', ['Header', 'Body one', 'Header'])
+    assert len(set(ids)) == 3
+    # Editing one chunk leaves the IDs of the others unchanged
+    edited = chunk_ids_for('a.pdf', ['Header', 'Body two', 'Header'])
+    assert edited[0] == ids[0] and edited[2] == ids[2] and edited[1] != ids[1]
+    assert chunk_ids_for('b.pdf', ['Header'])[0] != ids[0]
+
+
+def test_manifest_round_trip(tmp_path):
+    path = str(tmp_path / 'manifest.json')
+    manifest = IndexManifest.load(path)
+    assert manifest.files == {}
+    manifest.settings = {'chunk_size': 500}
+    manifest.record('a.pdf', 'abc', ['id1', 'id2'])
+    manifest.save()
+
+    loaded = IndexManifest.load(path)
+    assert loaded.settings == {'chunk_size': 500}
+    assert loaded.is_unchanged('a.pdf', 'abc')
+    assert not loaded.is_unchanged('a.pdf', 'def')
+    assert loaded.chunk_ids('a.pdf') == ['id1', 'id2']
+    loaded.forget('a.pdf')
+    assert loaded.chunk_ids('a.pdf') == []
+
+
+def test_file_sha256(tmp_path):
+    path = tmp_path / 'a.pdf'
+    path.write_bytes(b'%PDF-1.4')
+    assert file_sha256(str(path)) == file_sha256(str(path))
+    path.write_bytes(b'%PDF-1.5')
+    assert len(file_sha256(str(path))) == 64
+
+
+def test_fingerprint_follows_files_and_settings(tmp_path):
+    manifest = IndexManifest(str(tmp_path / 'manifest.json'), {'chunk_size': 500})
+    manifest.record('a.pdf', 'abc', ['id1'])
+    fingerprint = manifest.fingerprint()
+    manifest.record('a.pdf', 'abc', ['id1'])
+    assert manifest.fingerprint() == fingerprint
+    manifest.record('a.pdf', 'def', ['id2'])
+    assert manifest.fingerprint() != fingerprint
+    manifest.record('a.pdf', 'abc', ['id1'])
+    manifest.settings = {'chunk_size': 400}
+    assert manifest.fingerprint() != fingerprint
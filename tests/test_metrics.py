@@ -0,0 +1,102 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+import asyncio
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from metrics import Counter, Histogram, Profiler, Registry, STAGE_ERRORS, STAGE_SECONDS, collect_timings, timed, timer
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_seconds", "Test latency", ["stage"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(value, stage="search")
+    registry = Registry()
+    registry.register(histogram)
+    lines = registry.render().splitlines()
+    assert lines[:2] == ["# HELP test_seconds Test latency", "# TYPE test_seconds histogram"]
+    assert lines[2:] == [
+        'test_seconds_bucket{stage="search",le="0.1"} 1',
+        'test_seconds_bucket{stage="search",le="1.0"} 3',
+        'test_seconds_bucket{stage="search",le="+Inf"} 4',
+        'test_seconds_sum{stage="search"} 4.05',
+        'test_seconds_count{stage="search"} 4',
+    ]
+    assert histogram.count(stage="search") == 4
+    assert histogram.count(stage="llm") == 0
+
+
+def test_counter_per_label():
+    counter = Counter("test_total", "Test counter", ["kind"])
+    counter.inc(kind="prompt")
+    counter.inc(41, kind="prompt")
+    counter.inc(7, kind="completion")
+    assert counter.value(kind="prompt") == 42
+    assert counter.render() == ['test_total{kind="completion"} 7', 'test_total{kind="prompt"} 42']
+
+
+def test_timer_records_stage_errors_and_request_timings():
+    errors = STAGE_ERRORS.value(stage="test_stage")
+    observed = STAGE_SECONDS.count(stage="test_stage")
+
+    def work():
+        timings = collect_timings()
+        with timer("test_stage"):
+            time.sleep(0.01)
+        with pytest.raises(RuntimeError):
+            with timer("test_stage"):
+                raise RuntimeError("boom")
+        return timings
+
+    timings = contextvars.copy_context().run(work)
+    assert timings["test_stage"] >= 0.01
+    assert STAGE_SECONDS.count(stage="test_stage") == observed + 2
+    assert STAGE_ERRORS.value(stage="test_stage") == errors + 1
+
+
+def test_timings_follow_the_request_into_a_thread_pool():
+    @timed("test_pool")
+    def search():
+        return "done"
+
+    def handle():
+        timings = collect_timings()
+        with ThreadPoolExecutor(1) as pool:
+            assert pool.submit(contextvars.copy_context().run, search).result() == "done"
+        return timings
+
+    assert set(contextvars.copy_context().run(handle)) == {"test_pool"}
+    # Without collect_timings nothing is gathered, but the histogram still is
+    assert search() == "done"
+
+
+def test_timed_async_generator():
+    @timed("test_stream")
+    async def stream():
+        for token in ("a", "b"):
+            yield token
+
+    async def collect():
+        timings = collect_timings()
+        return [token async for token in stream()], timings
+
+    tokens, timings = asyncio.run(collect())
+    assert tokens == ["a", "b"]
+    assert "test_stream" in timings
+
+
+def test_timer_overhead_is_microseconds():
+    n = 20000
+    start = time.perf_counter()
+    for _ in range(n):
+        with timer("test_overhead"):
+            pass
+    assert (time.perf_counter() - start) / n < 50e-6
+
+
+def test_profiler_reports_the_profiled_call():
+    profiler = Profiler("cprofile")
+    assert profiler.run(sorted, [3, 1, 2]) == [1, 2, 3]
+    assert "function calls" in profiler.report()
@@ -0,0 +1,54 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+import numpy as np
+import pytest
+
+onnx = pytest.importorskip('onnx')
+pytest.importorskip('onnxruntime')
+pytest.importorskip('tokenizers')
+from onnx import TensorProto, helper, numpy_helper
+from tokenizers import Tokenizer, models, pre_tokenizers
+from onnx_embeddings import MODEL_FILE, TOKENIZER_FILE, OnnxEmbeddings
+
+VOCAB = ['[PAD]', '[UNK]', 'rizal', 'was', 'born', 'in', '1861', 'edsa', '1986']
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    """A toy 'transformer' whose hidden state is a per-token embedding lookup."""
+    table = np.random.default_rng(0).standard_normal((len(VOCAB), 8)).astype(np.float32)
+    inputs = [helper.make_tensor_value_info(name, TensorProto.INT64, ['batch', 'sequence'])
+              for name in ('input_ids', 'attention_mask', 'token_type_ids')]
+    output = helper.make_tensor_value_info('last_hidden_state', TensorProto.FLOAT, ['batch', 'sequence', 8])
+    graph = helper.make_graph([helper.make_node('Gather', ['table', 'input_ids'], ['last_hidden_state'])],
+                              'toy', inputs, [output], [numpy_helper.from_array(table, 'table')])
+    onnx.save(helper.make_model(graph, opset_imports=[helper.make_opsetid('', 14)], ir_version=8), str(tmp_path / MODEL_FILE))
+    tokenizer = Tokenizer(models.WordLevel({token: i for i, token in enumerate(VOCAB)}, unk_token='[UNK]'))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.save(str(tmp_path / TOKENIZER_FILE))
+    return tmp_path, table
+
+
+def test_mean_pooled_and_normalised(model_dir):
+    path, table = model_dir
+    embeddings = OnnxEmbeddings(str(path), quantized=False, threads=1)
+    vector = np.array(embeddings.embed_query('rizal was born'))
+    expected = table[[2, 3, 4]].mean(axis=0)
+    assert np.allclose(vector, expected / np.linalg.norm(expected), atol=1e-6)
+
+
+def test_batches_match_single_queries(model_dir):
+    path, _ = model_dir
+    embeddings = OnnxEmbeddings(str(path), quantized=False, batch_size=2)
+    texts = ['rizal was born in 1861', 'edsa', 'edsa in 1986', 'rizal']
+    vectors = embeddings.embed_documents(texts)
+    # Padding to the longest text in a batch and length-sorting must not change any vector
+    for text, vector in zip(texts, vectors):
+        assert np.allclose(vector, embeddings.embed_query(text), atol=1e-6)
+
+
+def test_missing_model_file(model_dir):
+    path, _ = model_dir
+    with pytest.raises(FileNotFoundError):
+        OnnxEmbeddings(str(path), quantized=True)
@@ -0,0 +1,48 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+from bm25_index import tokenize
+from reranker import CrossEncoderReranker, rerank_depth
+
+
+class OverlapModel:
+    """Stands in for a cross-encoder: scores a pair by the query words the chunk contains."""
+
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, pairs, batch_size=32):
+        self.calls.append(list(pairs))
+        return [float(len(set(tokenize(query)) & set(tokenize(chunk)))) for query, chunk in pairs]
+
+
+def test_rerank_depth_adapts_to_score_spread():
+    # A clear winner: trust the first stage
+    assert rerank_depth([10.0, 2.0, 1.9, 1.8, 1.7, 1.0], keep=1, higher_is_better=True) == 0
+    # Flat scores: rerank every candidate
+    assert rerank_depth([1.0] * 20, keep=3, higher_is_better=True) == 20
+    flat = rerank_depth([5.0, 4.9, 4.8, 4.7] + [1.0] * 16, keep=3, higher_is_better=True)
+    steep = rerank_depth([5.0, 4.0, 3.6, 3.4] + [1.0] * 16, keep=3, higher_is_better=True)
+    assert 6 <= steep < flat <= 20
+    # L2 distances: lower is better
+    assert rerank_depth([0.1, 5.0, 5.1, 5.2], keep=1, higher_is_better=False) == 0
+    assert rerank_depth([1.0, 2.0], keep=3, higher_is_better=True) == 0
+
+
+def test_rerank_many_reorders_trims_and_caches():
+    model = OverlapModel()
+    reranker = CrossEncoderReranker(model=model, max_depth=10, skip_gap=0.5)
+    row = [(f'Filler chunk {i}.', 1.0) for i in range(5)] + [('Rizal was executed in 1896.', 1.0)]
+    confident = [('EDSA happened in 1986.', 9.0), ('Filler chunk.', 1.0), ('Other filler.', 0.5)]
+    results = reranker.rerank_many(['When was Rizal executed?', 'When did EDSA happen?'], [row, confident],
+                                   keep=2, higher_is_better=True)
+    assert results[0][0] == ('Rizal was executed in 1896.', 2.0)
+    assert len(results[0]) == 2
+    assert results[1] == confident[:2]  # kept in first-stage order, unscored
+    assert len(model.calls) == 1 and len(model.calls[0]) == 6
+    assert reranker.stats() == {'reranked': 1, 'skipped': 1, 'pairs_scored': 6, 'cached_scores': 6}
+
+    reranker.rerank_many(['When was Rizal executed?'], [row], keep=2, higher_is_better=True)
+    assert len(model.calls) == 1
+    assert reranker.score([('q', 'a'), ('q', 'a')]) == [0.0, 0.0]
+    assert model.calls[-1] == [('q', 'a')]
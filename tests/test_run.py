@@ -4,23 +4,314 @@ warnings.filterwarnings("ignore", category=DeprecationWarning, message="builtin
 import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
-import pickle
+import asyncio
 import pytest
-from unittest.mock import patch, MagicMock, mock_open
+from unittest.mock import patch, MagicMock, AsyncMock, mock_open
+import fitz
+from langchain_community.vectorstores import FAISS
 import run
 
 class TestRunPy:
-    @patch('run.fitz.open')
+    @pytest.fixture(autouse=True)
+    def answer_store(self, tmp_path):
+        with patch('run.ANSWER_STORE_PATH', str(tmp_path / 'answers.sqlite')):
+            yield
+
+    @patch('fitz.open')
     def test_load_pdf_chunks(self, mock_fitz_open):
         mock_doc = MagicMock()
         mock_doc.__iter__.return_value = [MagicMock(get_text=MagicMock(return_value='Page 1 text')), MagicMock(get_text=MagicMock(return_value='Page 2 text'))]
+        mock_doc.__enter__.return_value = mock_doc
         mock_fitz_open.return_value = mock_doc
         chunks = run.load_pdf_chunks('dummy.pdf', chunk_size=10, chunk_overlap=0)
         assert isinstance(chunks, list)
         assert len(chunks) > 0
 
-    @patch('run.FAISS')
-    @patch('run.HuggingFaceEmbeddings')
+    def test_iter_pdf_chunks_parallel_keeps_page_order(self, tmp_path):
+        pdf_path = str(tmp_path / 'history.pdf')
+        doc = fitz.open()
+        for i in range(run.PARALLEL_MIN_PAGES + 6):
+            doc.new_page().insert_text((72, 72), f'Page {i + 1} of the history text.')
+        doc.save(pdf_path)
+        doc.close()
+        sequential = list(run.iter_pdf_chunks(pdf_path, chunk_size=100, chunk_overlap=0, workers=1))
+        parallel = list(run.iter_pdf_chunks(pdf_path, chunk_size=100, chunk_overlap=0, workers=2))
+        assert parallel == sequential
+        assert parallel[0] == ('Page 1 of the history text.', 1)
+        assert parallel[-1][1] == run.PARALLEL_MIN_PAGES + 6
+
+    def test_iter_pdf_pages_closes_the_document(self, tmp_path):
+        pdf_path = str(tmp_path / 'history.pdf')
+        self._write_pdf(pdf_path, ['Page 1 text.', 'Page 2 text.'])
+        opened = []
+
+        def tracking_open(*args, **kwargs):
+            opened.append(fitz_open(*args, **kwargs))
+            return opened[-1]
+
+        fitz_open = fitz.open
+        with patch('fitz.open', tracking_open):
+            assert [page_no for page_no, _ in run.iter_pdf_pages(pdf_path, workers=1)] == [1, 2]
+            pages = run.iter_pdf_pages(pdf_path, workers=1)
+            next(pages)
+            pages.close()  # a consumer that stops early
+        assert len(opened) == 2 and all(doc.is_closed for doc in opened)
+
+    def test_iter_batches(self):
+        assert list(run.iter_batches(range(5), batch_size=2)) == [[0, 1], [2, 3], [4]]
+
+    @staticmethod
+    def _write_pdf(path, pages):
+        doc = fitz.open()
+        for text in pages:
+            doc.new_page().insert_text((72, 72), text)
+        doc.save(str(path))
+        doc.close()
+
+    @pytest.fixture
+    def index_paths(self, tmp_path):
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        with patch('run.INDEX_PATH', str(tmp_path / 'faiss_index')), \
+                patch('run.CHUNKS_PATH', str(tmp_path / 'chunks')), \
+                patch('run.BM25_PATH', str(tmp_path / 'bm25')), \
+                patch('run.MANIFEST_PATH', str(tmp_path / 'manifest.json')), \
+                patch('run.COLLECTIONS_PATH', str(tmp_path / 'collections')), \
+                patch('run.EMBEDDING_CACHE_PATH', str(tmp_path / 'embeddings.sqlite')), \
+                patch('run._create_embedding_model', return_value=DeterministicFakeEmbedding(size=16)):
+            yield tmp_path
+
+    def test_build_or_load_index_streams_batches(self, index_paths):
+        pdf_path = index_paths / 'history.pdf'
+        self._write_pdf(pdf_path, [f'Page {i} text.' for i in range(1, 6)])
+        with patch('run.PDF_PATH', str(pdf_path)), patch('run.EMBED_BATCH_SIZE', 2):
+            vectorstore, chunks = run.build_or_load_index()
+        assert list(chunks) == [f'Page {i} text.' for i in range(1, 6)]
+        assert vectorstore.index.ntotal == 5
+        doc = vectorstore.similarity_search('Page 1 text.', k=1)[0]
+        assert doc.metadata == {'source': str(pdf_path), 'page': 1, 'collection': 'default'}
+        assert os.path.exists(run.MANIFEST_PATH)
+
+    def test_ingest_directory_is_incremental(self, index_paths):
+        corpus = index_paths / 'corpus'
+        corpus.mkdir()
+        self._write_pdf(corpus / 'a.pdf', ['Rizal was born in 1861.', 'Rizal died in 1896.'])
+        self._write_pdf(corpus / 'b.pdf', ['EDSA happened in 1986.'])
+        stats = run.ingest_directory(str(corpus))
+        assert stats['added'] == 3 and stats['total_chunks'] == 3
+
+        stats = run.ingest_directory(str(corpus))
+        assert stats['added'] == 0 and stats['unchanged_files'] == 2
+
+        # Edit one page of a.pdf, delete b.pdf, add c.pdf
+        self._write_pdf(corpus / 'a.pdf', ['Rizal was born in 1861.', 'Rizal was executed in 1896.'])
+        os.remove(corpus / 'b.pdf')
+        self._write_pdf(corpus / 'c.pdf', ['Mactan was fought in 1521.'])
+        with patch.object(FAISS, 'add_embeddings', autospec=True, side_effect=FAISS.add_embeddings) as add_embeddings:
+            stats = run.ingest_directory(str(corpus))
+        embedded = [text for call in add_embeddings.call_args_list for text, _ in call.args[1]]
+        assert sorted(embedded) == ['Mactan was fought in 1521.', 'Rizal was executed in 1896.']
+        assert stats['deleted'] == 2 and stats['removed_files'] == 1
+        assert sorted(run.ChunkStore(run.CHUNKS_PATH).texts) == ['Mactan was fought in 1521.', 'Rizal was born in 1861.',
+                                                                 'Rizal was executed in 1896.']
+
+    def test_update_index_streams_chunks(self, index_paths):
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        pdf_path = index_paths / 'a.pdf'
+        self._write_pdf(pdf_path, ['unused'])
+        produced = []
+
+        def chunks(*args, **kwargs):
+            for i in range(6):
+                produced.append(i)
+                yield f'Chunk {i} text.', i + 1
+
+        added_after = []
+
+        def add_chunks(vectorstore, embeddings, batch, *args):
+            added_after.append(len(produced))
+            return real_add_chunks(vectorstore, embeddings, batch, *args)
+
+        real_add_chunks = run._add_chunks
+        with patch('run.iter_pdf_chunks', chunks), patch('run._add_chunks', add_chunks), \
+                patch('run.EMBED_BATCH_SIZE', 2):
+            vectorstore, stats = run.update_index([str(pdf_path)], None, DeterministicFakeEmbedding(size=16))
+        # Each batch is embedded before the next chunks are read
+        assert added_after == [2, 4, 6]
+        assert stats['added'] == 6 and vectorstore.index.ntotal == 6
+        assert len(run.IndexManifest.load(run.MANIFEST_PATH).chunk_ids(os.path.normpath(str(pdf_path)))) == 6
+
+    def test_ingest_directory_merges_duplicate_chunks(self, index_paths):
+        import json
+        import shutil
+        corpus = index_paths / 'corpus'
+        corpus.mkdir()
+        boilerplate = 'Property of the National Archives.'
+        self._write_pdf(corpus / 'a.pdf', ['Rizal was born in 1861.', boilerplate, boilerplate])
+        self._write_pdf(corpus / 'b.pdf', [boilerplate, 'EDSA happened in 1986.', boilerplate])
+
+        def stored():
+            store = run.ChunkStore(run.CHUNKS_PATH)
+            return {text: {**json.loads(metadata), 'duplicates': store.duplicates(i)}
+                    for i, (text, metadata) in enumerate(zip(store.texts, store.metadatas))}
+
+        stats = run.ingest_directory(str(corpus))
+        # Off by default: every copy is indexed
+        assert stats['added'] == 6 and stats['duplicates'] == 0 and stats['total_chunks'] == 6
+        shutil.rmtree(run.INDEX_PATH)
+        os.remove(run.MANIFEST_PATH)
+
+        with patch('run.INDEX_DEDUP_SIMILARITY', 0.97):
+            stats = run.ingest_directory(str(corpus))
+        assert stats['added'] == 3 and stats['duplicates'] == 3 and stats['total_chunks'] == 3
+        merged = stored()[boilerplate]
+        assert (merged['source'], merged['page']) == (str(corpus / 'a.pdf'), 2)
+        assert [(d['source'], d['page']) for d in merged['duplicates']] == [
+            (str(corpus / 'a.pdf'), 3), (str(corpus / 'b.pdf'), 1), (str(corpus / 'b.pdf'), 3)]
+        # Retrieved chunks cite every page their text was merged from
+        vectorstore = run.load_mapped_index(run.load_embeddings())
+        sources = run.chunk_sources([vectorstore], [boilerplate, 'EDSA happened in 1986.', 'Not indexed.'])
+        assert [(page['source'], page['page']) for page in sources[0]] == [
+            (str(corpus / 'a.pdf'), 2), (str(corpus / 'a.pdf'), 3), (str(corpus / 'b.pdf'), 1),
+            (str(corpus / 'b.pdf'), 3)]
+        assert sources[1] == [{'source': str(corpus / 'b.pdf'), 'page': 2}] and sources[2] == []
+
+        # The indexed copy goes with a.pdf; a remaining duplicate takes its place
+        os.remove(corpus / 'a.pdf')
+        stats = run.ingest_directory(str(corpus))
+        assert stats['deleted'] == 3 and stats['total_chunks'] == 2
+        merged = stored()[boilerplate]
+        assert (merged['source'], merged['page']) == (str(corpus / 'b.pdf'), 1)
+        assert [(d['source'], d['page']) for d in merged['duplicates']] == [(str(corpus / 'b.pdf'), 3)]
+
+        # Dropping a duplicate that was never indexed only updates the list
+        self._write_pdf(corpus / 'b.pdf', [boilerplate, 'EDSA happened in 1986.'])
+        stats = run.ingest_directory(str(corpus))
+        assert stats['deleted'] == 1 and stats['total_chunks'] == 2
+        assert stored()[boilerplate]['duplicates'] == []
+
+    def test_rebuild_reuses_cached_embeddings(self, index_paths):
+        import shutil
+        corpus = index_paths / 'corpus'
+        corpus.mkdir()
+        self._write_pdf(corpus / 'a.pdf', ['Short page.', 'A much longer page that will be split once chunks get small.'])
+        run.ingest_directory(str(corpus))
+
+        # Full rebuild from scratch: every chunk is served from the embedding cache
+        shutil.rmtree(run.INDEX_PATH)
+        os.remove(run.MANIFEST_PATH)
+        embeddings = run.load_embeddings()
+        with patch('run.load_embeddings', return_value=embeddings):
+            stats = run.ingest_directory(str(corpus))
+        assert stats['added'] == 2
+        assert embeddings.document_hits == 2 and embeddings.document_misses == 0
+
+        # Smaller chunks: only the page whose chunks changed pays for the model
+        with patch('run.CHUNK_SIZE', 40), patch('run.CHUNK_OVERLAP', 0):
+            embeddings = run.load_embeddings()
+            with patch('run.load_embeddings', return_value=embeddings):
+                stats = run.ingest_directory(str(corpus))
+        assert stats['deleted'] == 1
+        assert embeddings.document_misses == stats['added'] > 1
+
+    def test_ingest_directory_builds_ann_index(self, index_paths):
+        corpus = index_paths / 'corpus'
+        corpus.mkdir()
+        self._write_pdf(corpus / 'a.pdf', [f'Event number {i} happened.' for i in range(60)])
+        with patch('faiss_indexes.MIN_ANN_VECTORS', 10):
+            stats = run.ingest_directory(str(corpus), index_type='hnsw')
+            assert stats['index_type'] == 'hnsw' and stats['total_chunks'] == 60
+
+            # Edits go through a flat copy and come back as the same ANN type
+            self._write_pdf(corpus / 'a.pdf', [f'Event number {i} happened.' for i in range(50)] + ['A new event.'])
+            stats = run.ingest_directory(str(corpus), index_type='ivf')
+            assert stats['added'] == 1 and stats['deleted'] == 10
+            assert stats['index_type'] == 'ivf' and stats['total_chunks'] == 51
+            vectorstore, _ = run.build_or_load_index(index_type='ivf', nprobe=1000)
+        assert vectorstore.index.nprobe == vectorstore.index.nlist
+        assert run.retrieve_chunks(vectorstore, 'A new event.', 1)[0][0] == 'A new event.'
+
+    def test_binary_index_serves_exact_and_filtered_queries(self, index_paths):
+        corpus = index_paths / 'corpus'
+        corpus.mkdir()
+        self._write_pdf(corpus / 'a.pdf', [f'Event number {i} happened.' for i in range(60)])
+        with patch('faiss_indexes.MIN_ANN_VECTORS', 10):
+            stats = run.ingest_directory(str(corpus), index_type='binary')
+            assert stats['index_type'] == 'binary' and stats['total_chunks'] == 60
+            assert (index_paths / 'faiss_index' / run.BINARY_VECTORS).exists()
+
+            # Edits reuse the saved float16 vectors rather than embedding every chunk again
+            self._write_pdf(corpus / 'a.pdf', [f'Event number {i} happened.' for i in range(60)] + ['A new event.'])
+            with patch('run.index_chunks', side_effect=AssertionError('re-embedded the index')):
+                stats = run.ingest_directory(str(corpus), index_type='binary')
+            assert stats['added'] == 1 and stats['index_type'] == 'binary'
+            vectorstore, _ = run.build_or_load_index(index_type='binary')
+        assert run.index_type_of(vectorstore.index) == 'binary'
+        assert run.retrieve_chunks(vectorstore, 'A new event.', 1)[0][0] == 'A new event.'
+        assert run.retrieve_chunks(vectorstore, 'Event number 7 happened.', 1)[0][0] == 'Event number 7 happened.'
+        rows = run.retrieve_chunks(vectorstore, 'Event number 7 happened.', 3, where={'page': 12})
+        assert [chunk for chunk, _ in rows] == ['Event number 11 happened.']
+
+    def test_cli_repeat_question_skips_model_and_llm(self, index_paths):
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        pdf_path = index_paths / 'history.pdf'
+        self._write_pdf(pdf_path, ['EDSA happened in 1986.', 'Rizal was born in 1861.'])
+        with patch('run.PDF_PATH', str(pdf_path)):
+            run.build_or_load_index()
+        for expected_calls in (1, 0):
+            with patch('run._create_embedding_model', return_value=DeterministicFakeEmbedding(size=16)) as create_model, \
+                    patch('run.ask_llm', return_value='In 1986.') as ask_llm, \
+                    patch('builtins.input', return_value='When was EDSA?'), patch('builtins.print') as mock_print:
+                run.main()
+            assert create_model.call_count == ask_llm.call_count == expected_calls
+            mock_print.assert_any_call('"In 1986."')
+
+    def test_cli_routes_by_intent(self, index_paths):
+        pdf_path = index_paths / 'history.pdf'
+        self._write_pdf(pdf_path, ['EDSA happened in 1986.', 'Rizal was born in 1861.'])
+        with patch('run.PDF_PATH', str(pdf_path)):
+            run.build_or_load_index()
+        for intent, expected in (('greeting', run.CANNED_RESPONSES['greeting']), ('date_lookup', 'EDSA happened in 1986.')):
+            with patch.object(run.IntentClassifier, 'classify', return_value=(intent, 0.9)), \
+                    patch('run.ask_llm') as ask_llm, patch('builtins.input', return_value='When did EDSA happen?'), \
+                    patch('builtins.print') as mock_print:
+                run.main()
+            ask_llm.assert_not_called()
+            mock_print.assert_any_call(f'"{expected}"')
+        with patch('run.INTENT_ROUTING', False), patch.object(run.IntentClassifier, 'classify') as classify, \
+                patch('run.ask_llm', return_value='In 1986.') as ask_llm, \
+                patch('builtins.input', return_value='When did EDSA happen?'), patch('builtins.print'):
+            run.main()
+        classify.assert_not_called()
+        ask_llm.assert_called_once()
+
+    def test_embedding_model_id_per_backend(self):
+        assert run.embedding_model_id() == run.EMBEDDING_MODEL
+        with patch('run.EMBEDDING_BACKEND', 'onnx'), patch('run.ONNX_QUANTIZED', True):
+            assert run.embedding_model_id() == run.EMBEDDING_MODEL + '@onnx-int8'
+        with patch('run.EMBEDDING_BACKEND', 'tensorflow'), pytest.raises(ValueError):
+            run.embedding_model_id()
+
+    def test_import_skips_heavy_dependencies(self):
+        import subprocess
+        heavy = ('fitz', 'langchain_openai', 'langchain_huggingface', 'langchain_text_splitters',
+                 'sentence_transformers', 'torch')
+        code = f"import sys, run; print([m for m in {heavy!r} if m in sys.modules])"
+        result = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(run.__file__),
+                                capture_output=True, text=True, check=True)
+        assert result.stdout.strip().splitlines()[-1] == '[]'
+
+    @patch('run.ingest_directory', return_value={'added': 1})
+    @patch('run.main')
+    def test_cli_dispatch(self, mock_main, mock_ingest):
+        with patch('builtins.print') as mock_print:
+            run.cli(['--index-type', 'ivf', 'ingest', 'data'])
+        mock_ingest.assert_called_once_with('data', 'ivf', None)
+        mock_print.assert_any_call('added=1')
+        run.cli(['--nprobe', '4'])
+        mock_main.assert_called_once_with(None, 4, None)
+
+    @patch('langchain_community.vectorstores.FAISS')
+    @patch('run._create_embedding_model')
     def test_build_or_load_index_builds(self, mock_hfemb, mock_faiss):
         # Simulate no index files and missing PDF
         with patch('os.path.exists', return_value=False):
@@ -31,20 +322,124 @@ class TestRunPy:
                     with pytest.raises(SystemExit):
                         run.build_or_load_index()
 
-    @patch('run.FAISS')
-    @patch('run.HuggingFaceEmbeddings')
-    def test_build_or_load_index_loads(self, mock_hfemb, mock_faiss):
-        # Simulate index files exist
-        with patch('os.path.exists', side_effect=[True, True]):
-            mock_vectorstore = MagicMock()
-            mock_faiss.load_local.return_value = mock_vectorstore
-            mock_hfemb.return_value = MagicMock()
-            fake_chunks = ['chunk1', 'chunk2']
-            with patch('builtins.open', mock_open(read_data=pickle.dumps(fake_chunks))):
-                with patch('pickle.load', return_value=fake_chunks):
-                    vectorstore, chunks = run.build_or_load_index()
-                    assert vectorstore == mock_vectorstore
-                    assert chunks == fake_chunks
+    def test_build_or_load_index_loads(self, index_paths):
+        corpus = index_paths / 'corpus'
+        corpus.mkdir()
+        self._write_pdf(corpus / 'a.pdf', ['Rizal was born in 1861.', 'EDSA happened in 1986.'])
+        run.ingest_directory(str(corpus))
+        # An index saved before the chunk store existed is migrated once
+        import shutil
+        shutil.rmtree(run.CHUNKS_PATH)
+        with patch.object(FAISS, 'load_local', autospec=True, side_effect=FAISS.load_local) as load_local:
+            run.build_or_load_index()
+            assert load_local.call_count == 1
+            vectorstore, chunks = run.build_or_load_index()
+            assert load_local.call_count == 1
+        assert list(chunks) == ['Rizal was born in 1861.', 'EDSA happened in 1986.']
+        doc, _ = vectorstore.similarity_search_with_score('EDSA happened in 1986.', k=1)[0]
+        assert doc.metadata == {'source': str(corpus / 'a.pdf'), 'page': 2, 'collection': 'default'}
+        assert run.retrieve_chunks_batch(vectorstore, ['Rizal was born in 1861.'], 1)[0][0][0] == 'Rizal was born in 1861.'
+
+    def test_hybrid_retrieval_finds_exact_terms(self, index_paths):
+        corpus = index_paths / 'corpus'
+        corpus.mkdir()
+        pages = [f'Filler page {i} about the islands.' for i in range(8)] + ['Independence was declared in 1898.']
+        self._write_pdf(corpus / 'a.pdf', pages)
+        run.ingest_directory(str(corpus))
+        vectorstore, _ = run.build_or_load_index()
+        assert len(vectorstore.lexical_index) == 9
+        # Fake embeddings are random, so only the BM25 side can rank the 1898 chunk first
+        assert run.retrieve_chunks(vectorstore, 'What happened in 1898?', top_n=1)[0][0] == pages[-1]
+        batch = run.retrieve_chunks_batch(vectorstore, ['What happened in 1898?', 'Filler page 3'], top_n=2)
+        assert batch[0][0][0] == pages[-1]
+        assert len(batch[1]) == 2
+        with patch('run.HYBRID_RETRIEVAL', False):
+            assert len(run.retrieve_chunks(vectorstore, 'What happened in 1898?', top_n=1)) == 1
+
+    def test_collections_are_sharded_and_filtered(self, index_paths):
+        laws, history = index_paths / 'laws', index_paths / 'history'
+        laws.mkdir()
+        history.mkdir()
+        self._write_pdf(laws / 'a.pdf', ['The 1987 Constitution was ratified in 1987.', 'Republic Act 9165 was passed in 2002.'])
+        self._write_pdf(history / 'b.pdf', ['EDSA happened in 1986.'])
+        self._write_pdf(history / 'c.pdf', ['Rizal was born in 1861.'])
+        run.cli(['ingest', str(history)])
+        with patch('builtins.print'):
+            run.cli(['ingest', str(laws), '--collection', 'laws'])
+        assert os.path.exists(os.path.join(run.COLLECTIONS_PATH, 'laws', 'faiss_index', 'index.faiss'))
+
+        vectorstore, _ = run.build_or_load_index()
+        shards = run.load_shards(vectorstore)
+        assert sorted(shards) == ['default', 'laws'] and shards['laws'].index.ntotal == 2
+        doc = shards['laws'].docstore.search(0)
+        assert doc.metadata == {'source': str(laws / 'a.pdf'), 'page': 1, 'collection': 'laws'}
+
+        question = 'What happened in 1987?'
+        found = run.retrieve_chunks_sharded(shards, [question], top_n=5)[0]
+        # Fake embeddings are random, so the BM25 match only ties the default shard's best vector hit
+        assert len(found) == 4 and 'The 1987 Constitution was ratified in 1987.' in [chunk for chunk, _ in found[:2]]
+        only_history = run.retrieve_chunks_sharded(shards, [question], top_n=5, where={'collection': 'default'})[0]
+        assert sorted(chunk for chunk, _ in only_history) == ['EDSA happened in 1986.', 'Rizal was born in 1861.']
+        # Filters apply inside the shard before scoring, so top_n=1 still finds the matching chunk
+        by_source = run.retrieve_chunks_sharded(shards, [question], top_n=1, where={'source': str(history / 'c.pdf')})[0]
+        assert by_source == [('Rizal was born in 1861.', by_source[0][1])]
+        assert run.retrieve_chunks(vectorstore, question, 2, where={'page': 99}) == []
+        with pytest.raises(ValueError):
+            run.retrieve_chunks_sharded(shards, [question], where={'collection': 'unknown'})
+        with pytest.raises(ValueError):
+            run.collection_paths('../escape')
+
+    def test_warm_faq_precomputes_answers(self, index_paths):
+        corpus = index_paths / 'corpus'
+        corpus.mkdir()
+        self._write_pdf(corpus / 'a.pdf', ['Jose Rizal was executed in 1896.', 'Jose Rizal wrote Noli Me Tangere.'])
+        run.ingest_directory(str(corpus))
+        faq_path = str(index_paths / 'faq')
+        asked = []
+
+        def fake_ask_llm(context, question):
+            asked.append(question)
+            return 'Not enough information in the context.' if 'Noli' in question else f'Answer to {question}'
+
+        with patch.object(run.IntentClassifier, 'classify', return_value=('complex', 0.9)), \
+                patch('run.ask_llm', side_effect=fake_ask_llm), patch('builtins.print') as mock_print:
+            run.cli(['warm-faq', '--output', faq_path, '--concurrency', '2'])
+        mock_print.assert_any_call('questions=3, answered=2, skipped=1')
+        assert sorted(asked) == ['What happened in 1896?', 'What is the significance of Jose Rizal?',
+                                 'What is the significance of Noli Me Tangere?']
+
+        faq_index = run.load_faq_index(faq_path)
+        entry = faq_index.get('what happened in 1896')
+        assert entry.answer == 'Answer to What happened in 1896?' and entry.intent == 'complex'
+        assert 'Jose Rizal was executed in 1896.' in entry.chunks
+        assert faq_index.get('What is the significance of Noli Me Tangere?') is None
+        with patch('run.FAQ_ANSWERS', False):
+            assert run.load_faq_index(faq_path) is None
+        # Answers built from an older version of the corpus are not served
+        self._write_pdf(corpus / 'b.pdf', ['EDSA happened in 1986.'])
+        run.ingest_directory(str(corpus))
+        with patch('builtins.print'):
+            assert run.load_faq_index(faq_path) is None
+
+    def test_reranking_trims_retrieved_chunks(self, index_paths):
+        from tests.test_reranker import OverlapModel
+        corpus = index_paths / 'corpus'
+        corpus.mkdir()
+        pages = [f'Filler page {i} about the islands.' for i in range(8)] + ['Independence was declared in 1898.']
+        self._write_pdf(corpus / 'a.pdf', pages)
+        run.ingest_directory(str(corpus))
+        vectorstore, _ = run.build_or_load_index()
+        model = OverlapModel()
+        vectorstore.reranker = run.CrossEncoderReranker(model=model, skip_gap=1.1)
+        with patch('run.RERANKING', True), patch('run.RERANK_TOP_N', 2):
+            found = run.retrieve_chunks(vectorstore, 'When was independence declared?', top_n=5)
+            shards = {'default': vectorstore, 'copy': vectorstore}
+            merged = run.retrieve_chunks_sharded(shards, ['When was independence declared?'], top_n=5)[0]
+        assert len(found) == 2 and found[0][0] == pages[-1]
+        # More first-stage candidates than are passed on were re-scored, in one batch
+        assert 4 <= len(model.calls[0]) <= 9
+        assert merged[0][0] == pages[-1]
+        assert len(run.retrieve_chunks(vectorstore, 'When was independence declared?', top_n=5)) == 5
 
     def test_build_context(self):
         chunks = ["A", "B"]
@@ -52,7 +447,24 @@ class TestRunPy:
         assert '- "A"' in context
         assert '- "B"' in context
 
-    @patch('run.ChatOpenAI')
+    def test_build_context_dedups_with_stored_vectors(self, tmp_path):
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        from embedding_cache import embedding_key
+        from context_builder import count_tokens
+        embeddings = run.CachedEmbeddings(DeterministicFakeEmbedding(size=4), 'mini',
+                                          run.EmbeddingStore(str(tmp_path / 'cache.sqlite')))
+        chunks = ['Rizal was executed in 1896.', 'EDSA happened in 1986.', 'In 1896 Rizal was executed.']
+        embeddings.store.put_many({embedding_key('mini', chunk): vector for chunk, vector
+                                   in zip(chunks, ([1.0, 0, 0, 0], [0, 1.0, 0, 0], [1.0, 0.01, 0, 0]))})
+        vectorstore = MagicMock(embedding_function=embeddings)
+        assert run.build_context(chunks, vectorstore) == '- "Rizal was executed in 1896."\n- "EDSA happened in 1986."'
+        # Without stored vectors only exact duplicates go, and the budget still applies
+        assert run.build_context(chunks + chunks[:1]).count('\n') == 2
+        first_line = '- "Rizal was executed in 1896."'
+        assert run.build_context(chunks, token_budget=count_tokens(first_line) + 5) == first_line
+
+    @patch('run._llm', None)
+    @patch('langchain_openai.ChatOpenAI')
     def test_ask_llm(self, mock_chat_openai):
         mock_llm = MagicMock()
         mock_llm.invoke.return_value = MagicMock(content="Short answer.")
@@ -62,6 +474,24 @@ class TestRunPy:
         result = run.ask_llm(context, question)
         assert result == "Short answer."
 
+    @patch('run._llm', None)
+    @patch('langchain_openai.ChatOpenAI')
+    def test_get_llm_reuses_client(self, mock_chat_openai):
+        first = run.get_llm()
+        second = run.get_llm()
+        assert first is second
+        mock_chat_openai.assert_called_once()
+        kwargs = mock_chat_openai.call_args.kwargs
+        assert kwargs['max_retries'] == run.LLM_MAX_RETRIES
+        assert kwargs['timeout'] == run.LLM_TIMEOUT
+
+    @patch('langchain_openai.ChatOpenAI')
+    def test_ask_llm_with_explicit_client(self, mock_chat_openai):
+        mock_llm = MagicMock()
+        mock_llm.invoke.return_value = MagicMock(content="Pooled answer.")
+        assert run.ask_llm("- 'chunk'", "What?", llm=mock_llm) == "Pooled answer."
+        mock_chat_openai.assert_not_called()
+
     def test_retrieve_chunks(self):
         mock_vectorstore = MagicMock()
         mock_vectorstore.similarity_search_with_score.return_value = [
@@ -71,6 +501,66 @@ class TestRunPy:
         result = run.retrieve_chunks(mock_vectorstore, 'query', top_n=2)
         assert result == [('chunk1', 0.1), ('chunk2', 0.2)]
 
+    def test_ask_llm_async(self):
+        mock_llm = MagicMock()
+        mock_llm.ainvoke = AsyncMock(return_value=MagicMock(content="Async answer."))
+        result = asyncio.run(run.ask_llm_async("- 'chunk'", "What?", llm=mock_llm))
+        assert result == "Async answer."
+        assert "Question: What?" in mock_llm.ainvoke.call_args.args[0]
+        mock_llm.invoke.assert_not_called()
+
+    def test_stream_llm_async(self):
+        async def fake_astream(prompt):
+            for token in ("Feb", "", "ruary 1986."):
+                yield MagicMock(content=token)
+        mock_llm = MagicMock()
+        mock_llm.astream = fake_astream
+
+        async def collect():
+            return [token async for token in run.stream_llm_async("- 'chunk'", "What?", llm=mock_llm)]
+        assert asyncio.run(collect()) == ["Feb", "ruary 1986."]
+
+    def test_llm_token_counters(self):
+        prompt_tokens = run.LLM_TOKENS.value(kind="prompt")
+        completion_tokens = run.LLM_TOKENS.value(kind="completion")
+        mock_llm = MagicMock()
+        mock_llm.invoke.return_value = MagicMock(content="Answer.", usage_metadata={"input_tokens": 120, "output_tokens": 9})
+        run.ask_llm("- 'chunk'", "What?", llm=mock_llm)
+        assert run.LLM_TOKENS.value(kind="prompt") == prompt_tokens + 120
+        assert run.LLM_TOKENS.value(kind="completion") == completion_tokens + 9
+        # Without provider usage the tokens are estimated
+        mock_llm.invoke.return_value = MagicMock(content="Answer.", usage_metadata=None)
+        run.ask_llm("- 'chunk'", "What?", llm=mock_llm)
+        assert run.LLM_TOKENS.value(kind="prompt") > prompt_tokens + 120
+        assert run.LLM_TOKENS.value(kind="completion") > completion_tokens + 9
+
+    def test_retrieve_chunks_reuses_query_embedding(self):
+        mock_vectorstore = MagicMock()
+        mock_vectorstore.similarity_search_with_score_by_vector.return_value = [
+            (MagicMock(page_content='chunk1'), 0.1)
+        ]
+        result = run.retrieve_chunks(mock_vectorstore, 'query', top_n=1, query_embedding=[0.1, 0.2])
+        assert result == [('chunk1', 0.1)]
+        mock_vectorstore.similarity_search_with_score_by_vector.assert_called_once_with([0.1, 0.2], k=1)
+        mock_vectorstore.similarity_search_with_score.assert_not_called()
+
+    def test_retrieve_chunks_batch_matches_single_queries(self):
+        from langchain_community.vectorstores import FAISS
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        vectorstore = FAISS.from_texts(['chunk1', 'chunk2', 'chunk3', 'chunk4'], DeterministicFakeEmbedding(size=16))
+        queries = ['chunk2', 'chunk4', 'other']
+        batch = run.retrieve_chunks_batch(vectorstore, queries, top_n=2)
+        assert len(batch) == 3
+        for query, row in zip(queries, batch):
+            single = run.retrieve_chunks(vectorstore, query, top_n=2)
+            assert [chunk for chunk, _ in row] == [chunk for chunk, _ in single]
+        assert batch[0][0][0] == 'chunk2'
+        assert run.retrieve_chunks_batch(vectorstore, [], top_n=2) == []
+
+    def test_chunk_id_is_stable(self):
+        assert run.chunk_id('chunk1') == run.chunk_id('chunk1')
+        assert run.chunk_id('chunk1') != run.chunk_id('chunk2')
+
     @patch('builtins.input', return_value='When did the EDSA People Power Revolution happen?')
     @patch('run.build_or_load_index')
     @patch('run.retrieve_chunks')
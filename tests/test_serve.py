@@ -0,0 +1,79 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
+import signal
+import socket
+import subprocess
+import textwrap
+import time
+from unittest.mock import patch
+import httpx
+import pytest
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+import app_api
+import run
+
+ROOT = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+CHUNKS = ['José Rizal was executed in 1896.', 'The EDSA Revolution happened in 1986.', 'Mactan, 1521.']
+
+
+@pytest.fixture
+def saved_index(tmp_path):
+    paths = {'INDEX_PATH': 'faiss_index', 'CHUNKS_PATH': 'chunks', 'BM25_PATH': 'bm25',
+             'MANIFEST_PATH': 'index_manifest.json', 'COLLECTIONS_PATH': 'collections',
+             'EMBEDDING_CACHE_PATH': 'embeddings.sqlite'}
+    patches = [patch.object(run, name, str(tmp_path / path)) for name, path in paths.items()]
+    patches.append(patch.object(run, '_create_embedding_model', return_value=DeterministicFakeEmbedding(size=16)))
+    for p in patches:
+        p.start()
+    run.save_index(FAISS.from_texts(CHUNKS, DeterministicFakeEmbedding(size=16)))
+    yield tmp_path
+    for p in patches:
+        p.stop()
+
+
+def test_preload_loads_index_and_model_weights(saved_index, monkeypatch):
+    monkeypatch.setattr(app_api, 'vectorstore', None)
+    monkeypatch.setattr(app_api, 'shards', {})
+    app_api.preload()
+    embeddings = app_api.vectorstore.embedding_function
+    assert app_api.vectorstore.index.ntotal == len(CHUNKS)
+    assert embeddings.underlying.loaded
+    assert embeddings.store._conn is None  # not inherited by forked workers
+    assert set(app_api.shards) == {'default'}
+
+
+def test_serve_forks_workers_that_share_the_socket(saved_index):
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    script = textwrap.dedent(f'''
+        import run, serve
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        root = {str(saved_index)!r}
+        run.INDEX_PATH, run.CHUNKS_PATH, run.BM25_PATH = root + '/faiss_index', root + '/chunks', root + '/bm25'
+        run.COLLECTIONS_PATH, run.EMBEDDING_CACHE_PATH = root + '/collections', root + '/embeddings.sqlite'
+        run._create_embedding_model = lambda: DeterministicFakeEmbedding(size=16)
+        serve.serve(2, '127.0.0.1', {port}, preload=True, log_level='warning')
+    ''')
+    proc = subprocess.Popen([sys.executable, '-c', script], cwd=ROOT, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                if httpx.get(f'http://127.0.0.1:{port}/collections').json() == {'collections': {'default': 3}}:
+                    break
+            except httpx.TransportError:
+                pass
+            assert time.monotonic() < deadline and proc.poll() is None
+            time.sleep(0.1)
+        with open(f'/proc/{proc.pid}/task/{proc.pid}/children') as f:
+            workers = [int(pid) for pid in f.read().split()]
+        assert len(workers) == 2
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        assert proc.wait(timeout=30) == 0
+    # The parent reaps its workers before it exits
+    assert not any(os.path.exists(f'/proc/{pid}') for pid in workers)